@@ -0,0 +1,43 @@
+from utilities.algorithm.initialise_run import check_python_version
+
+check_python_version()
+
+import sys
+
+from algorithm.batch import read_targets, run_batch, run_parallel_batch
+from algorithm.parameters import params, set_params
+
+
+if __name__ == '__main__':
+    set_params(sys.argv)
+
+    # Results are streamed as JSON records, so suppress all other output.
+    params['SILENT'] = True
+
+    if params['TARGETS_FILE']:
+        targets_file = open(params['TARGETS_FILE'], 'r')
+    else:
+        targets_file = sys.stdin
+
+    if params['RESULTS_FILE']:
+        results_file = open(params['RESULTS_FILE'], 'w')
+    else:
+        results_file = sys.stdout
+
+    targets = read_targets(targets_file, params['TARGETS_FORMAT'])
+
+    # Parse all targets against the same grammar.
+    if params['PROCESSES'] > 1:
+        run_parallel_batch(targets, results_file, params['PARSER'],
+                           params['PROCESSES'], params['CHUNK_SIZE'],
+                           params['TIMEOUT'])
+
+    else:
+        run_batch(targets, results_file, params['PARSER'],
+                  params['TIMEOUT'])
+
+    if targets_file is not sys.stdin:
+        targets_file.close()
+
+    if results_file is not sys.stdout:
+        results_file.close()
@@ -0,0 +1,72 @@
+from utilities.algorithm.initialise_run import check_python_version
+
+check_python_version()
+
+import json
+from os import listdir, makedirs, path
+import platform
+import random
+import sys
+
+from algorithm.batch import PARSERS
+from algorithm.parameters import params, set_params, load_grammar
+from benchmark.runner import run_benchmark, format_table
+from benchmark.targets import generate_targets
+
+# File to which benchmark results are written if --results_file isn't set.
+DEFAULT_RESULTS_FILE = path.join("..", "results", "benchmark.json")
+
+
+if __name__ == '__main__':
+    set_params(sys.argv)
+
+    grammars = params['BENCHMARK_GRAMMARS'] or sorted(
+        [name for name in listdir(path.join("..", "grammars")) if
+         name.endswith(".bnf")])
+    parsers = params['BENCHMARK_PARSERS'] or sorted(PARSERS)
+
+    # Use the same target strings on every run unless told otherwise.
+    seed = params['RANDOM_SEED'] if params['RANDOM_SEED'] is not None else 0
+
+    report = {"seed": seed, "lengths": params['BENCHMARK_LENGTHS'],
+              "targets_per_length": params['BENCHMARK_TARGETS'],
+              "timeout": params['TIMEOUT'],
+              "python": platform.python_version(),
+              "platform": platform.platform(), "targets": {}, "results": []}
+
+    # Suppress the output of the parsers.
+    silent, params['SILENT'] = params['SILENT'], True
+
+    for grammar in grammars:
+        params['GRAMMAR_FILE'] = grammar
+        load_grammar()
+
+        # Seed each grammar separately, so that its target strings don't
+        # depend on which other grammars are used.
+        targets = generate_targets(params['BENCHMARK_LENGTHS'],
+                                   params['BENCHMARK_TARGETS'],
+                                   random.Random(seed))
+
+        report["targets"][grammar] = targets
+        report["results"].extend(run_benchmark(targets, parsers,
+                                               params['TIMEOUT']))
+
+    # Results are kept out of the source tree by default.
+    results_file = params['RESULTS_FILE'] or DEFAULT_RESULTS_FILE
+
+    if path.dirname(results_file):
+        makedirs(path.dirname(results_file), exist_ok=True)
+
+    with open(results_file, 'w') as out:
+        json.dump(report, out, indent=2)
+
+    if not silent:
+        # Show how each parser scales with the length of the target string.
+        print()
+        print(format_table(report["results"], "time", unit="s"))
+        print()
+        print(format_table(report["results"], "memory", 2 ** 20, "MB"))
+        print()
+        print(format_table(report["results"], "snippets"))
+        print()
+        print(format_table(report["results"], "passes"))
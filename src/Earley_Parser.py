@@ -0,0 +1,168 @@
+from utilities.algorithm.initialise_run import check_python_version
+
+check_python_version()
+
+from datetime import datetime, timedelta
+import random
+import sys
+
+from algorithm.parameters import params, set_params
+from algorithm.session import ParseSession
+from operators.earley_parse import earley_parse
+from operators.forest_parse import forest_parse
+from representation.individual import Individual
+from representation.tree import paused_gc
+from utilities.representation.check_methods import check_ind
+from utilities.stats.parse_stats import timed, print_stats
+
+
+def assemble_solution(target, session=None):
+    """
+    Given a target string, parse the target string using an Earley chart
+    parser and build a GE individual which maps to the target string. If
+    MIN_COST is set, the derivation with the lowest cost is used rather
+    than the first derivation found.
+
+    :param target: A target string.
+    :param session: An algorithm.session.ParseSession of the target string.
+    A new session with the grammar and options in params is used if not
+    set.
+    :return: A complete solution in the form of an individual, or None if
+    the target string couldn't be parsed.
+    """
+
+    if session is None:
+        session = ParseSession(params['BNF_GRAMMAR'], target)
+
+    if not session.config['SILENT']:
+        print("Target:", target)
+
+    if session.config['MIN_COST']:
+        session.solution, session.min_cost = min_cost_solution(
+            target, session.config['MIN_COST'], session)
+
+    else:
+        with paused_gc():
+            # Parse the target string.
+            session.solution = earley_parse(session)
+
+    return session.solution
+
+
+def get_forest(session):
+    """
+    Build a shared packed parse forest of all derivations of the target
+    string of a parse session, or return the forest already built for the
+    session.
+
+    :param session: An algorithm.session.ParseSession of the target string.
+    :return: A representation.forest.Forest instance, or None if the target
+    string couldn't be parsed.
+    """
+
+    if session.forest is None:
+        with paused_gc(), timed(session.stats, "forest"):
+            # Parse the target string into a forest of all derivations.
+            session.forest = forest_parse(session)
+
+    return session.forest
+
+
+def min_cost_solution(target, cost="codons", session=None):
+    """
+    Given a target string, build a GE individual from the derivation of the
+    target string with the lowest cost in the shared packed parse forest of
+    all derivations (see get_forest).
+
+    :param target: A target string.
+    :param cost: The name of a cost function in representation.forest.COSTS,
+    e.g. "codons" or "depth", or a function which gives the cost of a node
+    from a list of the costs of its NT children.
+    :param session: An algorithm.session.ParseSession of the target string.
+    A new session with the grammar and options in params is used if not
+    set.
+    :return: An individual and its cost, or None and None if the target
+    string couldn't be parsed.
+    """
+
+    if session is None:
+        session = ParseSession(params['BNF_GRAMMAR'], target)
+
+    forest = get_forest(session)
+
+    if not forest:
+        return None, None
+
+    with paused_gc():
+        with timed(session.stats, "solution"):
+            ind_tree, min_cost = forest.min_cost_tree(cost,
+                                                      session.rng)
+
+        return Individual(None, ind_tree, session.grammar), min_cost
+
+
+def sample_solutions(target, samples, rng=random, session=None):
+    """
+    Given a target string, draw GE individuals which map to the target
+    string uniformly at random from all derivations of the target string in
+    the shared packed parse forest (see get_forest).
+
+    :param target: A target string.
+    :param samples: The number of individuals to draw.
+    :param rng: A source of random numbers, e.g. an instance of
+    random.Random.
+    :param session: An algorithm.session.ParseSession of the target string.
+    A new session with the grammar and options in params is used if not
+    set.
+    :return: The number of derivations of the target string and a list of
+    individuals, or None and an empty list if the target string couldn't be
+    parsed.
+    """
+
+    if session is None:
+        session = ParseSession(params['BNF_GRAMMAR'], target)
+
+    forest = get_forest(session)
+
+    if not forest:
+        return None, []
+
+    with paused_gc():
+        return forest.count_derivations(), [
+            Individual(None, forest.sample_tree(rng), session.grammar) for _
+            in range(samples)]
+
+
+if __name__ == '__main__':
+    t1 = datetime.now()
+    set_params(sys.argv)
+    session = ParseSession(params['BNF_GRAMMAR'], params['TARGET'])
+    solution = assemble_solution(params['TARGET'], session)
+    if not solution:
+        print("Error: Target string couldn't be parsed using given grammar.")
+        quit()
+    with timed(session.stats, "check"):
+        check_ind(solution, params['TARGET'], session.grammar)
+    print("\nGenome:")
+    print(solution.genome)
+    if params['STATS']:
+        print_stats(session.stats)
+    if params['MIN_COST']:
+        print("\nMinimum cost (" + params['MIN_COST'] + "):",
+              session.min_cost)
+    if params['SAMPLES']:
+        # The forest built for MIN_COST is used again.
+        derivations, samples = sample_solutions(
+            params['TARGET'], params['SAMPLES'],
+            random.Random(params['RANDOM_SEED']), session)
+        print("\nDerivations:", derivations)
+        print("\nSampled genomes:")
+        for sample in samples:
+            check_ind(sample, params['TARGET'], session.grammar)
+            print(sample.genome)
+    t2 = datetime.now()
+    time_taken = t2 - t1
+    if not params['SILENT']:
+        print("\nGrammar load time:",
+              timedelta(seconds=params['BNF_GRAMMAR'].load_time))
+        print("\nTotal time taken:", time_taken)
@@ -2,92 +2,43 @@ from utilities.algorithm.initialise_run import check_python_version
 
 check_python_version()
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import sys
 
+from algorithm.batch import check_parser_options
 from algorithm.parameters import params, set_params
-from operators.subtree_parse import get_NT_from_str, get_num_from_str, \
-    generate_key_and_check, check_snippets_for_solution
-from representation.tree import Tree
-from utilities.representation.check_methods import generate_codon, \
-    check_ind
-from utilities.stats import trackers
+from algorithm.session import ParseSession
+from operators.subtree_parse import generate_key, get_NT_from_key, \
+    generate_key_and_check, check_snippets_for_solution, \
+    add_terminal_snippets, create_terminal_child, fits_reduction
+from representation.tree import paused_gc
+from utilities.representation.check_methods import check_ind
+from utilities.stats.parse_stats import timed, print_stats
 
 
-def parse_terminals(target):
+def parse_terminals(session):
     """
-    Given a target string, build up a list of terminals which match certain
+    Given a parse session, build up a list of terminals which match certain
     portions of the target string.
     
-    :return: A list of terminals in order of appearance in the target string.
+    :param session: An algorithm.session.ParseSession of the target string.
+    :return: Nothing.
     """
     
-    if not params['SILENT']:
-        print("\nTarget:", target)
-    terms = params['BNF_GRAMMAR'].terminals
-    rules = params['BNF_GRAMMAR'].rules
+    if not session.config['SILENT']:
+        print("\nTarget:", session.target)
 
-    trackers.snippets = {}
-    
-    for T in sorted(terms.keys()):
-        # Iterate over all Terminals.
-
-        # Find all occurances of this terminal in the target string.
-        occurrances = []
-        index = 0
-        while index < len(target):
-            index = target.find(T, index)
-            if index not in occurrances and index != -1:
-                occurrances.append(index)
-                index += len(T)
-            else:
-                break
-         
-        for idx in occurrances:
-            # Check each occurrence of this terminal in the target string.
-
-            for NT in terms[T]:
-                
-                if any([[T] == i for i in [[sym['symbol'] for sym in
-                                            choice['choice']] for choice in
-                                           rules[NT]['choices']]]):
-                    # Check if current T is the entire production choice of any
-                    # particular rule.
-
-                    # Generate a key for the snippets repository.
-                    key = " ".join([str([idx, idx+len(T)]), NT])
-                    
-                    # Get index of production choice.
-                    index = [[sym['symbol'] for sym in choice['choice']] for
-                             choice in rules[NT]['choices']].index([T])
-                    
-                    # Get production choice.
-                    choice = rules[NT]['choices'][index]['choice']
-                    
-                    # Generate a tree for this choice.
-                    parent = Tree(NT, None)
-                    
-                    # Generate a codon for this choice.
-                    parent.codon = generate_codon(NT, choice)
-                    
-                    # Set the snippet key for the parent.
-                    parent.snippet = key
-                    
-                    # Create child for terminal.
-                    child = Tree(T, parent)
-                    
-                    # Add child to parent.
-                    parent.children.append(child)
-                    
-                    # Add snippet to snippets repository.
-                    trackers.snippets[key] = parent
+    # Add snippets for all occurrences of all terminals in the target string.
+    # Unit production choices are climbed while reducing the solution list.
+    with timed(session.stats, "seed"):
+        add_terminal_snippets(session, climb=False)
 
 
-def reduce(solution):
+def reduce(session, solution):
     
-    reduce_NTs = params['BNF_GRAMMAR'].concat_NTs
+    reduce_NTs = session.grammar.concat_NTs
     
-    target = params['TARGET']
+    target = session.target
         
     for idx, snippet_info in enumerate(solution):
         # Get current snippet.
@@ -116,17 +67,19 @@ def reduce(solution):
                     # snippet already exists.
     
                     # Child is current snippet.
-                    child = [[snippet, trackers.snippets[snippet]]]
+                    child = [[snippet, session.snippets[snippet]]]
 
                     # Get key for new snippet.
-                    key, start, end = generate_key_and_check(start, end,
-                                                             reduce, child)
+                    key, start, end = generate_key_and_check(session, start,
+                                                             end, reduce,
+                                                             child)
 
                     # Create a new node for the solution list.
                     new_entry = [indexes, reduce[1], key]
                     
-                    # Insert the current node into the solution.
-                    if new_entry not in solution:
+                    # Insert the current node into the solution, unless it
+                    # can never be part of a solution.
+                    if key in session.snippets and new_entry not in solution:
                         solution.insert(idx + 1, new_entry)
                     
                 else:
@@ -137,6 +90,12 @@ def reduce(solution):
                     for loc in NT_locs:
                         # We want to check each possible reduction option.
 
+                        if not fits_reduction(session, start, end,
+                                              reduce[3][loc]):
+                            # The rest of the production choice can't fit
+                            # around the current snippet.
+                            continue
+
                         # Set where the original snippet starts and ends on
                         # the target string.
                         if loc == 0:
@@ -150,7 +109,7 @@ def reduce(solution):
                             # something before it.
                             break
     
-                        elif end == len(params['TARGET']) and loc != \
+                        elif end == len(session.target) and loc != \
                                 NT_locs[-1]:
                             # The current snippet is at the end of the target
                             # string, but we are trying to reduce_trees it with
@@ -173,7 +132,7 @@ def reduce(solution):
                         children = [[] for _ in range(len(NTs))]
     
                         # Set original snippet into children.
-                        children[loc] = [snippet, trackers.snippets[snippet]]
+                        children[loc] = [snippet, session.snippets[snippet]]
 
                         curr_idx = solution.index(snippet_info)
                         
@@ -190,10 +149,13 @@ def reduce(solution):
                                     # We have a match.
 
                                     # Generate fake key for snippets dict.
-                                    key = str([pre - len(NTs[item][0]), pre])
+                                    key = generate_key(
+                                        session.grammar,
+                                        pre - len(NTs[item][0]), pre)
 
                                     # Create new tree from this terminal.
-                                    T_tree = Tree(check, None)
+                                    T_tree = create_terminal_child(session,
+                                                                   check)
 
                                     # Add to children.
                                     children[item] = [key, T_tree]
@@ -218,12 +180,11 @@ def reduce(solution):
                                     # Set the correct child in our
                                     # children.
                                     children[item] = [check[2],
-                                                      trackers.snippets[
+                                                      session.snippets[
                                                           check[2]]]
 
                                     # Decrement target string index.
-                                    child_len = get_num_from_str(check[2])
-                                    pre -= child_len[1] - child_len[0]
+                                    pre -= check[2][1] - check[2][0]
 
                                     break
                                                     
@@ -240,10 +201,13 @@ def reduce(solution):
                                     # We have a match.
 
                                     # Generate fake key for snippets dict.
-                                    key = str([aft, aft + len(NTs[item][0])])
+                                    key = generate_key(
+                                        session.grammar, aft,
+                                        aft + len(NTs[item][0]))
 
                                     # Create new tree from this terminal.
-                                    T_tree = Tree(check, None)
+                                    T_tree = create_terminal_child(session,
+                                                                   check)
 
                                     # Add to children.
                                     children[item] = [key, T_tree]
@@ -264,58 +228,104 @@ def reduce(solution):
                             # We have expanded all children and can collapse
                             # a node.
                             
-                            key, pre, aft = generate_key_and_check(pre, aft,
+                            key, pre, aft = generate_key_and_check(session,
+                                                                   pre, aft,
                                                                    reduce,
                                                                    children)
 
                             # Create a new node for the solution list.
                             new_entry = [[pre, aft], reduce[1], key]
                             
-                            # Add the new reduced entry to the solution.
-                            if new_entry not in solution:
+                            # Add the new reduced entry to the solution,
+                            # unless it can never be part of a solution.
+                            if key in session.snippets and \
+                                    new_entry not in solution:
                                 solution.insert(idx + 1, new_entry)
     
 
-def parse_target_string():
+def parse_target_string(session):
     """
     Takes a list of terminal nodes and iteratively reduces that list until
     the solution has been found.
     
+    :param session: An algorithm.session.ParseSession of the target string.
     :return: The complete parsed solution in the form of a GE individual.
     """
 
+    if not session.grammar.can_yield(session.grammar.start_rule['symbol'],
+                                     len(session.target)):
+        # The target string is too short or too long to be derived.
+        return None
+
     # Sort snippets keys to generate the initial solution list of terminals.
-    solution = sorted([[get_num_from_str(snippet),
-                        get_NT_from_str(snippet),
-                        snippet] for snippet in trackers.snippets.keys()])
+    solution = [[[snippet[0], snippet[1]],
+                 get_NT_from_key(session.grammar, snippet), snippet]
+                for snippet in sorted(session.snippets.keys())]
         
-    # Perform reduction on the solution list.
-    reduce(solution)
+    with paused_gc(), timed(session.stats, "reduce"):
+        # Perform reduction on the solution list.
+        reduce(session, solution)
 
     # Check snippets for solution
-    ind = check_snippets_for_solution()
+    with timed(session.stats, "solution"):
+        ind = check_snippets_for_solution(session)
 
     # No solution found, return None.
     return ind
 
 
+def assemble_solution(target, session=None):
+    """
+    Given a target string, parse the terminals in the target string and
+    reduce them until the target string is parsed.
+
+    :param target: A target string.
+    :param session: An algorithm.session.ParseSession of the target string.
+    A new session with the grammar and options in params is used if not
+    set.
+    :return: A complete solution in the form of an individual, or None if
+    the target string couldn't be parsed.
+    """
+
+    if session is None:
+        session = ParseSession(params['BNF_GRAMMAR'], target)
+
+    # Parse the terminals in the target string.
+    parse_terminals(session)
+
+    # Iterate over the solution list until the target string is parsed.
+    session.solution = parse_target_string(session)
+
+    return session.solution
+
+
 if __name__ == '__main__':
     t1 = datetime.now()
     set_params(sys.argv)
-    
-    # Parse the terminals in the target string.
-    parse_terminals(params['TARGET'])
-    
-    # Iterate over the solution list until the target string is parsed.
-    solution = parse_target_string()
-    
-    check_ind(solution, params['TARGET'])
+    error = check_parser_options("LR", params)
+    if error:
+        print("Error:", error)
+        quit()
+
+    # Parse the target string.
+    session = ParseSession(params['BNF_GRAMMAR'], params['TARGET'])
+    solution = assemble_solution(params['TARGET'], session)
+    if not solution:
+        print("Error: Target string couldn't be parsed using given grammar.")
+        quit()
+
+    with timed(session.stats, "check"):
+        check_ind(solution, params['TARGET'], session.grammar)
     print("\nGenome:")
     print(solution.genome)
+    if params['STATS']:
+        print_stats(session.stats)
     
-    print(len(trackers.snippets), "snippets required.")
+    print(len(session.snippets), "snippets required.")
     
     t2 = datetime.now()
     time_taken = t2 - t1
     if not params['SILENT']:
+        print("\nGrammar load time:",
+              timedelta(seconds=params['BNF_GRAMMAR'].load_time))
         print("\nTotal time taken:", time_taken)
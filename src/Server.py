@@ -0,0 +1,23 @@
+from utilities.algorithm.initialise_run import check_python_version
+
+check_python_version()
+
+import sys
+
+from algorithm.parameters import params, set_params
+from algorithm.server import ParseServer, run_server
+
+
+if __name__ == '__main__':
+    set_params(sys.argv)
+
+    server = ParseServer(params['SERVER_GRAMMARS'] or [params['GRAMMAR_FILE']],
+                         params['SERVER_WORKERS'],
+                         params['SERVER_INLINE_LENGTH'], params['TIMEOUT'])
+
+    if not params['SILENT']:
+        print("Listening on", params['SERVER_SOCKET'] or
+              params['SERVER_HOST'] + ":" + str(params['SERVER_PORT']))
+
+    run_server(server, params['SERVER_SOCKET'], params['SERVER_HOST'],
+               params['SERVER_PORT'])
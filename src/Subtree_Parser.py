@@ -2,112 +2,163 @@ from utilities.algorithm.initialise_run import check_python_version
 
 check_python_version()
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import sys
 
+from algorithm.batch import check_parser_options
 from algorithm.parameters import params, set_params
+from algorithm.session import ParseSession
 from operators.subtree_parse import combine_snippets, \
-    check_snippets_for_solution
-from representation.tree import Tree
-from utilities.representation.check_methods import generate_codon, \
-    check_ind
+    check_snippets_for_solution, add_terminal_snippets, add_cached_snippets, \
+    cache_solution
+from representation.snippet_cache import SnippetCache
+from representation.snippet_store import SnippetStore
+from representation.tree import paused_gc
+from utilities.representation.check_methods import check_ind
 from utilities.stats import trackers
+from utilities.stats.parse_stats import timed, print_stats
 
 
-def assemble_solution(target):
+def assemble_solution(target, session=None):
     """
     Given a target string, build up a simple repository of snippets of
     terminals which match certain portions of the target string.
-    
-    :return: A complete solution in the form of an individual.
+
+    :param target: A target string.
+    :param session: An algorithm.session.ParseSession of the target string.
+    A new session with the grammar and options in params is used if not
+    set.
+    :return: A complete solution in the form of an individual, or None if
+    the target string couldn't be parsed.
     """
-    
-    if not params['SILENT']:
+
+    if session is None:
+        session = ParseSession(params['BNF_GRAMMAR'], target)
+
+    if not session.config['SILENT']:
         print("Target:", target)
-    terms = params['BNF_GRAMMAR'].terminals
-    rules = params['BNF_GRAMMAR'].rules
-
-    trackers.snippets = {}
-    
-    for T in sorted(terms.keys()):
-        # Iterate over all Terminals.
-
-        # Find all occurances of this terminal in the target string.
-        occurrances = []
-        index = 0
-        while index < len(target):
-            index = target.find(T, index)
-            if index not in occurrances and index != -1:
-                occurrances.append(index)
-                index += len(T)
-            else:
-                break
-         
-        for idx in occurrances:
-            # Check each occurrence of this terminal in the target string.
-
-            for NT in terms[T]:
-                
-                if any([[T] == i for i in [[sym['symbol'] for sym in
-                                            choice['choice']] for choice in
-                                           rules[NT]['choices']]]):
-                    # Check if current T is the entire production choice of any
-                    # particular rule.
-
-                    # Generate a key for the snippets repository.
-                    key = " ".join([str([idx, idx+len(T)]), NT])
-                    
-                    # Get index of production choice.
-                    index = [[sym['symbol'] for sym in choice['choice']] for
-                             choice in rules[NT]['choices']].index([T])
-                    
-                    # Get production choice.
-                    choice = rules[NT]['choices'][index]['choice']
-                    
-                    # Generate a tree for this choice.
-                    parent = Tree(NT, None)
-                    
-                    # Generate a codon for this choice.
-                    parent.codon = generate_codon(NT, choice)
-                    
-                    # Set the snippet key for the parent.
-                    parent.snippet = key
-                    
-                    # Create child for terminal.
-                    child = Tree(T, parent)
-                    
-                    # Add child to parent.
-                    parent.children.append(child)
-                    
-                    # Add snippet to snippets repository.
-                    trackers.snippets[key] = parent
 
-    if not params['SILENT']:
-        print("\nStarting with", len(trackers.snippets), "snippets.\n")
+    if session.cache is None and session.config['CACHE_SIZE']:
+        # Share the cache of this process.
+        session.cache = get_snippet_cache(session.config['CACHE_SIZE'])
 
-    # Combine snippets to make bigger snippets. Quickly builds up the
-    # perfect solution.
-    combine_snippets()
+    if session.cache is None:
+        session.solution = parse_snippets(session)
+        return session.solution
+
+    cache = session.cache
+    cache.lookups += 1
+
+    # Seed snippets with cached derivations.
+    reused = cache.reused
+    solution = parse_snippets(session, cache)
+
+    if cache.reused > reused:
+        cache.hits += 1
+
+        if not solution:
+            # Cached derivations can't always be combined into a complete
+            # solution, parse the target string from scratch.
+            cache.fallbacks += 1
+            session.snippets = SnippetStore(session.config['LAZY_SNIPPETS'])
+            solution = parse_snippets(session)
 
-    # Check snippets for full correct solution
-    solution = check_snippets_for_solution()
-        
     if solution:
-        return solution
+        # Cache all sub-derivations of the solution.
+        cache_solution(session, solution.tree, cache)
 
-    else:
-        print("Error: Target string couldn't be parsed using given grammar.")
-        quit()
+    session.solution = solution
+    return solution
+
+
+def parse_snippets(session, cache=None):
+    """
+    Given a parse session, build up a simple repository of snippets of
+    terminals which match certain portions of the target string, and
+    combine them into a complete solution.
+
+    :param session: An algorithm.session.ParseSession of the target string.
+    :param cache: A representation.snippet_cache.SnippetCache instance. If
+    set, cached derivations of substrings of the target string are used as
+    snippets, and only terminals outside of those substrings are added.
+    :return: A complete solution in the form of an individual, or None if
+    the target string couldn't be parsed.
+    """
+
+    target = session.target
+
+    with timed(session.stats, "seed"):
+        # Portions of the target string which are covered by cached
+        # derivations.
+        spans = add_cached_snippets(session, cache) if cache else []
+
+        start = 0
+
+        for span_start, span_end in spans + [(len(target), len(target))]:
+            # Add snippets for all occurrences of all terminals between
+            # cached derivations.
+            add_terminal_snippets(session, start, span_start)
+            start = span_end
+
+    if not session.config['SILENT']:
+        print("\nStarting with", len(session.snippets), "snippets.\n")
+
+    if not session.grammar.can_yield(session.grammar.start_rule['symbol'],
+                                     len(target)):
+        # The target string is too short or too long to be derived.
+        return None
+
+    with paused_gc():
+        # Combine snippets to make bigger snippets. Quickly builds up the
+        # perfect solution.
+        combine_snippets(session)
+
+    # Check snippets for full correct solution
+    with timed(session.stats, "solution"):
+        return check_snippets_for_solution(session)
+
+
+def get_snippet_cache(size):
+    """
+    Return the snippet cache shared between target strings in this
+    process, creating it if it doesn't exist. The cache is not thread-safe.
+
+    :param size: The memory budget of the cache in MB.
+    :return: A representation.snippet_cache.SnippetCache instance.
+    """
+
+    budget = int(size * 2**20)
+
+    if trackers.snippet_cache is None or \
+            trackers.snippet_cache.budget != budget:
+        trackers.snippet_cache = SnippetCache(budget)
+
+    return trackers.snippet_cache
 
 
 if __name__ == '__main__':
     t1 = datetime.now()
     set_params(sys.argv)
-    solution = assemble_solution(params['TARGET'])
-    check_ind(solution, params['TARGET'])
+    error = check_parser_options("subtree", params)
+    if error:
+        print("Error:", error)
+        quit()
+    session = ParseSession(params['BNF_GRAMMAR'], params['TARGET'])
+    solution = assemble_solution(params['TARGET'], session)
+    if not solution:
+        print("Error: Target string couldn't be parsed using given grammar.")
+        quit()
+    with timed(session.stats, "check"):
+        check_ind(solution, params['TARGET'], session.grammar)
     print("\nGenome:")
     print(solution.genome)
+    if params['STATS']:
+        print_stats(session.stats)
+    if params['CACHE_SIZE'] and not params['SILENT']:
+        print("\nSnippet cache:", trackers.snippet_cache.get_stats())
     t2 = datetime.now()
     time_taken = t2 - t1
     if not params['SILENT']:
+        print("\nGrammar load time:",
+              timedelta(seconds=params['BNF_GRAMMAR'].load_time))
         print("\nTotal time taken:", time_taken)
@@ -0,0 +1,317 @@
+from datetime import datetime
+from importlib import import_module
+import json
+from multiprocessing import Pool
+import signal
+import threading
+
+from algorithm.parameters import params, load_grammar
+from algorithm.session import ParseSession
+from utilities.representation.check_methods import find_ind_error
+from utilities.stats import trackers
+from utilities.stats.parse_stats import timed
+
+PARSERS = {
+    "LR": "LR_Parser",
+    "subtree": "Subtree_Parser",
+    "earley": "Earley_Parser"
+}
+# Modules implementing each parser. Each module provides an
+# assemble_solution(target, session=None) function which returns an
+# individual, or None if the target string couldn't be parsed.
+# The optional session is an algorithm.session.ParseSession.
+
+PARSER_OPTIONS = {
+    'MIN_COST': ("earley",)
+}
+# Options which only some parsers support, and the parsers which support
+# them.
+
+
+class ParseTimeout(Exception):
+    """
+    Raised when parsing a target takes longer than the allowed time.
+    """
+    pass
+
+
+def get_parser(name):
+    """
+    Given the name of a parser, return the function which parses a target
+    string using that parser.
+
+    :param name: The name of a parser, i.e. a key of PARSERS.
+    :return: The assemble_solution function of that parser.
+    """
+
+    if name not in PARSERS:
+        raise ValueError("Unknown parser: " + str(name))
+
+    return import_module(PARSERS[name]).assemble_solution
+
+
+def check_parser_options(name, config):
+    """
+    Check that a parser supports all options which are set.
+
+    :param name: The name of a parser, i.e. a key of PARSERS.
+    :param config: A dictionary of options, e.g. params or the config of an
+    algorithm.session.ParseSession.
+    :return: A description of the first option which is set but not
+    supported by the parser, or None if all options are supported.
+    """
+
+    for key, parsers in sorted(PARSER_OPTIONS.items()):
+        if config.get(key) and name not in parsers:
+            return key + " is not supported by the " + str(name) + \
+                " parser."
+
+    return None
+
+
+def read_targets(stream, targets_format):
+    """
+    Read target strings from a stream.
+
+    :param stream: An open file or stdin.
+    :param targets_format: "lines" for one target per line, or "jsonl" for
+    one JSON object per line with a "target" key and an optional "id" key.
+    A JSON string on its own is also accepted as a target.
+    :return: A generator of (id, target) tuples. The id defaults to the line
+    number of the target. The target is None for malformed lines.
+    """
+
+    for line_no, line in enumerate(stream):
+        # Strip only the line ending, since whitespace can be part of a
+        # target.
+        line = line.rstrip("\r\n")
+
+        if not line.strip():
+            # Skip blank lines.
+            continue
+
+        if targets_format == "jsonl":
+            try:
+                entry = json.loads(line)
+
+            except ValueError:
+                yield line_no, None
+                continue
+
+            if isinstance(entry, str):
+                yield line_no, entry
+
+            elif isinstance(entry, dict) and \
+                    isinstance(entry.get("target"), str):
+                yield entry.get("id", line_no), entry["target"]
+
+            else:
+                yield line_no, None
+
+        else:
+            yield line_no, line
+
+
+def parse_target(assemble_solution, target, timeout=None, session=None):
+    """
+    Parse a single target string and verify the resulting individual.
+    Failures are reported in the returned record rather than exiting.
+
+    :param assemble_solution: The function of the parser to be used.
+    :param target: A target string.
+    :param timeout: The maximum time in seconds allowed to parse the target.
+    Only enforced on platforms with SIGALRM, from the main thread.
+    :param session: An algorithm.session.ParseSession of the target string.
+    A new session with the grammar and options in params is used if not
+    set.
+    :return: A dictionary containing the genome, number of used codons,
+    time taken in seconds and any error for the target. Statistics of the
+    parse are included if STATS is set, and statistics of the snippet cache
+    so far are included if it is in use.
+    """
+
+    record = {"target": target, "genome": None, "used_codons": None,
+              "time": None, "error": None}
+
+    if target is None:
+        record["error"] = "Malformed target."
+        return record
+
+    if session is None:
+        session = ParseSession(params['BNF_GRAMMAR'], target)
+
+    # Interrupt the parser if it runs for too long.
+    use_timer = timeout and hasattr(signal, "SIGALRM") and \
+        threading.current_thread() is threading.main_thread()
+
+    if use_timer:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    t1 = datetime.now()
+
+    try:
+        solution = assemble_solution(target, session)
+
+        if not solution:
+            record["error"] = "Target string couldn't be parsed using " \
+                              "given grammar."
+
+        else:
+            # Check the solution maps back to the target.
+            with timed(session.stats, "check"):
+                record["error"] = find_ind_error(solution, target,
+                                                 session.grammar)
+
+    except Exception as error:
+        # Report any failure of the parser for this target only.
+        solution = None
+        record["error"] = type(error).__name__ + ": " + str(error)
+
+    finally:
+        if use_timer:
+            # Cancel the timer.
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    t2 = datetime.now()
+    record["time"] = (t2 - t1).total_seconds()
+
+    if solution and not record["error"]:
+        record["genome"] = solution.genome
+        record["used_codons"] = solution.used_codons
+
+        if session.min_cost is not None:
+            # Report the cost of the lowest-cost derivation.
+            record["min_cost"] = session.min_cost
+
+    if session.stats is not None:
+        # Report the time spent in each phase of parsing the target.
+        record["stats"] = session.stats.as_dict()
+
+    if session.config['CACHE_SIZE'] and trackers.snippet_cache is not None:
+        # Report the use of the snippet cache so far.
+        record["cache"] = trackers.snippet_cache.get_stats()
+
+    return record
+
+
+def raise_timeout(signum, frame):
+    """
+    Signal handler which interrupts a parser which has run out of time.
+
+    :param signum: The signal number.
+    :param frame: The current stack frame.
+    :return: Nothing.
+    """
+
+    raise ParseTimeout("Target string took too long to parse.")
+
+
+def run_batch(targets, out, parser, timeout=None):
+    """
+    Parse a sequence of target strings against the currently loaded
+    grammar, writing one JSON record per target to an output stream as
+    soon as each target is parsed.
+
+    :param targets: An iterable of (id, target) tuples.
+    :param out: An open file or stdout.
+    :param parser: The name of the parser to be used.
+    :param timeout: The maximum time in seconds allowed to parse each target.
+    :return: Nothing.
+    """
+
+    assemble_solution = get_parser(parser)
+
+    error = check_parser_options(parser, params)
+
+    if error:
+        raise ValueError(error)
+
+    for target_id, target in targets:
+        record = {"id": target_id}
+        record.update(parse_target(assemble_solution, target, timeout))
+
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+
+def run_parallel_batch(targets, out, parser, processes, chunk_size=1,
+                       timeout=None):
+    """
+    Parse a sequence of target strings over a pool of worker processes.
+    Each worker loads the grammar once and keeps its own params and snippet
+    repository. The longest targets are scheduled first, since the time
+    taken to parse a target grows faster than its length. Records are
+    written to the output stream in the same order as the input targets.
+
+    :param targets: An iterable of (id, target) tuples.
+    :param out: An open file or stdout.
+    :param parser: The name of the parser to be used.
+    :param processes: The number of worker processes.
+    :param chunk_size: The number of targets sent to a worker at a time.
+    :param timeout: The maximum time in seconds allowed to parse each target.
+    :return: Nothing.
+    """
+
+    # Check the parser and its options before starting any workers.
+    get_parser(parser)
+
+    error = check_parser_options(parser, params)
+
+    if error:
+        raise ValueError(error)
+
+    tasks = [(index, target_id, target, parser, timeout) for
+             index, (target_id, target) in enumerate(targets)]
+
+    # Schedule the longest targets first.
+    tasks.sort(key=lambda task: -len(task[2] or ""))
+
+    # The grammar is re-loaded by each worker rather than sent to it.
+    worker_params = {key: value for key, value in params.items() if
+                     key != 'BNF_GRAMMAR'}
+
+    # Records which have arrived ahead of earlier targets.
+    pending, next_index = {}, 0
+
+    with Pool(processes, initialise_worker, (worker_params,)) as pool:
+        for index, record in pool.imap_unordered(parse_task, tasks,
+                                                 chunk_size):
+            pending[index] = record
+
+            while next_index in pending:
+                # Write all records which are now in order.
+                out.write(json.dumps(pending.pop(next_index)) + "\n")
+                next_index += 1
+
+            out.flush()
+
+
+def initialise_worker(worker_params):
+    """
+    Set up the params of a worker process and load the grammar.
+
+    :param worker_params: The params of the main process, without the
+    grammar.
+    :return: Nothing.
+    """
+
+    params.update(worker_params)
+
+    load_grammar()
+
+
+def parse_task(task):
+    """
+    Parse a single target string in a worker process.
+
+    :param task: A tuple of (index, id, target, parser, timeout).
+    :return: The index of the target and its result record.
+    """
+
+    index, target_id, target, parser, timeout = task
+
+    record = {"id": target_id}
+    record.update(parse_target(get_parser(parser), target, timeout))
+
+    return index, record
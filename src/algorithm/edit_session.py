@@ -0,0 +1,197 @@
+from algorithm.parameters import params
+from algorithm.session import ParseSession
+from operators.subtree_parse import combine_snippets, combine_new_snippets, \
+    check_snippets_for_solution, add_terminal_snippets, invalidate_snippets, \
+    shift_snippets
+from representation.snippet_store import SnippetStore
+from representation.tree import paused_gc
+from utilities.stats.parse_stats import ParseStats, timed
+
+
+class EditSession(object):
+    """
+    Parses a target string with the subtree parser, and keeps the snippets
+    repository between parses so that the target string can be edited and
+    re-parsed. After each edit, only snippets which overlap the edit are
+    removed, snippets after the edit are moved, and reduction is only
+    re-run from new snippets and snippets next to the edit. Every removed
+    snippet which spans the edit must be derived again, so if an edit
+    would remove too many snippets the target string is parsed from
+    scratch instead.
+    """
+
+    def __init__(self, target, grammar=None, config=None, max_removed=0.4):
+        """
+        Initialise a new edit session.
+
+        :param target: The initial target string.
+        :param grammar: An instance of the representation.grammar.Grammar
+        class. The grammar loaded for the run is used if not set.
+        :param config: A dictionary of options which override those in
+        algorithm.parameters.params.
+        :param max_removed: The largest fraction of all snippets, including
+        deleted snippets, which an edit may remove before the target string
+        is parsed from scratch instead.
+        """
+
+        self.target = target
+        self.max_removed = max_removed
+
+        # The parse session of the target string, which holds its snippets
+        # repository between parses.
+        self.session = ParseSession(grammar or params['BNF_GRAMMAR'],
+                                    target, config=config)
+
+        # The snippets repository of the target string. Set by parse.
+        self.snippets = None
+
+    def parse(self):
+        """
+        Parse the whole target string from scratch.
+
+        :return: A complete solution in the form of an individual, or None
+        if the target string couldn't be parsed.
+        """
+
+        session = self.session
+
+        session.target = self.target
+        self.snippets = session.snippets = SnippetStore(
+            session.config['LAZY_SNIPPETS'])
+
+        if session.stats is not None:
+            # Collect statistics of this parse only.
+            session.stats = ParseStats()
+
+        # Add snippets for all occurrences of all terminals in the target
+        # string.
+        with timed(session.stats, "seed"):
+            add_terminal_snippets(session)
+
+        with paused_gc():
+            # Combine snippets to make bigger snippets.
+            combine_snippets(session)
+
+        with timed(session.stats, "solution"):
+            session.solution = check_snippets_for_solution(session)
+
+        return session.solution
+
+    def append(self, text):
+        """
+        Add text to the end of the target string and re-parse it.
+
+        :param text: The text to be added.
+        :return: A complete solution in the form of an individual, or None
+        if the target string couldn't be parsed.
+        """
+
+        return self.edit(len(self.target), 0, text)
+
+    def insert(self, index, text):
+        """
+        Insert text into the target string and re-parse it.
+
+        :param index: The index on the target string at which to insert.
+        :param text: The text to be inserted.
+        :return: A complete solution in the form of an individual, or None
+        if the target string couldn't be parsed.
+        """
+
+        return self.edit(index, 0, text)
+
+    def delete(self, index, length):
+        """
+        Delete text from the target string and re-parse it.
+
+        :param index: The index on the target string of the text to delete.
+        :param length: The number of characters to delete.
+        :return: A complete solution in the form of an individual, or None
+        if the target string couldn't be parsed.
+        """
+
+        return self.edit(index, length, "")
+
+    def edit(self, index, length, text):
+        """
+        Replace a portion of the target string with new text and re-parse
+        it, re-using all snippets which don't overlap the edit.
+
+        :param index: The index on the target string of the edit.
+        :param length: The number of characters to replace.
+        :param text: The text with which to replace them.
+        :return: A complete solution in the form of an individual, or None
+        if the target string couldn't be parsed.
+        """
+
+        if not 0 <= index <= index + length <= len(self.target):
+            raise ValueError("Error: algorithm.edit_session.EditSession.edit."
+                             " Edit is outside the target string.")
+
+        # Appended text can't overlap or move any snippets.
+        is_append = index == len(self.target)
+
+        # Snippets which don't fit the target string are never made (see
+        # operators.subtree_parse.fits_target), but snippets can only come
+        # to fit it if the start or the end of the target string is cut off.
+        is_cut = length and not text and \
+            (index == 0 or index + length == len(self.target))
+
+        self.target = self.target[:index] + text + self.target[index + length:]
+
+        if self.snippets is None or is_cut:
+            # Nothing has been parsed yet, or snippets which were never made
+            # may be needed.
+            return self.parse()
+
+        session = self.session
+        session.target = self.target
+
+        if session.stats is not None:
+            # Collect statistics of this edit only.
+            session.stats = ParseStats()
+
+        if not is_append:
+            # Remove snippets which overlap the edit, and move snippets
+            # after the edit.
+            limit = self.max_removed * (len(self.snippets) +
+                                        len(self.snippets.deleted))
+
+            with timed(session.stats, "invalidate"):
+                if not invalidate_snippets(session, index, index + length,
+                                           limit):
+                    # Deriving the removed snippets again would cost about
+                    # as much as parsing from scratch.
+                    return self.parse()
+
+                shift_snippets(session, index + length, len(text) - length)
+
+        # Terminals which cross either end of the new text can only start
+        # within the length of the longest terminal of the edit.
+        reach = max([len(T) for T in session.grammar.terminals])
+
+        with timed(session.stats, "seed"):
+            add_terminal_snippets(session, max(0, index - reach + 1),
+                                  index + len(text) + reach - 1)
+
+        # Re-reduce new and restored snippets, and snippets which now meet
+        # across the edit. New terminals may start or end anywhere within
+        # reach of either end of the new text, e.g. inside a terminal which
+        # the edit has split, so old snippets on either side may now meet
+        # them anywhere within reach too.
+        seeds = set(self.snippets.pop_created())
+
+        for NT in range(len(session.grammar.NT_names)):
+            for i in range(max(0, index - reach + 1), index + 1):
+                seeds.update(self.snippets.ending_at(i, NT))
+
+            for i in range(index + len(text), index + len(text) + reach):
+                seeds.update(self.snippets.starting_at(i, NT))
+
+        combine_new_snippets(session, sorted(seeds))
+
+        with timed(session.stats, "solution"):
+            session.solution = check_snippets_for_solution(session)
+
+        return session.solution
+
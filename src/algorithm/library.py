@@ -0,0 +1,82 @@
+from os import path
+import threading
+
+from algorithm.batch import check_parser_options, get_parser
+from algorithm.session import ParseSession
+
+# Grammars loaded so far, by the path of their grammar file.
+grammars = {}
+
+# Guards loading grammars, so that each grammar is only loaded once.
+grammars_lock = threading.Lock()
+
+
+def get_grammar(grammar_file):
+    """
+    Load a grammar, or return the same grammar if it has already been
+    loaded. Grammars are never changed by parsing, so a single grammar can
+    be shared by any number of parse sessions in any number of threads.
+
+    :param grammar_file: The name of a grammar file in the grammars folder,
+    including its file extension, or a path to a grammar file.
+    :return: An instance of the representation.grammar.Grammar class.
+    """
+
+    from representation.grammar import Grammar
+
+    if not path.isfile(grammar_file):
+        # Look for the grammar file in the grammars folder.
+        grammar_file = path.join("..", "grammars", grammar_file)
+
+    grammar_file = path.abspath(grammar_file)
+
+    with grammars_lock:
+        if grammar_file not in grammars:
+            grammars[grammar_file] = Grammar(grammar_file)
+
+        return grammars[grammar_file]
+
+
+def parse(target, grammar, parser="earley", config=None):
+    """
+    Parse a target string in a new parse session. Any number of target
+    strings can be parsed at the same time from different threads, e.g.
+
+        grammar = get_grammar("letter.bnf")
+        session = parse("Hello world!", grammar)
+        genome = session.solution.genome
+
+    The subtree parser's cache of sub-derivations (CACHE_SIZE) is shared by
+    the whole process and is not thread safe, so it should only be used
+    from a single thread.
+
+    :param target: A target string.
+    :param grammar: An instance of the representation.grammar.Grammar
+    class, see get_grammar.
+    :param parser: The name of the parser to be used, i.e. a key of
+    algorithm.batch.PARSERS.
+    :param config: A dictionary of options which override those in
+    algorithm.parameters.params, e.g. {'MIN_COST': "codons"}. Nothing is
+    printed unless SILENT is set to False.
+    :return: The parse session of the target string. The solution is given
+    by session.solution, which is None if the target string couldn't be
+    parsed, and statistics are given by session.stats if STATS is set.
+    """
+
+    options = {'SILENT': True}
+
+    if config:
+        options.update(config)
+
+    session = ParseSession(grammar, target, config=options)
+
+    assemble_solution = get_parser(parser)
+
+    error = check_parser_options(parser, session.config)
+
+    if error:
+        raise ValueError(error)
+
+    assemble_solution(target, session)
+
+    return session
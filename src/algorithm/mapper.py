@@ -3,7 +3,7 @@ from representation.tree import Tree
 from utilities.representation.python_filter import python_filter
 
 
-def mapper(genome, tree):
+def mapper(genome, tree, grammar=None):
     """
     Wheel for mapping. Calls the correct mapper for a given _input. Checks
     the params dict to ensure the correct type of individual is being created.
@@ -14,9 +14,15 @@ def mapper(genome, tree):
 
     :param genome: Genome of an individual.
     :param tree: Tree of an individual.
+    :param grammar: The grammar to be used. The grammar in
+    params['BNF_GRAMMAR'] if not set.
     :return: All components necessary for a fully mapped individual.
     """
 
+    if grammar is None:
+        # Use the grammar loaded for the run.
+        grammar = params['BNF_GRAMMAR']
+
     # one or other must be passed in, but not both
     assert (genome or tree)
     assert not (genome and tree)
@@ -30,7 +36,7 @@ def mapper(genome, tree):
 
         # Build the tree using algorithm.mapper.map_tree_from_genome().
         phenotype, genome, tree, nodes, invalid, depth, \
-            used_codons = map_tree_from_genome(genome)
+            used_codons = map_tree_from_genome(genome, grammar)
 
     else:
 
@@ -38,9 +44,7 @@ def mapper(genome, tree):
         # generated by recursing through the tree once.
 
         _input, output, invalid, depth, \
-        nodes = tree.get_tree_info(params['BNF_GRAMMAR']
-                                   .non_terminals.keys(),
-                                   [], [])
+        nodes = tree.get_tree_info(grammar.non_terminals.keys(), [], [])
         used_codons, phenotype = len(_input), "".join(output)
         depth += 1  # because get_tree_info under-counts by 1.
 
@@ -49,25 +53,31 @@ def mapper(genome, tree):
     return phenotype, genome, tree, nodes, invalid, depth, used_codons
 
 
-def map_tree_from_genome(genome):
+def map_tree_from_genome(genome, grammar=None):
     """
     Maps a full tree from a given genome.
 
     :param genome: A genome to be mapped.
+    :param grammar: The grammar to be used. The grammar in
+    params['BNF_GRAMMAR'] if not set.
     :return: All components necessary for a fully mapped individual.
     """
 
+    if grammar is None:
+        # Use the grammar loaded for the run.
+        grammar = params['BNF_GRAMMAR']
+
     # Initialise an instance of the tree class
-    tree = Tree(str(params['BNF_GRAMMAR'].start_rule["symbol"]), None)
+    tree = Tree(str(grammar.start_rule["symbol"]), None)
 
     # Map tree from the given genome
     output, used_codons, nodes, depth, max_depth, invalid = \
-        genome_tree_map(tree, genome, [], 0, 0, 0, 0)
+        genome_tree_map(tree, genome, [], 0, 0, 0, 0, grammar=grammar)
 
     # Build phenotype.
     phenotype = "".join(output)
 
-    if params['BNF_GRAMMAR'].python_mode:
+    if grammar.python_mode:
         # Grammar contains python code
 
         phenotype = python_filter(phenotype)
@@ -82,11 +92,69 @@ def map_tree_from_genome(genome):
            used_codons
 
 
+def map_phenotype_from_genome(genome, grammar=None):
+    """
+    Maps only the phenotype and the number of used codons from a given
+    genome, without building a derivation tree. Gives the same phenotype
+    and number of used codons as map_tree_from_genome, but is much faster
+    when only the phenotype is needed, e.g. for checking solutions.
+
+    :param genome: A genome to be mapped.
+    :param grammar: The grammar to be used. The grammar in
+    params['BNF_GRAMMAR'] if not set.
+    :return: The phenotype, or None if the genome is invalid, and the number
+    of used codons.
+    """
+
+    if grammar is None:
+        # Use the grammar loaded for the run.
+        grammar = params['BNF_GRAMMAR']
+
+    rules = grammar.rules
+
+    # Expand the leftmost symbol first. Symbols are pushed onto the stack
+    # in reverse order.
+    stack = [grammar.start_rule]
+    output, index = [], 0
+
+    while stack:
+        symbol = stack.pop()
+
+        if symbol["type"] == "T":
+            # Terminals are added directly to the phenotype.
+            output.append(symbol["symbol"])
+
+        elif index < len(genome):
+            # Select the correct production from the list and expand it.
+            rule = rules[symbol["symbol"]]
+            chosen_prod = rule['choices'][genome[index] % rule['no_choices']]
+            stack.extend(reversed(chosen_prod['choice']))
+
+            # Increment the index
+            index += 1
+
+        else:
+            # Mapping incomplete, solution is invalid.
+            return None, index
+
+    # Build phenotype.
+    phenotype = "".join(output)
+
+    if grammar.python_mode:
+        # Grammar contains python code
+
+        phenotype = python_filter(phenotype)
+
+    return phenotype, index
+
+
 def genome_tree_map(tree, genome, output, index, depth, max_depth, nodes,
-                    invalid=False):
+                    invalid=False, grammar=None):
     """
-    Recursive function which builds a tree using production choices from a
-    given genome. Not guaranteed to terminate.
+    Builds a tree using production choices from a given genome. Expands
+    non-terminals depth-first with an explicit stack rather than recursion,
+    so very deep derivations do not hit Python's recursion limit. Not
+    guaranteed to terminate.
 
     :param tree: An instance of the representation.tree.Tree class.
     :param genome: A full genome.
@@ -98,84 +166,109 @@ def genome_tree_map(tree, genome, output, index, depth, max_depth, nodes,
     :param nodes: The total number of nodes in the tree thus far.
     :param invalid: A boolean flag indicating whether or not the individual
     is invalid.
-    :return: index, the index of the current location on the genome,
+    :param grammar: The grammar to be used. The grammar in
+    params['BNF_GRAMMAR'] if not set.
+    :return: output, the list of all terminal nodes in the tree,
+             index, the index of the current location on the genome,
              nodes, the total number of nodes in the tree thus far,
-             depth, the current depth in the tree,
+             depth, the depth of the root of the tree,
              max_depth, the maximum overall depth in the tree,
              invalid, a boolean flag indicating whether or not the
              individual is invalid.
     """
 
-    if not invalid and index < len(genome):
-        # If the solution is not invalid thus far, and if we still have
-        # remaining codons in the genome, and if we have not exceeded our
-        # maximum depth, then we can continue to map the tree.
+    if invalid or index >= len(genome):
+        # Mapping incomplete, solution is invalid.
+        return output, index, nodes, depth, max_depth, True
 
-        # Increment and set number of nodes and current depth.
-        nodes += 1
-        depth += 1
-        tree.id, tree.depth = nodes, depth
+    if grammar is None:
+        # Use the grammar loaded for the run.
+        grammar = params['BNF_GRAMMAR']
 
-        # Find all production choices and the number of those production
-        # choices that can be made by the current root non-terminal.
-        productions = params['BNF_GRAMMAR'].rules[tree.root]['choices']
-        no_choices = params['BNF_GRAMMAR'].rules[tree.root]['no_choices']
+    rules = grammar.rules
+    non_terminals = grammar.non_terminals
 
-        # Set the current codon value from the genome.
-        tree.codon = genome[index % len(genome)]
+    # Stack of nodes which are being expanded. Each entry holds a node, the
+    # symbols of its chosen production, the index of the next symbol to be
+    # expanded, and the depth of the node.
+    stack = []
 
-        # Select the index of the correct production from the list.
-        selection = tree.codon % no_choices
+    # Expand the root node.
+    node, parent_depth = tree, depth
 
-        # Set the chosen production
-        chosen_prod = productions[selection]
+    while True:
 
-        # Increment the index
-        index += 1
+        if node is not None:
+            # Expand a new non-terminal node.
 
-        # Initialise an empty list of children.
-        tree.children = []
+            if invalid or index >= len(genome):
+                # Mapping incomplete, solution is invalid. The node is left
+                # without any children.
+                invalid = True
 
-        for symbol in chosen_prod['choice']:
-            # Add children to the derivation tree by creating a new instance
-            # of the representation.tree.Tree class for each child.
+            else:
+                # Increment and set number of nodes and current depth.
+                nodes += 1
+                node.id, node.depth = nodes, parent_depth + 1
 
-            if symbol["type"] == "T":
-                # Append the child to the parent node. Child is a terminal, do
-                # not recurse.
-                tree.children.append(Tree(symbol["symbol"], tree))
-                output.append(symbol["symbol"])
+                # Set the current codon value from the genome.
+                node.codon = genome[index]
 
-            elif symbol["type"] == "NT":
-                # Append the child to the parent node.
-                tree.children.append(Tree(symbol["symbol"], tree))
+                # Select the correct production from the list.
+                rule = rules[node.root]
+                chosen_prod = rule['choices'][node.codon % rule['no_choices']]
 
-                # Recurse by calling the function again to map the next
-                # non-terminal from the genome.
-                output, index, nodes, d, max_depth, invalid = \
-                    genome_tree_map(tree.children[-1], genome, output,
-                                    index, depth, max_depth, nodes,
-                                    invalid=invalid)
+                # Increment the index
+                index += 1
 
-    else:
-        # Mapping incomplete, solution is invalid.
-        return output, index, nodes, depth, max_depth, True
+                # Initialise an empty list of children.
+                node.children = []
+
+                stack.append([node, chosen_prod['choice'], 0, node.depth])
+
+            node = None
+
+        if not stack:
+            # The whole tree has been expanded.
+            break
 
-    # Find all non-terminals in the chosen production choice.
-    NT_kids = [kid for kid in tree.children if kid.root in
-               params['BNF_GRAMMAR'].non_terminals]
+        frame = stack[-1]
+        parent, symbols, symbol_idx, parent_depth = frame
 
-    if not NT_kids:
-        # There are no non-terminals in the chosen production choice, the
-        # branch terminates here.
-        depth += 1
-        nodes += 1
+        if symbol_idx < len(symbols):
+            # Add the next child to the derivation tree by creating a new
+            # instance of the representation.tree.Tree class.
+            symbol = symbols[symbol_idx]
+            frame[2] += 1
 
-    if not invalid:
-        # The solution is valid thus far.
+            child = Tree(symbol["symbol"], parent)
+            parent.children.append(child)
 
-        if depth > max_depth:
-            # Set the new maximum depth.
-            max_depth = depth
+            if symbol["type"] == "T":
+                # Child is a terminal, do not expand.
+                output.append(symbol["symbol"])
+
+            elif symbol["type"] == "NT":
+                # Expand the non-terminal child next.
+                node = child
+
+        else:
+            # All children of this node have been expanded.
+            stack.pop()
+
+            if not any([kid.root in non_terminals for kid in
+                        parent.children]):
+                # There are no non-terminals in the chosen production
+                # choice, the branch terminates here.
+                parent_depth += 1
+                nodes += 1
+
+            if not invalid and parent_depth > max_depth:
+                # Set the new maximum depth.
+                max_depth = parent_depth
+
+            # The root is the last node to be completed, so its depth is
+            # returned.
+            depth = parent_depth
 
     return output, index, nodes, depth, max_depth, invalid
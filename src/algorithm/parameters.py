@@ -7,11 +7,115 @@ params = {
         # Set grammar file.
         'GRAMMAR_FILE': "letter.bnf",
 
+        # Set folder in which compiled grammars are saved, so that later runs
+        # don't need to parse the grammar file again. Grammars are always
+        # compiled from the grammar file if not set.
+        'GRAMMAR_CACHE': path.join("..", "grammars", "__cache__"),
+
         # Specify target for target problems.
         'TARGET': "Hello world!",
 
         # Prevent output from being printed.
-        'SILENT': False
+        'SILENT': False,
+
+        # Only reduce snippets created on the previous pass when combining
+        # snippets, rather than re-reducing all snippets on every pass.
+        'INCREMENTAL': True,
+
+        # Store snippets as back-pointers to the snippets they were reduced
+        # from, and only build a full derivation tree for the solution.
+        'LAZY_SNIPPETS': False,
+
+        # Choose the derivation of the target string with the lowest cost
+        # with the Earley parser, either "codons" or "depth". The first
+        # derivation found is used if not set.
+        'MIN_COST': None,
+
+        # Set memory budget in MB of the cache of sub-derivations shared
+        # between target strings by the subtree parser. No cache if not set.
+        'CACHE_SIZE': 0,
+
+        # Set minimum length of the output of cached sub-derivations.
+        'CACHE_MIN_LENGTH': 3,
+
+        # Set number of genomes to draw uniformly at random from all
+        # derivations of the target string with the Earley parser.
+        'SAMPLES': 0,
+
+        # Set seed for drawing random genomes. Not seeded if not set.
+        'RANDOM_SEED': None,
+
+        # Choose which codon is generated for a production choice which
+        # appears more than once in its rule, either "lowest" for the codon
+        # of its first occurrence or "random" for the codon of any of its
+        # occurrences, drawn using RANDOM_SEED.
+        'CODON_CHOICE': "lowest",
+
+        # Collect wall time per parsing phase and per reduction pass, and
+        # counters of snippets and reductions, and print them in the given
+        # format, either "text" or "json". Not collected if not set.
+        'STATS': None,
+
+        # Set parser for batch runs.
+        'PARSER': "earley",
+
+        # Set file of targets for batch runs. Targets are read from stdin if
+        # no file is given.
+        'TARGETS_FILE': None,
+
+        # Set format of targets file, either "lines" (one target per line)
+        # or "jsonl" (one JSON object with a "target" key per line).
+        'TARGETS_FORMAT': "lines",
+
+        # Set file for results of batch runs. Results are written to stdout
+        # if no file is given.
+        'RESULTS_FILE': None,
+
+        # Set number of worker processes for batch runs.
+        'PROCESSES': 1,
+
+        # Set number of targets sent to a worker process at a time.
+        'CHUNK_SIZE': 1,
+
+        # Set maximum time in seconds allowed to parse each target in batch
+        # runs. No limit if not set.
+        'TIMEOUT': None,
+
+        # Set grammar files for benchmark runs. All grammars in the grammars
+        # folder are used if not set.
+        'BENCHMARK_GRAMMARS': None,
+
+        # Set parsers for benchmark runs. All parsers are used if not set.
+        'BENCHMARK_PARSERS': None,
+
+        # Set lengths of generated target strings for benchmark runs.
+        'BENCHMARK_LENGTHS': [25, 50, 100, 200],
+
+        # Set number of generated target strings of each length for
+        # benchmark runs.
+        'BENCHMARK_TARGETS': 3,
+
+        # Set path of the Unix domain socket of the parse server. The server
+        # listens on SERVER_HOST and SERVER_PORT instead if not set.
+        'SERVER_SOCKET': None,
+
+        # Set host and port of the parse server.
+        'SERVER_HOST': "127.0.0.1",
+        'SERVER_PORT': 8765,
+
+        # Set grammar files loaded by the parse server when it starts. Only
+        # GRAMMAR_FILE is loaded if not set. Other grammars are loaded when
+        # first requested.
+        'SERVER_GRAMMARS': None,
+
+        # Set number of worker processes of the parse server for targets
+        # longer than SERVER_INLINE_LENGTH. All targets are parsed by the
+        # server process if 0.
+        'SERVER_WORKERS': 2,
+
+        # Set maximum length of targets parsed by the parse server process
+        # itself rather than by a worker process.
+        'SERVER_INLINE_LENGTH': 100
 
 }
 
@@ -28,7 +132,6 @@ def set_params(command_line_args):
     :return: Nothing.
     """
 
-    from representation import grammar
     import utilities.algorithm.command_line_parser as parser
 
     cmd_args, unknown = parser.parse_cmd_args(command_line_args)
@@ -38,5 +141,18 @@ def set_params(command_line_args):
     params.update(cmd_args)
 
     # Parse grammar file and set grammar class.
+    load_grammar()
+
+
+def load_grammar():
+    """
+    Parse the grammar file specified in params['GRAMMAR_FILE'] and set the
+    grammar class.
+
+    :return: Nothing.
+    """
+
+    from representation import grammar
+
     params['BNF_GRAMMAR'] = grammar.Grammar(path.join("..", "grammars",
                                             params['GRAMMAR_FILE']))
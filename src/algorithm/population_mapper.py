@@ -0,0 +1,364 @@
+import numpy as np
+
+from algorithm.parameters import params
+from utilities.representation.python_filter import python_filter
+
+# Genomes are mapped in lockstep while at least this many are still being
+# mapped. Every lockstep step costs about the same however few genomes are
+# left, so the last genomes, which are usually the longest, are finished one
+# at a time instead.
+MIN_LOCKSTEP = 64
+
+
+class GrammarTables(object):
+    """
+    Integer-coded tables of the production choices of a grammar, for
+    mapping whole populations of genomes at once.
+
+    Each run of terminals in a production choice is coded as a single
+    segment, with segment 0 as the empty run. The leading segment of a
+    production choice is output as soon as the choice is chosen, and the
+    rest of the choice is split into entries, each of which is a segment
+    followed by a non-terminal, or the segment at the end of the choice on
+    its own. Mapping a genome thus takes about one step per codon.
+    """
+
+    def __init__(self, grammar):
+        """
+        Build the tables of a grammar.
+
+        :param grammar: An instance of the representation.grammar.Grammar
+        class.
+        """
+
+        NT_ids = {NT: i for i, NT in enumerate(grammar.NT_names)}
+        segment_codes = {"": 0}
+
+        # The (segment code, NT id) of each entry, indexed by entry code.
+        # Entries at the end of a production choice have a NT id of -1.
+        self.entries, entry_codes = [], {}
+
+        # The leading segment code, the entry codes in reverse order, and
+        # whether there are no NTs, of each production choice of each NT.
+        self.choices = [[] for _ in NT_ids]
+
+        for NT, rule in grammar.rules.items():
+            for choice in rule['choices']:
+                # Split the production choice into the segments before,
+                # between and after its NTs.
+                segments, NTs = [""], []
+
+                for sym in choice['choice']:
+                    if sym['type'] == "T":
+                        segments[-1] += sym['symbol']
+
+                    else:
+                        NTs.append(NT_ids[sym['symbol']])
+                        segments.append("")
+
+                for segment in segments:
+                    segment_codes.setdefault(segment, len(segment_codes))
+
+                # The leading segment is output separately.
+                production = [(segment_codes[segments[i]] if i else 0, NT)
+                              for i, NT in enumerate(NTs)]
+
+                if NTs and segments[-1]:
+                    production.append((segment_codes[segments[-1]], -1))
+
+                for entry in production:
+                    if entry not in entry_codes:
+                        entry_codes[entry] = len(self.entries)
+                        self.entries.append(entry)
+
+                self.choices[NT_ids[NT]].append(
+                    (segment_codes[segments[0]],
+                     [entry_codes[entry] for entry in reversed(production)],
+                     not NTs))
+
+        # The text of each segment, indexed by segment code.
+        self.segments = sorted(segment_codes, key=segment_codes.get)
+
+        # The start rule is an entry of its own.
+        self.start = len(self.entries)
+        self.entries.append((0, NT_ids[grammar.start_rule['symbol']]))
+        self.no_entries = len(self.entries)
+
+        self.entry_segments = np.array([entry[0] for entry in self.entries],
+                                       dtype=np.int64)
+        self.entry_NTs = np.array([entry[1] for entry in self.entries],
+                                  dtype=np.int64)
+
+        # Tables of production choices, indexed by
+        # NT * max_choices + choice.
+        self.max_choices = max([len(choices) for choices in self.choices])
+        max_length = max([len(production) for choices in self.choices for
+                          _, production, _ in choices] + [1])
+
+        size = len(NT_ids) * self.max_choices
+        self.productions = np.zeros((size, max_length), dtype=np.int64)
+        self.production_lengths = np.zeros(size, dtype=np.int64)
+        self.leading = np.zeros(size, dtype=np.int64)
+        self.leaves = np.zeros(size, dtype=bool)
+        self.no_choices = np.array([len(choices) or 1 for choices in
+                                    self.choices], dtype=np.int64)
+
+        for NT, choices in enumerate(self.choices):
+            for idx, (leading, production, leaf) in enumerate(choices):
+                row = NT * self.max_choices + idx
+                self.productions[row, :len(production)] = production
+                self.production_lengths[row] = len(production)
+                self.leading[row], self.leaves[row] = leading, leaf
+
+
+def get_grammar_tables(grammar):
+    """
+    Find the tables of a grammar for mapping whole populations of genomes.
+    Tables are built once per grammar and kept on the grammar.
+
+    :param grammar: An instance of the representation.grammar.Grammar class.
+    :return: An instance of the GrammarTables class.
+    """
+
+    if grammar.population_tables is None:
+        grammar.population_tables = GrammarTables(grammar)
+
+    return grammar.population_tables
+
+
+def map_population(genomes, lengths=None, grammar=None):
+    """
+    Maps a whole population of genomes at once. Every genome keeps its own
+    stack of symbols to be expanded, and all stacks are advanced in
+    lockstep, one non-terminal per genome per step, using integer-coded
+    grammar tables. Gives the same phenotype, used codons, invalid flag and
+    maximum depth for each genome as algorithm.mapper.map_tree_from_genome,
+    without building any trees.
+
+    :param genomes: A 2-D array of codons with one genome per row, or a list
+    of genomes of any lengths.
+    :param lengths: The length of each genome if genomes is a 2-D array
+    padded to a common length. All rows are used in full if not set.
+    :param grammar: The grammar to be used. The grammar in
+    params['BNF_GRAMMAR'] if not set.
+    :return: A list of phenotypes (None for invalid genomes), and arrays of
+    the number of used codons, invalid flags, and maximum depths.
+    """
+
+    if grammar is None:
+        # Use the grammar loaded for the run.
+        grammar = params['BNF_GRAMMAR']
+
+    if lengths is None and not isinstance(genomes, np.ndarray):
+        # Pad a list of genomes into a 2-D array.
+        lengths = np.array([len(genome) for genome in genomes], dtype=np.int64)
+        padded = np.zeros((len(genomes), max(lengths.max(initial=0), 1)),
+                          dtype=np.int64)
+
+        for row, genome in enumerate(genomes):
+            padded[row, :len(genome)] = genome
+
+        genomes = padded
+
+    genomes = np.asarray(genomes, dtype=np.int64)
+    pop_size, genome_length = genomes.shape
+
+    if lengths is None:
+        lengths = np.full(pop_size, genome_length, dtype=np.int64)
+
+    else:
+        lengths = np.asarray(lengths, dtype=np.int64)
+
+    tables = get_grammar_tables(grammar)
+    no_entries = tables.no_entries
+    max_length = tables.productions.shape[1]
+    flat_genomes = genomes.reshape(-1)
+
+    # Genomes still being mapped, and their stacks of entries to be
+    # expanded. Each stack item holds the code of an entry and the depth of
+    # its NT in the derivation tree as depth * no_entries + code. Stacks are
+    # only kept for genomes still being mapped, and are only widened as far
+    # as needed.
+    rows = np.arange(pop_size)
+    width = 1 + max_length
+    stack = np.zeros((pop_size, width), dtype=np.int64)
+    stack_pointers = np.ones(pop_size, dtype=np.int64)
+    stack[:, 0] = no_entries + tables.start
+
+    index = np.zeros(pop_size, dtype=np.int64)
+    invalid = np.zeros(pop_size, dtype=bool)
+    max_depths = np.zeros(pop_size, dtype=np.int64)
+
+    # The genome and segment code of every segment output, in order of
+    # output.
+    output_rows = [np.zeros(0, dtype=np.int64)]
+    output_segments = [np.zeros(0, dtype=np.int64)]
+
+    offsets = np.arange(max_length)
+
+    while len(rows) >= MIN_LOCKSTEP:
+        # Pop the top entry from the stack of every genome.
+        stack_pointers -= 1
+        depths, popped = np.divmod(stack.reshape(-1)[
+            np.arange(len(rows)) * width + stack_pointers], no_entries)
+
+        # The segment of each entry is added directly to the output.
+        segments = tables.entry_segments[popped]
+        has_segment = segments > 0
+        output_rows.append(rows[has_segment])
+        output_segments.append(segments[has_segment])
+
+        # Non-terminals are expanded using the next codon.
+        NTs = tables.entry_NTs[popped]
+        positions = np.nonzero(NTs >= 0)[0]
+        NTs, depths, expanded = NTs[positions], depths[positions], \
+            rows[positions]
+        used = index[expanded]
+
+        # Mapping is incomplete for genomes with no codons left.
+        exhausted = used >= lengths[expanded]
+
+        if exhausted.any():
+            invalid[expanded[exhausted]] = True
+            stack_pointers[positions[exhausted]] = 0
+
+            positions, NTs, depths, expanded, used = positions[~exhausted], \
+                NTs[~exhausted], depths[~exhausted], expanded[~exhausted], \
+                used[~exhausted]
+
+        # Select the chosen production for each genome.
+        codons = flat_genomes[expanded * genome_length + used]
+        chosen = NTs * tables.max_choices + codons % tables.no_choices[NTs]
+        index[expanded] = used + 1
+
+        # The leading segment of the production is added directly to the
+        # output.
+        segments = tables.leading[chosen]
+        has_segment = segments > 0
+        output_rows.append(expanded[has_segment])
+        output_segments.append(segments[has_segment])
+
+        # A production with no non-terminals ends its branch one level below
+        # the current node.
+        leaves = tables.leaves[chosen]
+        max_depths[expanded[leaves]] = np.maximum(
+            max_depths[expanded[leaves]], depths[leaves] + 1)
+
+        # Push the entries of the chosen production onto each stack. The
+        # production tables are stored in reverse order so that the
+        # leftmost entry ends up on top. Whole rows of the production table
+        # are pushed, as entries past the end of a production are above the
+        # stack pointer and are never read.
+        tops = stack_pointers[positions]
+
+        if len(tops) and tops.max() + max_length > width:
+            # Double the width of all stacks.
+            stack = np.pad(stack, ((0, 0), (0, width)))
+            width *= 2
+
+        stack.reshape(-1)[(positions * width + tops)[:, None] + offsets] = \
+            tables.productions[chosen] + (depths[:, None] + 1) * no_entries
+        stack_pointers[positions] += tables.production_lengths[chosen]
+
+        if not stack_pointers.all():
+            # Drop finished genomes.
+            live = np.nonzero(stack_pointers)[0]
+            rows, stack, stack_pointers = rows[live], stack[live], \
+                stack_pointers[live]
+
+    for position, row in enumerate(rows):
+        # Finish the last genomes one at a time.
+        depths, entries = np.divmod(
+            stack[position, :stack_pointers[position]], no_entries)
+        segments, index[row], invalid[row], max_depths[row] = finish_genome(
+            genomes[row, :lengths[row]].tolist(), entries.tolist(),
+            depths.tolist(), index[row], max_depths[row], tables)
+
+        output_rows.append(np.full(len(segments), row, dtype=np.int64))
+        output_segments.append(np.array(segments, dtype=np.int64))
+
+    # Join the output of all genomes into a single string, ordered by
+    # genome, and find where the output of each genome ends.
+    output_rows = np.concatenate(output_rows)
+    output_segments = np.concatenate(output_segments)
+    order = np.argsort(output_rows, kind='stable')
+
+    output = "".join(np.array(tables.segments, dtype=object)[
+        output_segments[order]])
+
+    ends = np.cumsum(np.bincount(
+        output_rows, minlength=pop_size, weights=np.array(
+            [len(segment) for segment in tables.segments])[output_segments]
+    )).astype(np.int64).tolist()
+
+    phenotypes = []
+
+    for row, is_invalid in enumerate(invalid.tolist()):
+        # Build phenotypes.
+
+        if is_invalid:
+            # Return "None" phenotype if invalid
+            phenotypes.append(None)
+            continue
+
+        phenotype = output[ends[row - 1] if row else 0:ends[row]]
+
+        if grammar.python_mode:
+            # Grammar contains python code
+
+            phenotype = python_filter(phenotype)
+
+        phenotypes.append(phenotype)
+
+    return phenotypes, index, invalid, max_depths
+
+
+def finish_genome(genome, stack, stack_depths, index, max_depth, tables):
+    """
+    Finish mapping a single genome from part way through its mapping.
+
+    :param genome: A genome to be mapped, as a list of codons.
+    :param stack: The codes of the entries still to be expanded, with the
+    next entry last.
+    :param stack_depths: The depth of the NT of each of those entries in
+    the derivation tree.
+    :param index: The number of codons used so far.
+    :param max_depth: The maximum depth of the derivation tree so far.
+    :param tables: An instance of the GrammarTables class.
+    :return: The codes of the segments output, the number of used codons,
+    whether the genome is invalid, and the maximum depth.
+    """
+
+    output = []
+
+    while stack:
+        (segment, NT), depth = tables.entries[stack.pop()], stack_depths.pop()
+
+        if segment:
+            # Segments are added directly to the output.
+            output.append(segment)
+
+        if NT < 0:
+            # The segment at the end of a production choice.
+            continue
+
+        if index >= len(genome):
+            # Mapping incomplete, solution is invalid.
+            return output, index, True, max_depth
+
+        # Select the correct production and expand it.
+        choices = tables.choices[NT]
+        leading, production, leaf = choices[genome[index] % len(choices)]
+        index += 1
+
+        if leading:
+            output.append(leading)
+
+        if leaf:
+            # A production with no non-terminals ends its branch.
+            max_depth = max(max_depth, depth + 1)
+
+        stack.extend(production)
+        stack_depths.extend([depth + 1] * len(production))
+
+    return output, index, False, max_depth
@@ -0,0 +1,601 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
+from os import lstat, path, remove
+import signal
+import socket
+import stat
+from time import perf_counter
+
+from algorithm.batch import PARSERS, check_parser_options, get_parser, \
+    parse_target
+from algorithm.library import get_grammar
+from algorithm.parameters import params
+from algorithm.session import ParseSession
+
+# Options which can be set by requests, and either the type of their
+# values or a tuple of their allowed values. Options which are None by
+# default can also be set to None. All other options, including options
+# which affect the whole process such as CACHE_SIZE and GRAMMAR_CACHE,
+# can't be set by requests.
+REQUEST_OPTIONS = {
+    'INCREMENTAL': bool,
+    'LAZY_SNIPPETS': bool,
+    'MIN_COST': ("codons", "depth"),
+    'RANDOM_SEED': int,
+    'CODON_CHOICE': ("lowest", "random"),
+    'STATS': ("text", "json")
+}
+
+# Number of threads which parse short targets in the server process.
+INLINE_THREADS = 4
+
+# Number of most recent requests used for latency percentiles.
+LATENCY_WINDOW = 1000
+
+# Maximum length in bytes of a single request.
+REQUEST_LIMIT = 2 ** 24
+
+
+class ParseServer(object):
+    """
+    A long-running parse server which keeps grammars loaded in memory and
+    answers requests of newline-delimited JSON objects over a Unix domain
+    socket or a localhost TCP port. Short targets are parsed by the server
+    process itself, and longer targets by a pool of worker processes.
+    Requests on the same connection can be pipelined, and each response is
+    written as soon as its request is finished.
+
+    A parse request is of the form:
+
+        {"id": 1, "grammar": "letter.bnf", "target": "Hello world!",
+         "parser": "earley", "options": {"MIN_COST": "codons"}}
+
+    where all keys but "target" are optional. The response is a batch
+    record (see algorithm.batch.parse_target) with the same "id". Requests
+    of {"type": "health"} and {"type": "metrics"} report the state of the
+    server.
+
+    Short targets are parsed in a pool of threads, so that the event loop
+    keeps answering requests. A parse in a thread can't be interrupted, so
+    once it runs out of time its response is sent and the parse is left to
+    finish in the background.
+    """
+
+    def __init__(self, grammar_files, workers=0, inline_length=100,
+                 timeout=None):
+        """
+        Initialise a new parse server.
+
+        :param grammar_files: A list of names of grammar files in the
+        grammars folder which are loaded when the server starts.
+        :param workers: The number of worker processes for targets longer
+        than inline_length. All targets are parsed by the server process if
+        0.
+        :param inline_length: The maximum length of targets parsed by the
+        server process itself, in a pool of threads.
+        :param timeout: The maximum time in seconds allowed to parse each
+        target. No limit if not set.
+        """
+
+        self.grammar_files = grammar_files
+        self.workers = workers
+        self.inline_length = inline_length
+        self.timeout = timeout
+
+        # The pool of worker processes. Set by start.
+        self.pool = None
+
+        # The pool of threads which parse short targets. Set by start.
+        self.threads = None
+
+        # Time at which the server started.
+        self.started = None
+
+        # Counts of requests answered, requests which gave an error, and
+        # targets parsed by the server process and by the worker pool.
+        self.counts = {"requests": 0, "errors": 0, "inline": 0,
+                       "pooled": 0}
+
+        # Number of targets sent to the worker pool which are not finished.
+        self.pending = 0
+
+        # Time taken in seconds to answer the most recent parse requests.
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        """
+        Load all grammars and start the worker pool.
+
+        :return: Nothing.
+        """
+
+        self.started = perf_counter()
+
+        for grammar_file in self.grammar_files:
+            get_folder_grammar(grammar_file)
+
+        # The cache of sub-derivations is shared by the whole process and
+        # isn't thread safe.
+        self.threads = ThreadPoolExecutor(
+            1 if params['CACHE_SIZE'] else INLINE_THREADS)
+
+        if self.workers > 0:
+            # Grammars are re-loaded by each worker rather than sent to it.
+            worker_params = {key: value for key, value in params.items() if
+                             key != 'BNF_GRAMMAR'}
+
+            self.pool = ProcessPoolExecutor(
+                self.workers, initializer=initialise_worker,
+                initargs=(worker_params, self.grammar_files))
+
+            # Start all worker processes now rather than on the first long
+            # target.
+            for future in [self.pool.submit(len, "") for _ in
+                           range(self.workers)]:
+                future.result()
+
+    def stop(self):
+        """
+        Shut down the worker pool and the thread pool. Parses which have
+        run out of time are not waited for.
+
+        :return: Nothing.
+        """
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+        if self.threads is not None:
+            self.threads.shutdown(wait=False)
+            self.threads = None
+
+    async def handle_connection(self, reader, writer):
+        """
+        Answer all requests on a connection, one request per line. Requests
+        are answered concurrently, and responses are written in the order
+        in which they finish.
+
+        :param reader: An asyncio.StreamReader of the connection.
+        :param writer: An asyncio.StreamWriter of the connection.
+        :return: Nothing.
+        """
+
+        write_lock, tasks = asyncio.Lock(), set()
+
+        while True:
+            line = await reader.readline()
+
+            if not line:
+                # The client has closed the connection.
+                break
+
+            if not line.strip():
+                # Skip blank lines.
+                continue
+
+            task = asyncio.ensure_future(self.respond(line, writer,
+                                                      write_lock))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            # Finish all requests which are still running.
+            await asyncio.wait(tasks)
+
+        writer.close()
+
+    async def respond(self, line, writer, write_lock):
+        """
+        Answer a single request and write the response.
+
+        :param line: A line holding a JSON request.
+        :param writer: An asyncio.StreamWriter of the connection.
+        :param write_lock: An asyncio.Lock which guards writing to the
+        connection.
+        :return: Nothing.
+        """
+
+        response = await self.handle_request(line)
+
+        async with write_lock:
+            try:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+            except ConnectionError:
+                # The client has gone away.
+                pass
+
+    async def handle_request(self, line):
+        """
+        Answer a single request.
+
+        :param line: A line holding a JSON request.
+        :return: A dictionary of the response.
+        """
+
+        try:
+            request = json.loads(line.decode())
+
+        except ValueError:
+            request = None
+
+        if not isinstance(request, dict):
+            self.counts["errors"] += 1
+            return {"error": "Malformed request."}
+
+        kind = request.get("type", "parse")
+
+        if kind == "health":
+            response = self.get_health()
+
+        elif kind == "metrics":
+            response = self.get_metrics()
+
+        elif kind == "parse":
+            response = await self.parse(request)
+
+        else:
+            response = {"error": "Unknown request type: " + str(kind)}
+
+        if response.get("error"):
+            self.counts["errors"] += 1
+
+        if "id" in request:
+            response = dict({"id": request["id"]}, **response)
+
+        return response
+
+    async def parse(self, request):
+        """
+        Parse the target string of a request, in the server process if it
+        is short and in the worker pool otherwise.
+
+        :param request: A dictionary of the request.
+        :return: A dictionary of the result record.
+        """
+
+        t1 = perf_counter()
+
+        target = request.get("target")
+        grammar_file = request.get("grammar", params['GRAMMAR_FILE'])
+        parser = request.get("parser", params['PARSER'])
+        options = request.get("options") or {}
+
+        error = check_request(target, grammar_file, parser, options)
+
+        if error:
+            return {"target": target, "error": error}
+
+        self.counts["requests"] += 1
+
+        if self.pool is None or len(target) <= self.inline_length:
+            self.counts["inline"] += 1
+
+            try:
+                record = await asyncio.wait_for(
+                    asyncio.get_event_loop().run_in_executor(
+                        self.threads, parse_request, grammar_file, target,
+                        parser, options), self.timeout)
+
+            except asyncio.TimeoutError:
+                # The parse is left to finish in its thread.
+                record = {"target": target, "genome": None,
+                          "used_codons": None, "time": self.timeout,
+                          "error": "ParseTimeout: Target string took too "
+                                   "long to parse."}
+
+        else:
+            self.counts["pooled"] += 1
+            self.pending += 1
+
+            try:
+                record = await asyncio.get_event_loop().run_in_executor(
+                    self.pool, parse_request, grammar_file, target, parser,
+                    options, self.timeout)
+
+            finally:
+                self.pending -= 1
+
+        self.latencies.append(perf_counter() - t1)
+
+        return record
+
+    def get_health(self):
+        """
+        Report whether the server is running, which grammars are loaded and
+        how long each took to load in seconds.
+
+        :return: A dictionary of the health of the server.
+        """
+
+        return {"status": "ok", "grammars": {
+                    grammar_file: get_folder_grammar(grammar_file).load_time
+                    for grammar_file in self.grammar_files},
+                "workers": self.workers,
+                "uptime": perf_counter() - self.started}
+
+    def get_metrics(self):
+        """
+        Report the load on the server and the time taken to answer recent
+        parse requests.
+
+        :return: A dictionary of the metrics of the server.
+        """
+
+        metrics = dict(self.counts)
+
+        # Targets waiting for a free worker process.
+        metrics["queue_depth"] = max(0, self.pending - self.workers)
+        metrics["in_flight"] = self.pending
+
+        latencies = sorted(self.latencies)
+
+        metrics["latency"] = {
+            "p" + str(percent): get_percentile(latencies, percent) for
+            percent in (50, 90, 99)}
+        metrics["latency"]["max"] = latencies[-1] if latencies else None
+
+        metrics["uptime"] = perf_counter() - self.started
+
+        return metrics
+
+
+def check_request(target, grammar_file, parser, options):
+    """
+    Check that the values of a parse request are valid.
+
+    :param target: The target string of the request.
+    :param grammar_file: The name of the grammar file of the request.
+    :param parser: The name of the parser of the request.
+    :param options: The options of the request.
+    :return: A description of the first problem with the request, or None
+    if the request is valid.
+    """
+
+    if not isinstance(target, str):
+        return "Malformed target."
+
+    if not isinstance(grammar_file, str) or \
+            path.basename(grammar_file) != grammar_file or \
+            not path.isfile(path.join("..", "grammars", grammar_file)):
+        # Only grammars in the grammars folder can be used.
+        return "Unknown grammar: " + str(grammar_file)
+
+    if parser not in PARSERS:
+        return "Unknown parser: " + str(parser)
+
+    if not isinstance(options, dict):
+        return "Malformed options."
+
+    for key, value in options.items():
+        if key not in REQUEST_OPTIONS:
+            return "Unknown option: " + str(key)
+
+        allowed = REQUEST_OPTIONS[key]
+
+        if value is None and params[key] is None:
+            continue
+
+        elif isinstance(allowed, tuple) and value not in allowed or \
+                isinstance(allowed, type) and type(value) is not allowed:
+            return "Invalid value of option: " + key
+
+    return check_parser_options(parser, dict(params, **options))
+
+
+def parse_request(grammar_file, target, parser, options, timeout=None):
+    """
+    Parse a target string with a grammar which is kept loaded between
+    requests. Called by a thread of the server process or by a worker
+    process.
+
+    :param grammar_file: The name of a grammar file in the grammars folder.
+    :param target: A target string.
+    :param parser: The name of the parser to be used.
+    :param options: A dictionary of options which override those in
+    algorithm.parameters.params.
+    :param timeout: The maximum time in seconds allowed to parse the target.
+    :return: A result record, see algorithm.batch.parse_target.
+    """
+
+    try:
+        grammar = get_folder_grammar(grammar_file)
+
+    except (OSError, ValueError) as error:
+        return {"target": target, "error": type(error).__name__ + ": " +
+                str(error)}
+
+    session = ParseSession(grammar, target, config=dict(options,
+                                                        SILENT=True))
+
+    return parse_target(get_parser(parser), target, timeout, session)
+
+
+def initialise_worker(worker_params, grammar_files):
+    """
+    Set up the params of a worker process and load all grammars.
+
+    :param worker_params: The params of the server process, without the
+    grammar.
+    :param grammar_files: A list of names of grammar files.
+    :return: Nothing.
+    """
+
+    params.update(worker_params)
+
+    for grammar_file in grammar_files:
+        get_folder_grammar(grammar_file)
+
+
+def get_folder_grammar(grammar_file):
+    """
+    Load a grammar from the grammars folder, or return the same grammar if
+    it has already been loaded. Unlike algorithm.library.get_grammar,
+    grammar files are never looked for in the working directory.
+
+    :param grammar_file: The name of a grammar file in the grammars folder.
+    :return: An instance of the representation.grammar.Grammar class.
+    """
+
+    return get_grammar(path.join("..", "grammars", grammar_file))
+
+
+def get_percentile(values, percent):
+    """
+    Find a percentile of a sorted list of values by the nearest rank.
+
+    :param values: A sorted list of values.
+    :param percent: The percentile to find, between 0 and 100.
+    :return: The percentile, or None if there are no values.
+    """
+
+    if not values:
+        return None
+
+    rank = max(0, -(-percent * len(values) // 100) - 1)
+
+    return values[rank]
+
+
+def run_server(server, socket_path=None, host="127.0.0.1", port=8765):
+    """
+    Run a parse server until it is interrupted or terminated. The worker
+    pool is shut down and the socket file is removed on either signal.
+
+    :param server: A ParseServer instance.
+    :param socket_path: The path of a Unix domain socket to listen on. The
+    server listens on host and port instead if not set.
+    :param host: The host to listen on.
+    :param port: The port to listen on.
+    :return: Nothing.
+    """
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            # Stop the event loop so that the server is shut down cleanly.
+            loop.add_signal_handler(signum, loop.stop)
+
+        except (NotImplementedError, RuntimeError):
+            # Signal handlers aren't supported by this event loop, only
+            # KeyboardInterrupt stops the server.
+            pass
+
+    server.start()
+
+    if socket_path:
+        if path.exists(socket_path) and \
+                stat.S_ISSOCK(lstat(socket_path).st_mode):
+            # Remove the socket left by a previous server.
+            remove(socket_path)
+
+        listener = loop.run_until_complete(asyncio.start_unix_server(
+            server.handle_connection, socket_path, limit=REQUEST_LIMIT))
+
+    else:
+        listener = loop.run_until_complete(asyncio.start_server(
+            server.handle_connection, host, port, limit=REQUEST_LIMIT))
+
+    try:
+        loop.run_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(signum)
+
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+        loop.close()
+
+        server.stop()
+
+        if socket_path and path.exists(socket_path):
+            remove(socket_path)
+
+
+class ParseClient(object):
+    """
+    A client which keeps a connection to a parse server open, so that each
+    request only costs a round trip, e.g.
+
+        client = ParseClient(socket_path="/tmp/reverse_ge.sock")
+        record = client.parse("Hello world!", grammar="letter.bnf")
+    """
+
+    def __init__(self, socket_path=None, host="127.0.0.1", port=8765):
+        """
+        Connect to a parse server.
+
+        :param socket_path: The path of the Unix domain socket of the
+        server. Connects to host and port instead if not set.
+        :param host: The host of the server.
+        :param port: The port of the server.
+        """
+
+        if socket_path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(socket_path)
+
+        else:
+            self.socket = socket.create_connection((host, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.stream = self.socket.makefile("rwb")
+
+    def request(self, request):
+        """
+        Send a request and wait for its response.
+
+        :param request: A dictionary of the request.
+        :return: A dictionary of the response.
+        """
+
+        self.stream.write((json.dumps(request) + "\n").encode())
+        self.stream.flush()
+
+        return json.loads(self.stream.readline().decode())
+
+    def parse(self, target, grammar=None, parser=None, options=None):
+        """
+        Parse a target string.
+
+        :param target: A target string.
+        :param grammar: The name of a grammar file. The default grammar of
+        the server is used if not set.
+        :param parser: The name of the parser to be used. The default
+        parser of the server is used if not set.
+        :param options: A dictionary of options for the parse.
+        :return: A result record, see algorithm.batch.parse_target.
+        """
+
+        request = {"target": target}
+
+        for key, value in (("grammar", grammar), ("parser", parser),
+                           ("options", options)):
+            if value is not None:
+                request[key] = value
+
+        return self.request(request)
+
+    def close(self):
+        """
+        Close the connection.
+
+        :return: Nothing.
+        """
+
+        self.stream.close()
+        self.socket.close()
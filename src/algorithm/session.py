@@ -0,0 +1,74 @@
+from random import Random
+
+from algorithm.parameters import params
+from representation.snippet_store import SnippetStore
+from utilities.stats.parse_stats import ParseStats
+
+
+class ParseSession(object):
+    """
+    All state of parsing a single target string: the grammar, the target
+    string, the snippets repository, the options of the parse and its
+    statistics. Sessions are passed explicitly through the parsers, so any
+    number of sessions can be parsed in the same process, in threads or
+    interleaved, while sharing the same grammar. Grammars are never changed
+    by parsing.
+    """
+
+    def __init__(self, grammar, target, store=None, config=None):
+        """
+        Initialise a new parse session.
+
+        :param grammar: An instance of the representation.grammar.Grammar
+        class.
+        :param target: A target string.
+        :param store: A representation.snippet_store.SnippetStore instance
+        holding the snippets of the target string. A new empty repository
+        is used if not set.
+        :param config: A dictionary of options which override those in
+        algorithm.parameters.params, e.g. {'LAZY_SNIPPETS': True}.
+        """
+
+        self.grammar = grammar
+        self.target = target
+
+        # Options are copied, so later changes to params don't affect the
+        # session.
+        self.config = {key: value for key, value in params.items() if key
+                       not in ('BNF_GRAMMAR', 'TARGET')}
+
+        if config:
+            self.config.update(config)
+
+        if store is None:
+            store = SnippetStore(self.config['LAZY_SNIPPETS'])
+
+        self.snippets = store
+
+        # Per-phase timings and counters, only collected if STATS is set.
+        self.stats = ParseStats() if self.config['STATS'] else None
+
+        # Random number generator for picking codons of duplicated
+        # production choices, only used if CODON_CHOICE is "random".
+        if self.config['CODON_CHOICE'] == "random":
+            self.rng = Random(self.config['RANDOM_SEED'])
+        else:
+            self.rng = None
+
+        # The number of reduction passes made by the subtree parser.
+        self.passes = None
+
+        # Cache of sub-derivations shared with other target strings (see
+        # representation.snippet_cache.SnippetCache), used by the subtree
+        # parser if set.
+        self.cache = None
+
+        # The solution found for the target string, if any.
+        self.solution = None
+
+        # The cost of the solution, only set if MIN_COST is set.
+        self.min_cost = None
+
+        # The packed parse forest of all derivations of the target string,
+        # only built by the Earley parser for MIN_COST or SAMPLES.
+        self.forest = None
@@ -0,0 +1,232 @@
+from multiprocessing import get_context
+from statistics import median
+import sys
+from time import perf_counter
+
+from algorithm.batch import get_parser
+from algorithm.parameters import params, load_grammar
+from algorithm.session import ParseSession
+from utilities.representation.check_methods import find_ind_error
+from utilities.stats.parse_stats import timed
+
+try:
+    import resource
+
+except ImportError:
+    # Peak memory can't be measured on this platform.
+    resource = None
+
+
+def run_benchmark(targets, parsers, timeout=None):
+    """
+    Parse a list of target strings against the currently loaded grammar
+    with each of a list of parsers. Each target string is parsed in a newly
+    spawned process, so that the memory used by each parser can be measured
+    from the peak memory of the process and runs can't affect each other.
+
+    :param targets: A list of dictionaries holding the required length and
+    target string of each target, see benchmark.targets.generate_targets.
+    :param parsers: A list of names of parsers, i.e. keys of
+    algorithm.batch.PARSERS.
+    :param timeout: The maximum time in seconds allowed to parse each
+    target. No limit if not set.
+    :return: A list of result records, one for each target and parser.
+    """
+
+    # The grammar is re-loaded by each worker process.
+    worker_params = {key: value for key, value in params.items() if
+                     key != 'BNF_GRAMMAR'}
+
+    results = []
+
+    for parser in parsers:
+        for target in targets:
+            record = {"grammar": params['GRAMMAR_FILE'], "parser": parser,
+                      "length": target["length"],
+                      "target_length": len(target["target"]),
+                      "time": None, "peak_memory": None, "memory": None,
+                      "snippets": None, "passes": None, "error": None}
+
+            record.update(run_process(worker_params, parser,
+                                      target["target"], timeout))
+
+            results.append(record)
+
+    return results
+
+
+def run_process(worker_params, parser, target, timeout=None):
+    """
+    Parse a single target string in a newly spawned process. Forked
+    processes aren't used, as they start with the peak memory of the main
+    process.
+
+    :param worker_params: The params of the main process, without the
+    grammar.
+    :param parser: The name of the parser to be used.
+    :param target: A target string.
+    :param timeout: The maximum time in seconds allowed to parse the target.
+    :return: A dictionary of measurements of the run.
+    """
+
+    context = get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+
+    process = context.Process(target=run_parser,
+                              args=(sender, worker_params, parser, target))
+    process.start()
+    sender.close()
+
+    # Wait for the measurements, or for the process to run out of time.
+    if receiver.poll(timeout):
+        try:
+            stats = receiver.recv()
+
+        except EOFError:
+            # The process died without sending any measurements.
+            stats = {"error": "Process exited with code " +
+                              str(process.exitcode) + "."}
+
+    else:
+        process.terminate()
+        stats = {"error": "Target string took too long to parse."}
+
+    process.join()
+    receiver.close()
+
+    return stats
+
+
+def run_parser(connection, worker_params, parser, target):
+    """
+    Parse a single target string and send measurements of the run back to
+    the main process.
+
+    :param connection: The sending end of a pipe to the main process.
+    :param worker_params: The params of the main process, without the
+    grammar.
+    :param parser: The name of the parser to be used.
+    :param target: A target string.
+    :return: Nothing.
+    """
+
+    params.update(worker_params)
+    load_grammar()
+
+    session = ParseSession(params['BNF_GRAMMAR'], target)
+
+    # Import the parser before any measurements are taken.
+    assemble_solution = get_parser(parser)
+
+    stats = {"error": None}
+    start_memory = get_peak_memory()
+
+    t1 = perf_counter()
+
+    try:
+        solution = assemble_solution(target, session)
+
+        if not solution:
+            stats["error"] = "Target string couldn't be parsed using given " \
+                             "grammar."
+
+        else:
+            # Check the solution maps back to the target.
+            with timed(session.stats, "check"):
+                stats["error"] = find_ind_error(solution, target,
+                                                session.grammar)
+
+    except Exception as error:
+        # Report any failure of the parser.
+        stats["error"] = type(error).__name__ + ": " + str(error)
+
+    stats["time"] = perf_counter() - t1
+
+    if resource is not None:
+        stats["peak_memory"] = get_peak_memory()
+        stats["memory"] = stats["peak_memory"] - start_memory
+
+    if parser in ("LR", "subtree"):
+        # Count all snippets made by the parser, including deleted
+        # snippets. The Earley parser doesn't use the snippets repository.
+        stats["snippets"] = len(session.snippets) + \
+            len(session.snippets.deleted)
+
+    stats["passes"] = session.passes
+
+    if session.stats is not None:
+        # Include the time spent in each phase of parsing.
+        stats["stats"] = session.stats.as_dict()
+
+    connection.send(stats)
+    connection.close()
+
+
+def get_peak_memory():
+    """
+    Find the peak resident memory of the current process.
+
+    :return: The peak resident memory in bytes, or None if it can't be
+    measured on this platform.
+    """
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if sys.platform != "darwin":
+        # Measured in kilobytes rather than bytes.
+        peak *= 1024
+
+    return peak
+
+
+def format_table(results, metric, scale=1, unit=""):
+    """
+    Format a table of how a measurement scales with the length of the target
+    string, with a row for each grammar and parser and a column for each
+    required length. Each cell holds the median over all target strings of
+    that length which were parsed without error.
+
+    :param results: A list of result records, see run_benchmark.
+    :param metric: The key of the measurement in each record.
+    :param scale: The value by which each measurement is divided.
+    :param unit: The unit of each measurement.
+    :return: The table as a string.
+    """
+
+    lengths = sorted({record["length"] for record in results})
+    rows = []
+
+    for record in results:
+        if (record["grammar"], record["parser"]) not in rows:
+            rows.append((record["grammar"], record["parser"]))
+
+    title = metric + (" (" + unit + ")" if unit else "")
+
+    # Width of the first column.
+    width = max([len(title)] + [len(grammar) + len(parser) + 1 for
+                                grammar, parser in rows])
+
+    lines = [title.ljust(width) + "".join(["%12d" % length for length in
+                                           lengths])]
+
+    for grammar, parser in rows:
+        cells = [(grammar + " " + parser).ljust(width)]
+
+        for length in lengths:
+            values = [record[metric] for record in results if
+                      (record["grammar"], record["parser"],
+                       record["length"]) == (grammar, parser, length) and
+                      not record["error"] and record[metric] is not None]
+
+            if values:
+                cells.append("%12s" % round(median(values) / scale, 3))
+
+            else:
+                cells.append("%12s" % "-")
+
+        lines.append("".join(cells))
+
+    return "\n".join(lines)
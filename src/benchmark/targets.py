@@ -0,0 +1,203 @@
+from algorithm.mapper import map_phenotype_from_genome
+from algorithm.parameters import params
+
+INFINITY = float("inf")
+
+CODON_SIZE = 10000
+# Codons of generated genomes are below this value.
+
+
+def get_min_yields(grammar):
+    """
+    Find the shortest output and the smallest derivation depth of every NT
+    in a grammar. Shortest outputs are given by the grammar (see
+    Grammar.set_NT_yields), while depths are found with a fixed point
+    iteration over all production choices.
+
+    :param grammar: An instance of the representation.grammar.Grammar class.
+    :return: A dictionary of the shortest output of each NT, and a
+    dictionary of the smallest derivation depth of each NT. NTs which can
+    never terminate have a value of infinity in both.
+    """
+
+    lengths = {NT: grammar.NT_min_length.get(NT, INFINITY) for NT in
+               grammar.rules}
+    depths = {NT: INFINITY for NT in grammar.rules}
+
+    changed = True
+
+    while changed:
+        # Keep updating NTs until no NT can be improved.
+        changed = False
+
+        for NT, rule in grammar.rules.items():
+            for choice in rule['choices']:
+                depth = get_choice_depth(choice, depths)
+
+                if depth < depths[NT]:
+                    depths[NT], changed = depth, True
+
+    return lengths, depths
+
+
+def get_choice_yield(choice, lengths):
+    """
+    Find the shortest output of a production choice.
+
+    :param choice: A production choice of a rule in the grammar.
+    :param lengths: A dictionary of the shortest output of each NT.
+    :return: The length of the shortest output of the choice.
+    """
+
+    return sum([lengths[symbol["symbol"]] if symbol["type"] == "NT" else
+                len(symbol["symbol"]) for symbol in choice['choice']])
+
+
+def get_recursive_choices(grammar):
+    """
+    Find all production choices which can derive the NT of their own rule,
+    i.e. the choices which can grow a derivation without limit. A choice is
+    recursive if any of its NTs derives the NT of its rule, i.e. is in the
+    same strongly connected component (see Grammar.set_NT_yields).
+
+    :param grammar: An instance of the representation.grammar.Grammar class.
+    :return: A set of (NT, choice index) tuples.
+    """
+
+    components = grammar.NT_components
+
+    return {(NT, idx) for NT, rule in grammar.rules.items() if NT in
+            components for idx, choice in enumerate(rule['choices']) if any(
+                [components.get(symbol["symbol"]) == components[NT]
+                 for symbol in choice['choice'] if symbol["type"] == "NT"])}
+
+
+def generate_genome(length, rng, lengths, depths, recursive):
+    """
+    Generate a random genome whose phenotype has roughly a given length.
+    Non-terminals are expanded leftmost first, as in
+    algorithm.mapper.map_phenotype_from_genome. While the output so far plus
+    the shortest output of all unexpanded symbols is shorter than the
+    required length, recursive production choices are preferred.
+    After that, only choices of the smallest derivation depth are used, so
+    that the derivation terminates as soon as possible.
+
+    :param length: The required length of the phenotype.
+    :param rng: A source of random numbers, e.g. an instance of
+    random.Random.
+    :param lengths: A dictionary of the shortest output of each NT, see
+    get_min_yields.
+    :param depths: A dictionary of the smallest derivation depth of each
+    NT, see get_min_yields.
+    :param recursive: A set of all recursive production choices, see
+    get_recursive_choices.
+    :return: A genome.
+    """
+
+    grammar = params['BNF_GRAMMAR']
+
+    stack = [grammar.start_rule]
+    genome = []
+
+    # The length of the output so far plus the shortest output of all
+    # symbols on the stack.
+    total = lengths[grammar.start_rule["symbol"]]
+
+    while stack:
+        symbol = stack.pop()
+
+        if symbol["type"] == "T":
+            # Terminals are already counted in the total.
+            continue
+
+        rule = grammar.rules[symbol["symbol"]]
+        total -= lengths[symbol["symbol"]]
+
+        # Only use choices which can terminate.
+        choices = [(idx, choice) for idx, choice in
+                   enumerate(rule['choices']) if
+                   get_choice_yield(choice, lengths) < INFINITY]
+
+        if total + lengths[symbol["symbol"]] < length:
+            # Grow the derivation.
+            choices = [(idx, choice) for idx, choice in choices if
+                       (symbol["symbol"], idx) in recursive] or choices
+
+        else:
+            # Finish the derivation.
+            choice_depths = [get_choice_depth(choice, depths) for _, choice
+                             in choices]
+            choices = [choices[i] for i, depth in enumerate(choice_depths)
+                       if depth == min(choice_depths)]
+
+        idx, choice = rng.choice(choices)
+
+        # Any codon which selects the choice may be used.
+        genome.append(idx + rule['no_choices'] * rng.randrange(
+            CODON_SIZE // rule['no_choices'] or 1))
+
+        total += get_choice_yield(choice, lengths)
+        stack.extend(reversed(choice['choice']))
+
+    return genome
+
+
+def get_choice_depth(choice, depths):
+    """
+    Find the smallest derivation depth of a production choice.
+
+    :param choice: A production choice of a rule in the grammar.
+    :param depths: A dictionary of the smallest derivation depth of each NT.
+    :return: The smallest derivation depth of the choice.
+    """
+
+    return 1 + max([depths[symbol["symbol"]] for symbol in choice['choice']
+                    if symbol["type"] == "NT"], default=0)
+
+
+def generate_targets(lengths, number, rng, tolerance=0.1, attempts=50):
+    """
+    Generate target strings of controlled lengths for the currently loaded
+    grammar by mapping random genomes.
+
+    :param lengths: A list of the required lengths of the target strings.
+    :param number: The number of target strings of each length.
+    :param rng: A source of random numbers, e.g. an instance of
+    random.Random.
+    :param tolerance: The allowed difference between the length of a target
+    string and the required length, as a fraction of the required length.
+    :param attempts: The number of genomes to try for each target string.
+    The closest target string is used if none are within the tolerance.
+    :return: A list of dictionaries holding the required length, target
+    string and genome of each target.
+    """
+
+    min_lengths, min_depths = get_min_yields(params['BNF_GRAMMAR'])
+    recursive = get_recursive_choices(params['BNF_GRAMMAR'])
+
+    targets = []
+
+    for length in lengths:
+        for _ in range(number):
+            best = None
+
+            for _ in range(attempts):
+                genome = generate_genome(length, rng, min_lengths,
+                                         min_depths, recursive)
+                target, _ = map_phenotype_from_genome(genome)
+
+                if target is None:
+                    continue
+
+                if best is None or abs(len(target) - length) < \
+                        abs(len(best[0]) - length):
+                    best = (target, genome)
+
+                if abs(len(target) - length) <= tolerance * length:
+                    break
+
+            if best is not None:
+                targets.append({"length": length, "target": best[0],
+                                "genome": best[1]})
+
+    return targets
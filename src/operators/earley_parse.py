@@ -0,0 +1,232 @@
+from representation import individual, tree
+from utilities.representation.check_methods import generate_codon
+from utilities.stats.parse_stats import timed
+
+
+def earley_parse(session):
+    """
+    Parse the target string of a parse session with an Earley chart parser
+    over the grammar of the session, and build a GE individual from the
+    first derivation found.
+
+    :param session: An algorithm.session.ParseSession of the target string.
+    :return: An individual representing the target string if it can be
+    parsed using the grammar, otherwise None.
+    """
+
+    grammar, target = session.grammar, session.target
+    start = grammar.start_rule['symbol']
+
+    with timed(session.stats, "chart"):
+        chart, completed, productions = earley_chart(target, grammar)
+
+    if session.stats is not None:
+        session.stats.count("chart_items", sum([len(items) for items in
+                                                chart]))
+
+    if (start, 0) not in completed[len(target)]:
+        # The target string cannot be derived from the grammar.
+        return None
+
+    # Build a derivation tree for the target string.
+    with timed(session.stats, "solution"):
+        ind_tree = build_tree(chart, productions,
+                              completed[len(target)][(start, 0)],
+                              len(target), grammar, session.rng)
+
+    # Generate individual that represents the solution.
+    return individual.Individual(None, ind_tree, grammar)
+
+
+def earley_chart(target, grammar):
+    """
+    Fill the Earley chart of a target string over a grammar.
+
+    Each chart entry is an Earley item of the form
+
+        (NT, choice index, dot, origin)
+
+    where the choice index is an index into the distinct production choices
+    of the NT (see Grammar.set_distinct_choices), so that duplicated
+    production choices are only predicted once.
+
+    stored at the position on the target string up to which the item has
+    been matched. Terminals are matched as whole substrings of the target,
+    so scanning a terminal advances an item by the length of that terminal.
+    Every item keeps a single back-pointer to the item it was advanced from,
+    which is enough to rebuild one complete derivation tree. Parsing is
+    O(n^3) in the length of the target in the worst case, and close to
+    linear on unambiguous grammars.
+
+    :param target: A target string.
+    :param grammar: An instance of the representation.grammar.Grammar class.
+    :return: chart, a list of dictionaries mapping the items at each
+             position on the target string to their back-pointers,
+             completed, a list of dictionaries mapping each (NT, origin)
+             pair completed at each position to its completed item,
+             productions, the compact production choices of the grammar.
+    """
+
+    start = grammar.start_rule['symbol']
+    productions = get_productions(grammar)
+
+    # One chart per position on the target string. Each chart maps an item
+    # to its back-pointer, and records completed items and items waiting on
+    # a given NT.
+    chart = [{} for _ in range(len(target) + 1)]
+    completed = [{} for _ in range(len(target) + 1)]
+    waiting = [{} for _ in range(len(target) + 1)]
+
+    # Seed the first chart with all production choices of the start rule.
+    worklist = []
+    for choice_idx in range(len(productions[start])):
+        add_item(chart[0], worklist, (start, choice_idx, 0, 0), None)
+
+    for pos in range(len(target) + 1):
+        # Process all items at each position on the target string in turn.
+
+        if pos > 0:
+            # Items at this position were added by earlier scans.
+            worklist = list(chart[pos].keys())
+
+        while worklist:
+            item = worklist.pop()
+            NT, choice_idx, dot, origin = item
+            symbols = productions[NT][choice_idx]
+
+            if dot == len(symbols):
+                # Completer: this item matches the target string from its
+                # origin up to the current position.
+
+                if (NT, origin) in completed[pos]:
+                    # This NT has already been completed over this span.
+                    continue
+
+                completed[pos][(NT, origin)] = item
+
+                for parent in waiting[origin].get(NT, []):
+                    # Advance every item which was waiting on this NT.
+                    new_item = (parent[0], parent[1], parent[2] + 1,
+                                parent[3])
+                    add_item(chart[pos], worklist, new_item,
+                             (origin, parent, item))
+
+            else:
+                symbol, is_NT = symbols[dot]
+
+                if is_NT:
+                    # Predictor: add all production choices of this NT.
+                    waiting[pos].setdefault(symbol, []).append(item)
+
+                    for new_choice in range(len(productions[symbol])):
+                        add_item(chart[pos], worklist,
+                                 (symbol, new_choice, 0, pos), None)
+
+                    if (symbol, pos) in completed[pos]:
+                        # This NT has already been completed over an
+                        # empty span at this position.
+                        new_item = (NT, choice_idx, dot + 1, origin)
+                        add_item(chart[pos], worklist, new_item,
+                                 (pos, item, completed[pos][(symbol, pos)]))
+
+                elif target.startswith(symbol, pos):
+                    # Scanner: this terminal matches the target string at
+                    # the current position.
+                    end = pos + len(symbol)
+                    new_item = (NT, choice_idx, dot + 1, origin)
+
+                    if end == pos:
+                        # Empty terminal, advance in the current chart.
+                        add_item(chart[pos], worklist, new_item,
+                                 (pos, item, None))
+
+                    elif new_item not in chart[end]:
+                        chart[end][new_item] = (pos, item, None)
+
+    return chart, completed, productions
+
+
+def add_item(chart, worklist, item, back_pointer):
+    """
+    Add an Earley item to a chart if it is not already there.
+
+    :param chart: The chart for the current position on the target string.
+    :param worklist: The list of items at the current position which have
+    yet to be processed.
+    :param item: A new Earley item.
+    :param back_pointer: The back-pointer of the new item.
+    :return: Nothing.
+    """
+
+    if item not in chart:
+        chart[item] = back_pointer
+        worklist.append(item)
+
+
+def get_productions(grammar):
+    """
+    Generate a compact list of the distinct production choices for each NT
+    in the grammar, where each production choice is a list of (symbol,
+    is_NT) pairs.
+
+    :param grammar: An instance of the representation.grammar.Grammar class.
+    :return: A dictionary of distinct production choices for each NT.
+    """
+
+    return {NT: [[(sym['symbol'], sym['type'] == "NT") for sym in
+                  choice['choice']] for choice in choices]
+            for NT, choices in grammar.distinct_choices.items()}
+
+
+def build_tree(chart, productions, item, end, grammar, rng=None):
+    """
+    Given a completed Earley item, follow back-pointers through the chart
+    to build the derivation tree of that item. Codons are generated for
+    each node from the chosen production choice.
+
+    :param chart: The full Earley chart.
+    :param productions: The compact production choices of the grammar.
+    :param item: A completed Earley item.
+    :param end: The position on the target string at which the item ends.
+    :param grammar: An instance of the representation.grammar.Grammar class.
+    :param rng: A random.Random instance for picking codons of duplicated
+    production choices. The lowest choice index is used if not set.
+    :return: A derivation tree, i.e. an instance of the
+    representation.tree.Tree class.
+    """
+
+    choices = grammar.distinct_choices
+
+    root = tree.Tree(item[0], None)
+    stack = [(root, item, end)]
+
+    while stack:
+        # Expand nodes depth-first without recursion, since derivations
+        # can be as deep as the target string is long.
+        node, item, end = stack.pop()
+        NT, choice_idx = item[0], item[1]
+
+        # Generate a codon for this choice.
+        node.codon = generate_codon(NT, choices[NT][choice_idx]['choice'],
+                                    grammar, rng)
+
+        children = []
+
+        while item[2] > 0:
+            # Walk back over the items which led to this completed item,
+            # collecting children in reverse order.
+            prev_pos, prev_item, child_item = chart[end][item]
+            symbol = productions[NT][choice_idx][prev_item[2]][0]
+
+            child = tree.Tree(symbol, node)
+            children.append(child)
+
+            if child_item is not None:
+                # Child is a NT, expand it later.
+                stack.append((child, child_item, end))
+
+            item, end = prev_item, prev_pos
+
+        node.children = list(reversed(children))
+
+    return root
@@ -0,0 +1,112 @@
+from operators.earley_parse import earley_chart
+from operators.subtree_parse import generate_key
+from representation.forest import Forest
+
+
+def forest_parse(session):
+    """
+    Parse the target string of a parse session with an Earley chart parser
+    over the grammar of the session, and build a shared packed parse forest
+    of all derivations of the target string.
+
+    The Earley chart records every NT which has been completed over every
+    span of the target string. Starting from the start rule over the whole
+    target, each node of the forest is expanded by matching each distinct
+    production choice of its NT against its span, using only completed
+    spans for NT children. Only nodes which are used by some derivation of
+    the target string are added to the forest.
+
+    :param session: An algorithm.session.ParseSession of the target string.
+    :return: A representation.forest.Forest instance, or None if the target
+    string cannot be derived from the grammar.
+    """
+
+    grammar, target = session.grammar, session.target
+    start = grammar.start_rule['symbol']
+
+    chart, completed, productions = earley_chart(target, grammar)
+
+    if (start, 0) not in completed[len(target)]:
+        # The target string cannot be derived from the grammar.
+        return None
+
+    # The ends of all spans over which each NT has been completed from each
+    # start position.
+    ends = {}
+    for end, entries in enumerate(completed):
+        for NT, origin in entries:
+            ends.setdefault((origin, NT), set()).add(end)
+
+    forest = Forest(grammar, target, generate_key(grammar, 0, len(target),
+                                                  start))
+
+    seen, worklist = {forest.root}, [forest.root]
+
+    while worklist:
+        # Expand every node reachable from the root.
+        key = worklist.pop()
+        NT = grammar.NT_names[key[2]]
+
+        alternatives = []
+
+        for choice_idx, symbols in enumerate(productions[NT]):
+            for children in match_production(grammar, target, symbols,
+                                             key[0], key[1], ends):
+                alternatives.append((choice_idx, children))
+
+                for child in children:
+                    if child[2] != -1 and child not in seen:
+                        seen.add(child)
+                        worklist.append(child)
+
+        forest.nodes[key] = alternatives
+
+    return forest
+
+
+def match_production(grammar, target, symbols, start, end, ends):
+    """
+    Find every way in which a production choice can derive a span of the
+    target string.
+
+    :param grammar: An instance of the representation.grammar.Grammar class.
+    :param target: A target string.
+    :param symbols: A compact production choice, i.e. a list of (symbol,
+    is_NT) pairs.
+    :param start: The start index of the span on the target string.
+    :param end: The end index of the span on the target string.
+    :param ends: The ends of all completed spans of each NT from each start
+    position.
+    :return: A list of tuples of the keys of the children of each match.
+    """
+
+    # Partial matches, as the position up to which the production has been
+    # matched and the keys of the children matched so far.
+    partial = [(start, ())]
+
+    for position, (symbol, is_NT) in enumerate(symbols):
+        last = position == len(symbols) - 1
+        new_partial = []
+
+        for pos, children in partial:
+
+            if is_NT:
+                child_ends = ends.get((pos, symbol), ())
+
+                if last:
+                    # The final symbol must finish the span.
+                    child_ends = [end] if end in child_ends else []
+
+                for child_end in sorted(child_ends):
+                    if child_end <= end:
+                        new_partial.append((child_end, children + (
+                            generate_key(grammar, pos, child_end, symbol),)))
+
+            elif target.startswith(symbol, pos) and \
+                    pos + len(symbol) <= end:
+                new_partial.append((pos + len(symbol), children + (
+                    generate_key(grammar, pos, pos + len(symbol)),)))
+
+        partial = new_partial
+
+    return [children for pos, children in partial if pos == end]
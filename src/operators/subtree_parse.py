@@ -1,56 +1,83 @@
-import re
 from copy import copy
 from itertools import zip_longest
+from sys import getsizeof
 
-from algorithm.parameters import params
 from representation import individual, tree
-from utilities.representation.check_methods import get_output, generate_codon
-from utilities.stats import trackers
+from representation.derivation import Derivation
+from utilities.representation.check_methods import generate_codon
+from utilities.stats.parse_stats import timed
 
 
-def combine_snippets():
+def combine_snippets(session):
     """
     As the snippets repository grows, we can start to combine
     neighboring snippets to build bigger snippets. Eventually we hope this
     can just build the perfect solution. Iteratively builds snippets until
     no more snippets can be built form the current library.
 
+    :param session: The parse session, see algorithm.session.ParseSession.
     :return: Nothing.
     """
 
+    if session.config['INCREMENTAL']:
+        # Only reduce new snippets on each pass.
+        combine_new_snippets(session)
+        return
+
+    stats = session.stats
+
     # Find the number of snippets at T.
-    original_snippets = sorted(trackers.snippets.keys())
-    
+    original_snippets = sorted(session.snippets.keys())
+
+    if stats is not None:
+        stats.start_pass()
+
     # Perform first pass of reduction.
-    reduce_trees()
+    with timed(session.stats, "reduce"):
+        reduce_trees(session)
 
     # Delete obsolete snippets.
-    remove_old_snippets()
+    with timed(session.stats, "remove"):
+        remove_old_snippets(session)
     
     # Get new snippets list.
-    updated_snippets = sorted(trackers.snippets.keys())
-    
+    updated_snippets = sorted(session.snippets.keys())
+
+    if stats is not None:
+        stats.end_pass(total=len(updated_snippets),
+                       deleted=len(session.snippets.deleted))
+
     # Initialise counter for reduction interations.
     no_passes = 1
 
-    if not params['SILENT']:
+    if not session.config['SILENT']:
         print("1 pass  \tOriginal:", len(original_snippets),
-              "\tNew:", len(updated_snippets), "\tDeleted:", len(trackers.deleted_snippets))
+              "\tNew:", len(updated_snippets),
+              "\tDeleted:", len(session.snippets.deleted))
 
     while updated_snippets != original_snippets:
         # Keep reducing snippets until no more reductions can be made.
 
         # Save old T+1
         pre_updated_snippets = copy(updated_snippets)
-        
+
+        if stats is not None:
+            stats.start_pass()
+
         # Perform reduction.
-        reduce_trees()
+        with timed(session.stats, "reduce"):
+            reduce_trees(session)
 
         # Delete obsolete snippets.
-        remove_old_snippets()
+        with timed(session.stats, "remove"):
+            remove_old_snippets(session)
 
         # Get new snippets list.
-        updated_snippets = sorted(trackers.snippets.keys())
+        updated_snippets = sorted(session.snippets.keys())
+
+        if stats is not None:
+            stats.end_pass(total=len(updated_snippets),
+                           deleted=len(session.snippets.deleted))
 
         # Set new T as old T+1
         original_snippets = pre_updated_snippets
@@ -58,41 +85,121 @@ def combine_snippets():
         # Increment counter
         no_passes += 1
 
-        if not params['SILENT']:
+        if not session.config['SILENT']:
             print(no_passes, "passes\tOriginal:",
                   len(original_snippets), "\tNew:", len(updated_snippets),
-                  "\tDeleted:", len(trackers.deleted_snippets))
+                  "\tDeleted:", len(session.snippets.deleted))
+
+    session.passes = no_passes
 
 
-def reduce_trees():
+def combine_new_snippets(session, seeds=None):
+    """
+    Incremental version of combine_snippets. Each pass only attempts
+    reductions seeded by the snippets which were created on the previous
+    pass, combining them with any snippets in the repository. Reductions
+    between older snippets have already been attempted, so the cost of a
+    pass grows with the number of new snippets rather than with the size of
+    the repository. Stops when a pass creates no new snippets.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param seeds: A sorted list of keys of the snippets with which to seed
+    the first pass. All snippets are used if not set.
+    :return: Nothing.
+    """
+
+    if seeds is None:
+        # Seed the first pass with all snippets.
+        seeds = sorted(session.snippets.keys())
+
+    session.snippets.pop_created()
+
+    stats = session.stats
+
+    # Nodes whose sub-trees have been checked for obsolete snippets on any
+    # pass. Sub-trees never change once built, so each is only checked once.
+    visited = set()
+
+    # Initialise counter for reduction interations.
+    no_passes = 0
+
+    while seeds:
+        # Keep reducing snippets until no more reductions can be made.
+
+        if stats is not None:
+            stats.start_pass()
+            stats_seeds = len(seeds)
+
+        # Perform reduction.
+        with timed(session.stats, "reduce"):
+            reduce_trees(session, seeds)
+
+        # Find all snippets created on this pass.
+        created = session.snippets.pop_created()
+
+        # Delete obsolete snippets. Only new snippets can have made
+        # other snippets obsolete.
+        with timed(session.stats, "remove"):
+            remove_old_snippets(session, created, visited)
+
+        # Seed the next pass with the new snippets which were not deleted.
+        seeds = sorted([key for key in created if key in session.snippets])
+
+        if stats is not None:
+            stats.end_pass(seeds=stats_seeds, created=len(created),
+                           total=len(session.snippets),
+                           deleted=len(session.snippets.deleted))
+
+        # Increment counter
+        no_passes += 1
+
+        if not session.config['SILENT']:
+            print(no_passes, "passes\tTotal:", len(session.snippets),
+                  "\tNew:", len(seeds),
+                  "\tDeleted:", len(session.snippets.deleted))
+
+    session.passes = no_passes
+
+
+def reduce_trees(session, seeds=None):
     """
     Iterates through all snippets in the snippets dictionary and reduces
     snippets to make larger snippets.
 
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param seeds: A sorted list of keys of the snippets from which to start
+    reductions. All snippets are used if not set.
     :return: Nothing.
     """
 
     # Get list of all reduction NTs.
-    reduce_NTs = params['BNF_GRAMMAR'].concat_NTs
+    reduce_NTs = session.grammar.concat_NTs
+
+    # Get ancestors of all NTs through unit production choices.
+    climb_NTs = session.grammar.climb_NTs
 
-    # Sort snippets keys.
-    sorted_keys = sorted([[get_num_from_str(snippet),
-                           get_NT_from_str(snippet),
-                           snippet] for snippet in trackers.snippets.keys()])
+    # Get interned ids of all NTs.
+    NT_ids = session.grammar.NT_ids
+    NT_names = session.grammar.NT_names
+
+    if seeds is None:
+        # Sort snippets keys.
+        seeds = sorted(session.snippets.keys())
 
     # Iterate over all snippets.
-    for snippet_info in sorted_keys:
-        # print(snippet_info)
-        
-        # Get current snippet.
-        snippet = snippet_info[2]
+    for snippet in seeds:
 
-        # Find current snippet info.
-        NT = snippet_info[1]
+        if snippet not in session.snippets:
+            # Snippet has been deleted.
+            continue
 
-        # Get indexes of the current snippet
-        indexes = snippet_info[0]
-        start, end = indexes[0], indexes[1]
+        # Get indexes and root NT of the current snippet.
+        start, end, NT = snippet[0], snippet[1], NT_names[snippet[2]]
+
+        if NT in climb_NTs:
+            # Add snippets for all ancestors of the current snippet through
+            # unit production choices.
+            climb_snippet(session, snippet)
 
         # Find if the snippet root (NT) exists anywhere in the
         # reduction NTs.
@@ -106,13 +213,9 @@ def reduce_trees():
                 NTs = reduce[2]
 
                 if len(NTs) == 1:
-                    # This choice leads directly to the parent, check if parent
-                    # snippet already exists.
-
-                    # Child is current snippet.
-                    child = [[snippet, trackers.snippets[snippet]]]
-                    
-                    generate_key_and_check(start, end, reduce, child)
+                    # This choice leads directly to the parent, which has
+                    # already been added with all other ancestors.
+                    continue
 
                 else:
                     # Find the index of the snippet root in the current
@@ -121,7 +224,12 @@ def reduce_trees():
 
                     for loc in NT_locs:
                         # We want to check each possible reduction option.
-                        # if speck:
+
+                        if not fits_reduction(session, start, end,
+                                              reduce[3][loc]):
+                            # The rest of the production choice can't fit
+                            # around the current snippet.
+                            continue
     
                         # Set where the original snippet starts and ends on
                         # the target string.
@@ -136,7 +244,7 @@ def reduce_trees():
                             # something before it.
                             break
     
-                        elif end == len(params['TARGET']) and loc != \
+                        elif end == len(session.target) and loc != \
                                 NT_locs[-1]:
                             # The current snippet is at the end of the target
                             # string, but we are trying to reduce_trees it with
@@ -159,7 +267,7 @@ def reduce_trees():
                         children = [[] for _ in range(len(NTs))]
     
                         # Set original snippet into children.
-                        children[loc] = [snippet, trackers.snippets[snippet]]
+                        children[loc] = [snippet, session.snippets[snippet]]
     
                         # Generate ordered list of alternating indexes of Ts
                         # and NTs to reduce_trees with a given original NT.
@@ -211,20 +319,23 @@ def reduce_trees():
                                         # Get portion of target string to match.
                                         end_point = aft + len(check)
     
-                                        target = params['TARGET'][aft:end_point]
+                                        target = session.target[aft:end_point]
     
                                         if target == check:
                                             # The current terminal matches the same
                                             # location on the target string.
     
                                             # Generate fake key for snippets dict.
-                                            key = str([aft, end_point])
+                                            key = generate_key(
+                                                session.grammar, aft,
+                                                end_point)
     
                                             # Increment aft phenotype counter.
                                             aft += len(check)
     
                                             # Create new tree from this terminal.
-                                            T_tree = tree.Tree(check, None)
+                                            T_tree = create_terminal_child(
+                                                session, check)
     
                                             # Add to children.
                                             children[child_idx] = [key, T_tree]
@@ -243,9 +354,9 @@ def reduce_trees():
         
                                         # Find all potential snippets which
                                         # match our criteria.
-                                        matches = [v for v in sorted_keys if
-                                                   v[0][0] == aft and
-                                                   v[1] == child[0]]
+                                        child_id = NT_ids[child[0]]
+                                        matches = session.snippets.starting_at(
+                                            aft, child_id)
     
                                         # Create a copy of this marker otherwise
                                         # each match will over-write it.
@@ -254,17 +365,14 @@ def reduce_trees():
                                         for match in matches:
                                             # Iterate over all potential matches.
 
-                                            # Calculate length of match string.
-                                            str_len = match[0]
-    
                                             # Increment appropriate phenotype
                                             # counter.
-                                            aft_c = aft + str_len[1] - str_len[0]
+                                            aft_c = aft + match[1] - match[0]
     
                                             # Add to children.
-                                            children[child_idx] = [match[2],
-                                                              trackers.snippets[
-                                                                  match[2]]]
+                                            children[child_idx] = [match,
+                                                              session.snippets[
+                                                                  match]]
     
                                             if alt_cs:
                                                 # Recurse to find the next piece of
@@ -289,7 +397,7 @@ def reduce_trees():
                                         # Get portion of target string to match.
                                         start_point = pre - len(check)
     
-                                        target = params['TARGET'][
+                                        target = session.target[
                                                  start_point:pre]
     
                                         if target == check:
@@ -297,13 +405,16 @@ def reduce_trees():
                                             # location on the target string.
     
                                             # Generate fake key for snippets dict.
-                                            key = str([start_point, pre])
+                                            key = generate_key(
+                                                session.grammar, start_point,
+                                                pre)
     
                                             # Increment pre phenotype counter.
                                             pre -= len(check)
     
                                             # Create new tree from this terminal.
-                                            T_tree = tree.Tree(check, None)
+                                            T_tree = create_terminal_child(
+                                                session, check)
     
                                             # Add to children.
                                             children[child_idx] = [key, T_tree]
@@ -322,9 +433,9 @@ def reduce_trees():
     
                                         # Find all potential snippets which
                                         # match our criteria.
-                                        matches = [v for v in sorted_keys if
-                                                   v[0][1] == pre and
-                                                   v[1] == child[0]]
+                                        child_id = NT_ids[child[0]]
+                                        matches = session.snippets.ending_at(
+                                            pre, child_id)
     
                                         # Create a copy of this marker otherwise
                                         # each match will over-write it.
@@ -333,17 +444,14 @@ def reduce_trees():
                                         for match in matches:
                                             # Iterate over all potential matches.
 
-                                            # Calculate length of match string.
-                                            str_len = match[0]
-    
                                             # Increment appropriate phenotype
                                             # counter.
-                                            pre_c = pre - str_len[1] + str_len[0]
+                                            pre_c = pre - match[1] + match[0]
     
                                             # Add to children.
-                                            children[child_idx] = [match[2],
-                                                              trackers.snippets[
-                                                                  match[2]]]
+                                            children[child_idx] = [match,
+                                                              session.snippets[
+                                                                  match]]
     
                                             if alt_cs:
                                                 # Recurse to find the next piece of
@@ -375,7 +483,7 @@ def reduce_trees():
                                             start_point = pre - len(check)
                                             end_point = pre
     
-                                        target = params['TARGET'][
+                                        target = session.target[
                                                  start_point:end_point]
     
                                         if target == check:
@@ -395,10 +503,13 @@ def reduce_trees():
                                                 pre -= len(check)
     
                                             # Generate fake key for snippets dict.
-                                            key = str([start_point, end_point])
+                                            key = generate_key(
+                                                session.grammar, start_point,
+                                                end_point)
     
                                             # Create new tree from this terminal.
-                                            T_tree = tree.Tree(check, None)
+                                            T_tree = create_terminal_child(
+                                                session, check)
     
                                             # Add to children.
                                             children[child_idx] = [key, T_tree]
@@ -415,18 +526,18 @@ def reduce_trees():
                                         # which can be reduced to the current
                                         # block.
 
+                                        child_id = NT_ids[child[0]]
+
                                         # Get portion of target string to match.
                                         if child_idx > loc:
                                             # This NT comes after the original NT.
-                                            matches = [v for v in sorted_keys if
-                                                       v[0][0] == aft and
-                                                       v[1] == child[0]]
+                                            matches = session.snippets.\
+                                                starting_at(aft, child_id)
     
                                         else:
                                             # This NT comes before the original NT.
-                                            matches = [v for v in sorted_keys if
-                                                       v[0][1] == pre and
-                                                       v[1] == child[0]]
+                                            matches = session.snippets.\
+                                                ending_at(pre, child_id)
     
                                         # Create copies of this markers otherwise
                                         # each match will over-write them.
@@ -435,25 +546,22 @@ def reduce_trees():
                                         for match in matches:
                                             # Iterate over all potential matches.
 
-                                            # Calculate length of match string.
-                                            str_len = match[0]
-    
                                             # Increment appropriate phenotype
                                             # counter.
                                             if child_idx > loc:
                                                 # This NT comes after the original
                                                 # NT.
-                                                aft_c = aft + str_len[1] - str_len[0]
+                                                aft_c = aft + match[1] - match[0]
     
                                             else:
                                                 # This NT comes before the original
                                                 # NT.
-                                                pre_c = pre - str_len[1] + str_len[0]
+                                                pre_c = pre - match[1] + match[0]
     
                                             # Add to children.
-                                            children[child_idx] = [match[2],
-                                                              trackers.snippets[
-                                                                  match[2]]]
+                                            children[child_idx] = [match,
+                                                              session.snippets[
+                                                                  match]]
     
                                             if alt_cs:
                                                 # Recurse to find the next piece of
@@ -466,18 +574,140 @@ def reduce_trees():
                                 # We have compiled a full set of potneital
                                 # children to reduce_trees. Generate a key and check
                                 # if it exists.
-                                generate_key_and_check(pre, aft, reduce,
-                                                       children)
+                                generate_key_and_check(session, pre, aft,
+                                                       reduce, children)
     
                         # Check whether a reduction can be performed.
                         check_reductions(alt_cs, pre, aft, 0, children)
 
 
-def generate_key_and_check(pre, aft, reduce, children):
+def climb_snippet(session, key):
+    """
+    Add snippets for every ancestor of a snippet which can be reached
+    through unit production choices, i.e. production choices which consist
+    of a single NT, all at once rather than one per reduction pass. See
+    Grammar.set_unit_closure. Each ancestor is reached through any unit
+    reduction from a snippet which has been climbed to, so it is only left
+    out if the snippets below it on every route have been deleted.
+    Ancestors whose snippets have been deleted are not added again.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param key: The key of a snippet in the session.snippets dictionary.
+    :return: Nothing.
+    """
+
+    grammar = session.grammar
+    start, end = key[0], key[1]
+
+    # Keys of the snippets of the NTs climbed so far.
+    keys = {grammar.NT_names[key[2]]: key}
+
+    remaining = grammar.climb_NTs[grammar.NT_names[key[2]]]
+
+    while remaining:
+        # Ancestors which can't be reached yet may be reached from ancestors
+        # further up once those have been climbed to, e.g. around a unit
+        # cycle.
+        skipped = []
+
+        for ancestor, path, reductions in remaining:
+            new_key = generate_key(grammar, start, end, ancestor)
+
+            if new_key in session.snippets:
+                # Ancestor snippet already exists.
+                keys[ancestor] = new_key
+                continue
+
+            if new_key in session.snippets.deleted:
+                # Ancestor snippet has already been made and deleted.
+                if session.stats is not None:
+                    session.stats.count("tombstone_hits")
+                continue
+
+            # Find a unit reduction from a snippet which has been climbed to.
+            reduce = next((reduce for reduce in reductions if
+                           reduce[2][0][0] in keys), None)
+
+            if reduce is None:
+                # The child snippets of the ancestor have been deleted.
+                skipped.append((ancestor, path, reductions))
+                continue
+
+            child = keys[reduce[2][0][0]]
+            generate_key_and_check(session, start, end, reduce,
+                                   [[child, session.snippets[child]]])
+
+            if new_key in session.snippets:
+                keys[ancestor] = new_key
+
+        if len(skipped) == len(remaining):
+            # No more ancestors can be reached.
+            break
+
+        remaining = skipped
+
+
+def fits_target(session, key):
+    """
+    Check whether a snippet can be part of a complete solution, i.e.
+    whether the target string can continue before and after it. See
+    Grammar.set_NT_neighbours. A snippet which doesn't fit the target
+    string can only be reduced into snippets which don't fit it either, so
+    such snippets are never made. For example, in letter.bnf a <string>
+    snippet can only be part of a solution if it starts at the start of
+    the target string.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param key: A snippet key.
+    :return: False if the snippet can't be part of a solution.
+    """
+
+    before, after = session.grammar.NT_neighbours[
+        session.grammar.NT_names[key[2]]]
+
+    return (before or key[0] == 0) and \
+        (after or key[1] == len(session.target))
+
+
+def fits_reduction(session, start, end, bounds):
+    """
+    Check whether a snippet can be reduced at a given position of a
+    production choice, i.e. whether the rest of the production choice can
+    fit around the snippet on the target string. See
+    Grammar.set_reduction_bounds.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param start: The start index of the snippet on the target string.
+    :param end: The end index of the snippet on the target string.
+    :param bounds: The bounds of the position of the snippet in the
+    production choice, as a (min before, min after, chars before, chars
+    after) tuple.
+    :return: False if the reduction can't be made.
+    """
+
+    min_before, min_after, before, after = bounds
+    target = session.target
+
+    if start < min_before or len(target) - end < min_after or \
+            (before is not None and target[start - 1] not in before) or \
+            (after is not None and target[end] not in after):
+        # The target string around the snippet can't be derived by the
+        # rest of the production choice.
+        if session.stats is not None:
+            session.stats.count("reductions_pruned")
+
+        return False
+
+    return True
+
+
+def generate_key_and_check(session, pre, aft, reduce, children):
     """
     Will generate a snippet key and check if it exists in the repository. If
-    snippet is not in the repository, adds it.
+    snippet is not in the repository, and it can be part of a solution,
+    adds it.
 
+    :param session: The parse session, see algorithm.session.ParseSession.
     :param pre: The start index of the overall snippet on the target string.
     :param aft: The end index of the overall snippet on the target string.
     :param reduce: The information necessary to reduce_trees a list of snippets.
@@ -489,144 +719,738 @@ def generate_key_and_check(pre, aft, reduce, children):
     """
 
     if pre is None:
-        pre = get_num_from_str(children[0][0])[0]
+        pre = children[0][0][0]
 
     if aft is None:
-        aft = get_num_from_str(children[-1][0])[1]
+        aft = children[-1][0][1]
 
     # Generate key for proposed reduction
-    new_key = " ".join([str([pre, aft]), reduce[1]])
+    new_key = generate_key(session.grammar, pre, aft, reduce[1])
 
-    if new_key in trackers.snippets or new_key in trackers.deleted_snippets:
+    if session.stats is not None:
+        session.stats.count("reductions_attempted")
+
+    if new_key in session.snippets:
         # No need to reduce_trees as a perfectly good
         # solution already exists.
         pass
 
-    else:
-        # Create list of children.
-        children = [i[1] for i in children]
+    elif new_key in session.snippets.deleted:
+        # The snippet has already been made and deleted.
+        if session.stats is not None:
+            session.stats.count("tombstone_hits")
 
+    elif not fits_target(session, new_key):
+        # The snippet can never be part of a solution.
+        if session.stats is not None:
+            session.stats.count("reductions_pruned")
+
+    else:
         # We can generate a new snippet by reducing
         # two existing snippets.
-        create_snippet(reduce[1], children, reduce[0], new_key)
+        create_snippet(session, reduce[1], children, reduce[0], new_key)
+
+        if session.stats is not None:
+            session.stats.count("reductions_succeeded")
      
     return new_key, pre, aft
 
 
-def remove_old_snippets():
+def remove_old_snippets(session, keys=None, visited=None):
     """
     Iterate over the snippets repository and remove snippets which are
     sub-trees of larger snippets as these snippets are useless now.
 
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param keys: Keys of the snippets whose sub-trees are to be checked. All
+    snippets are checked if not set.
+    :param visited: A set of ids of nodes whose sub-trees have already been
+    checked, which can be shared between passes. A new set is used if not
+    set.
     :return: Nothing.
     """
 
-    for snippet in sorted(trackers.snippets.keys()):
+    if keys is None:
+        keys = session.snippets.keys()
+
+    if visited is None:
+        # Sub-trees are shared between snippets. Track the ids of nodes
+        # which have already been checked so each is only checked once.
+        visited = set()
+
+    for snippet in sorted(keys):
         # Iterate over all snippets.
         
-        if snippet in trackers.snippets:
-            delete_snippet(trackers.snippets[snippet])
+        if snippet in session.snippets:
+            delete_snippet(session, session.snippets[snippet], visited)
 
 
-def delete_snippet(self):
+def delete_snippet(session, node, visited=None):
     """
     Given a tree structure, dive down through the tree recursively and delete
     all child snippets.
     
-    :param self: A parse tree.
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param node: A parse tree.
+    :param visited: A set of ids of nodes whose sub-trees have already been
+    checked. The sub-trees of these nodes are skipped.
     :return: Nothing.
     """
-    
-    if self.parent and self.snippet and self.snippet in trackers.snippets and \
-        len(params['BNF_GRAMMAR'].concat_NTs[self.root]) == 1:
+
+    if node.snippet in session.snippets.deleted:
+        # The sub-tree of a deleted snippet was checked when it was deleted.
+        return
+
+    if node.parent and node.snippet and node.snippet in session.snippets and \
+        len(session.grammar.concat_NTs[node.root]) == 1:
         # Delete this snippet as it's (hopefully) useless now.
 
-        del trackers.snippets[self.snippet]
-        trackers.deleted_snippets.append(self.snippet)
+        del session.snippets[node.snippet]
+
+        if session.stats is not None:
+            session.stats.count("deletions")
+
+    if visited is not None:
+        if id(node) in visited:
+            # The sub-tree of this node has already been checked. The node
+            # itself is always checked, since it may have gained a parent.
+            return
+
+        visited.add(id(node))
             
-    if self.children:
+    if node.children:
         # Recruse through all children.
         
-        for child in self.children:
-            delete_snippet(child)
+        for child in node.children:
+
+            if isinstance(node, Derivation):
+                # Children are stored as snippet keys.
+                child = session.snippets.get_snippet(child)
+
+                if child is None:
+                    # Terminal children have no snippets.
+                    continue
+
+            delete_snippet(session, child, visited)
             
 
-def create_snippet(parent, children, choice, key):
+def create_snippet(session, parent, children, choice, key):
     """
     Given a parent NT and a list of child trees, create a new tree that acts as
     the parent of the given children. Generates this tree as a snippet and
-    adds the new snippet to the trackers.snippets library.
+    adds the new snippet to the session.snippets library.
+
+    If LAZY_SNIPPETS is set in the config of the session, the new snippet is
+    instead stored as back-pointers to the keys of its children (see
+    representation.derivation.Derivation).
 
+    :param session: The parse session, see algorithm.session.ParseSession.
     :param parent: A non-terminal root.
-    :param children: A list of derivation tree instances.
+    :param children: A list of [key, derivation tree] pairs of all children.
     :param choice: The chosen production choice.
-    :param key: A new key for the trackers.snippets dictionary.
+    :param key: A new key for the session.snippets dictionary.
     :return: Nothing.
     """
 
+    if session.stats is not None:
+        session.stats.count("snippets_created")
+
+    if session.config['LAZY_SNIPPETS']:
+        # Store the new snippet as back-pointers to its children.
+        new_tree = Derivation(parent,
+                              generate_codon(parent, choice, session.grammar,
+                                             session.rng),
+                              [child[0] for child in children], key)
+
+        for child in children:
+            if child[1] is not None:
+                # Set the parent of non-terminal children.
+                child[1].parent = key
+
+        # Add new snippet to snippets dictionary
+        session.snippets[key] = new_tree
+
+        return
+
     # Initialise new instance of the tree class to act as new snippet.
     new_tree = tree.Tree(parent, None)
     
     # Generate a codon to match the given production choice.
-    new_tree.codon = generate_codon(parent, choice)
+    new_tree.codon = generate_codon(parent, choice, session.grammar,
+                                    session.rng)
 
     # Save the snippet key of this tree.
     new_tree.snippet = key
     
     # Add the children to the new node
-    for child in children:
+    for _, child in children:
         new_tree.children.append(child)
 
         # Set the parent of the child to the new node
         child.parent = new_tree
 
     # Add new snippet to snippets dictionary
-    trackers.snippets[key] = new_tree
+    session.snippets[key] = new_tree
+
+
+def add_terminal_snippets(session, start=0, end=None, climb=True):
+    """
+    Find all occurrences of all terminals in a portion of the target string
+    in a single pass, and add a snippet to the session.snippets library for
+    every production choice which consists solely of each terminal, along
+    with all of its ancestors through unit production choices. Snippets
+    which are already in the library, or which have been deleted from it,
+    are not added again.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param start: The start index of the portion of the target string.
+    :param end: The end index of the portion of the target string. The end
+    of the target string if not set.
+    :param climb: Whether to add the ancestors of terminal snippets through
+    unit production choices, see climb_snippet.
+    :return: Nothing.
+    """
+
+    terms = session.grammar.terminal_choices
+
+    occurrences = session.grammar.terminal_scanner.find_all(
+        session.target[start:end])
+
+    for idx, T in sorted(occurrences):
+        # Check each occurrence of each terminal in the target string.
+        idx += start
+
+        for NT, index, codon in terms.get(T, []):
+            # Check each rule for which the current T is the entire
+            # production choice.
+
+            # Generate a key for the snippets repository.
+            key = generate_key(session.grammar, idx, idx+len(T), NT)
+
+            if key in session.snippets:
+                # Snippet already exists.
+                continue
+
+            if key in session.snippets.deleted:
+                # Snippet has already been made and deleted.
+                if session.stats is not None:
+                    session.stats.count("tombstone_hits")
+                continue
+
+            if not fits_target(session, key):
+                # Snippet can never be part of a solution.
+                continue
+
+            if session.rng is not None:
+                # Pick a codon for any occurrence of the production choice.
+                codon = session.grammar.get_codon(NT, ((T, "T"),),
+                                                  session.rng)
+
+            # Add snippet to snippets repository.
+            create_terminal_snippet(session, NT, T, codon, key)
+
+            if climb and NT in session.grammar.climb_NTs:
+                # Add snippets for all ancestors of the new snippet through
+                # unit production choices.
+                climb_snippet(session, key)
+
+
+def add_cached_snippets(session, cache):
+    """
+    Seed the session.snippets library with cached derivations of
+    substrings of the target string. The longest cached substrings are used
+    first, and cached substrings never overlap. The root of each cached
+    derivation is added as a snippet, and all of its sub-derivations are
+    added as deleted snippets, since they have already been reduced.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param cache: A representation.snippet_cache.SnippetCache instance.
+    :return: A sorted list of (start, end) spans of the target string which
+    are covered by cached derivations.
+    """
+
+    target, fingerprint = session.target, session.grammar.fingerprint
+
+    occurrences = cache.find_all(fingerprint, target)
+
+    neighbours = session.grammar.NT_neighbours
+
+    covered, spans = [False] * len(target), []
+
+    for idx, substring in sorted(occurrences, key=lambda x: (-len(x[1]),
+                                                             x[0])):
+        # Use the longest cached substrings first.
+        end = idx + len(substring)
+
+        if any(covered[idx:end]):
+            # Overlaps a cached substring which is already used.
+            continue
+
+        # Only use derivations which can be combined with the rest of the
+        # target string.
+        derivations = [derivation for derivation in
+                       cache.get(fingerprint, substring) if
+                       (idx == 0 or neighbours[derivation[0]][0]) and
+                       (end == len(target) or neighbours[derivation[0]][1])]
+
+        if not derivations:
+            continue
+
+        covered[idx:end] = [True] * len(substring)
+        spans.append((idx, end))
+
+        for derivation in derivations:
+            add_cached_derivation(session, derivation, idx)
+            cache.reused += 1
+
+    return sorted(spans)
+
 
+def add_cached_derivation(session, derivation, start):
+    """
+    Add a cached derivation to the session.snippets library at a given
+    index on the target string.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param derivation: A derivation in nested tuple form (see
+    representation.snippet_cache.SnippetCache).
+    :param start: The index on the target string at which the output of the
+    derivation starts.
+    :return: Nothing.
+    """
+
+    root_key = generate_key(session.grammar, start, start + derivation[2],
+                            derivation[0])
+
+    if root_key in session.snippets or root_key in session.snippets.deleted:
+        # Snippet already exists.
+        return
+
+    root = create_cached_snippet(session, derivation, root_key, None)
+    stack = [(derivation, start, root)]
+
+    while stack:
+        # Expand cached derivations depth-first without recursion.
+        node, start, snippet = stack.pop()
+
+        for child in node[3]:
+
+            if isinstance(child, str):
+                # Terminal child.
+                if session.config['LAZY_SNIPPETS']:
+                    snippet.children.append(generate_key(
+                        session.grammar, start, start + len(child)))
+
+                else:
+                    snippet.children.append(tree.Tree(child, snippet))
+
+                start += len(child)
+
+            else:
+                key = generate_key(session.grammar, start, start + child[2],
+                                   child[0])
+                child_snippet = create_cached_snippet(session, child, key,
+                                                      snippet)
+
+                if session.config['LAZY_SNIPPETS']:
+                    snippet.children.append(key)
+
+                else:
+                    snippet.children.append(child_snippet)
+
+                # Sub-derivations have already been reduced.
+                session.snippets.add_deleted(key, child_snippet)
+
+                stack.append((child, start, child_snippet))
+                start += child[2]
+
+    session.snippets[root_key] = root
+
+
+def create_cached_snippet(session, derivation, key, parent):
+    """
+    Create a snippet with no children for the root of a cached derivation.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param derivation: A derivation in nested tuple form.
+    :param key: The key of the new snippet.
+    :param parent: The snippet of the parent of the new snippet, or None.
+    :return: A derivation tree, or a representation.derivation.Derivation
+    instance if LAZY_SNIPPETS is set in the config of the session.
+    """
+
+    if session.stats is not None:
+        session.stats.count("cached_snippets")
+
+    if session.config['LAZY_SNIPPETS']:
+        snippet = Derivation(derivation[0], derivation[1], [], key)
+        snippet.parent = parent.snippet if parent else None
+
+    else:
+        snippet = tree.Tree(derivation[0], parent)
+        snippet.codon, snippet.snippet = derivation[1], key
+
+    return snippet
+
+
+def cache_solution(session, ind_tree, cache):
+    """
+    Add every sub-derivation of a solution which outputs at least
+    session.config['CACHE_MIN_LENGTH'] characters to a snippet cache.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param ind_tree: The derivation tree of a solution.
+    :param cache: A representation.snippet_cache.SnippetCache instance.
+    :return: Nothing.
+    """
+
+    fingerprint = session.grammar.fingerprint
+
+    # Derivations and outputs of all sub-trees, built bottom-up.
+    built, stack = {}, [(ind_tree, False)]
+
+    while stack:
+        node, children_built = stack.pop()
+
+        if not children_built:
+            stack.append((node, True))
+            stack.extend([(child, False) for child in node.children if
+                          child.children])
+            continue
+
+        children, output, size = [], [], 0
+
+        for child in node.children:
+
+            if child.children:
+                derivation, child_output, child_size = built.pop(id(child))
+                children.append(derivation)
+                output.append(child_output)
+                size += child_size
+
+            else:
+                # Terminal child.
+                children.append(child.root)
+                output.append(child.root)
+
+        output, children = "".join(output), tuple(children)
+        derivation = (node.root, node.codon, len(output), children)
+
+        # Estimate the size of the derivation as it is built, see
+        # representation.snippet_cache.get_derivation_size.
+        size += getsizeof(derivation) + getsizeof(children)
+        built[id(node)] = (derivation, output, size)
+
+        if len(output) >= session.config['CACHE_MIN_LENGTH']:
+            cache.add(fingerprint, output, node.root, derivation, size)
+
+
+def invalidate_snippets(session, start, end, limit=None):
+    """
+    Remove all snippets which overlap an edited portion of the target
+    string from the session.snippets library, including deleted snippets.
+    Deleted children of removed snippets which do not overlap the edit are
+    restored, since the snippets which made them obsolete are gone.
+
+    Every deleted snippet is below a snippet in the library, and every
+    snippet above a snippet which overlaps the edit overlaps it too, so
+    deleted snippets are found by walking down from the snippets in the
+    library which overlap the edit.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param start: The start index of the edited portion of the target string.
+    :param end: The end index of the edited portion of the target string.
+    Equal to start for an insertion, in which case snippets which strictly
+    contain the insertion point are removed.
+    :param limit: The largest number of snippets which may be removed. No
+    snippets are removed if more snippets than this overlap the edit. Any
+    number of snippets may be removed if not set.
+    :return: False if too many snippets overlap the edit, otherwise True.
+    """
+
+    def overlaps(key):
+        # Check whether a snippet overlaps the edit.
+        return key[0] < end and key[1] > start or key[0] < start < key[1]
+
+    stack = [(key, session.snippets[key]) for key in session.snippets.keys()
+             if overlaps(key)]
+
+    invalid, restore = set([key for key, _ in stack]), {}
+
+    if limit is None:
+        limit = float("inf")
+
+    while stack and len(invalid) <= limit:
+        # Find the deleted children of every invalid snippet.
+        key, snippet = stack.pop()
+
+        for child, child_snippet in get_child_snippets(session, snippet):
+
+            if child in invalid or child in restore or \
+                    child not in session.snippets.deleted:
+                continue
+
+            if overlaps(child):
+                invalid.add(child)
+                stack.append((child, child_snippet))
+
+            else:
+                restore[child] = child_snippet
+
+    if len(invalid) > limit:
+        # Too many snippets overlap the edit.
+        return False
+
+    for key in sorted(invalid):
+        session.snippets.purge(key)
+
+    for key in sorted(restore):
+        session.snippets.restore(key, restore[key])
+
+    return True
+
+
+def shift_snippets(session, index, delta):
+    """
+    Move all snippets which start at or after a given index on the target
+    string by a given number of characters, after text has been inserted
+    into or deleted from the target string. Snippets which overlap the edit
+    must already have been removed (see invalidate_snippets), so every
+    deleted snippet which is moved is below a snippet in the library which
+    is moved.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param index: The index on the target string from which snippets are
+    moved.
+    :param delta: The number of characters by which to move snippets.
+    :return: Nothing.
+    """
 
-def get_num_from_str(string):
+    def shift(key):
+        # Move a key if it starts at or after the index.
+        if key[0] >= index:
+            return key[0] + delta, key[1] + delta, key[2]
+
+        return key
+
+    if not delta:
+        # No snippets need to be moved.
+        return
+
+    stack = [(key, session.snippets[key]) for key in session.snippets.keys()
+             if key[0] >= index]
+
+    moved = dict(stack)
+
+    while stack:
+        # Find the deleted snippets below every moved snippet.
+        key, snippet = stack.pop()
+
+        for child, child_snippet in get_child_snippets(session, snippet):
+
+            if child not in moved and child in session.snippets.deleted:
+                moved[child] = child_snippet
+                stack.append((child, child_snippet))
+
+    session.snippets.move({key: shift(key) for key in moved})
+
+    for snippet in moved.values():
+        # Update the keys stored in all moved snippets.
+        snippet.snippet = shift(snippet.snippet)
+
+        if isinstance(snippet, Derivation):
+            snippet.children = [shift(child) for child in snippet.children]
+
+            if snippet.parent:
+                snippet.parent = shift(snippet.parent)
+
+
+def get_child_snippets(session, snippet):
+    """
+    Find the snippet keys and snippets of all non-terminal children of a
+    snippet, whether or not they have been deleted.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param snippet: A derivation tree or a representation.derivation.
+    Derivation instance.
+    :return: A list of (snippet key, snippet) pairs.
+    """
+
+    if isinstance(snippet, Derivation):
+        return [(child, session.snippets.get_snippet(child)) for child in
+                snippet.children if child[2] != -1]
+
+    return [(child.snippet, child) for child in snippet.children if
+            child.snippet]
+
+
+def create_terminal_snippet(session, NT, T, codon, key):
+    """
+    Create a snippet for a production choice which consists solely of a
+    terminal, and add it to the session.snippets library.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param NT: A non-terminal root.
+    :param T: The terminal which is the entire production choice.
+    :param codon: A codon which selects the production choice.
+    :param key: A new key for the session.snippets dictionary.
+    :return: Nothing.
     """
-    Given a string of a snippet, return the indexes of that snippet.
 
-     in: '[1, 2] <RE>'
+    if session.stats is not None:
+        session.stats.count("snippets_created")
+
+    if session.config['LAZY_SNIPPETS']:
+        # Store the snippet as a back-pointer to its terminal.
+        session.snippets[key] = Derivation(NT, codon, [
+            generate_key(session.grammar, key[0], key[1])], key)
+
+        return
+
+    # Generate a tree for this choice.
+    parent = tree.Tree(NT, None)
+
+    # Set the codon for this choice.
+    parent.codon = codon
 
-     out: [1, 2]
+    # Set the snippet key for the parent.
+    parent.snippet = key
 
-    :param string: A string defining a snippet.
-    :return: The indexes of that snippet.
+    # Create child for terminal.
+    child = tree.Tree(T, parent)
+
+    # Add child to parent.
+    parent.children.append(child)
+
+    # Add snippet to snippets repository.
+    session.snippets[key] = parent
+
+
+def create_terminal_child(session, T):
     """
+    Create a tree for a terminal child of a proposed reduction. Snippets
+    stored as back-pointers refer to terminal children by key alone, so no
+    tree is created for them.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param T: A terminal.
+    :return: A new derivation tree for the terminal, or None if
+    LAZY_SNIPPETS is set in the config of the session.
+    """
+
+    if session.config['LAZY_SNIPPETS']:
+        return None
 
-    # Get index portion of string
-    # try:
-    index = re.findall("\[\d+, \d+\]", string)
-    # except TypeError:
-    #     print("TypeError.\n", string)
-    #     quit()
-    return eval(index[0])
+    return tree.Tree(T, None)
 
 
-def get_NT_from_str(string):
+def build_tree_from_snippet(session, key):
+    """
+    Build a full derivation tree, with codons, from a snippet stored as
+    back-pointers.
+
+    :param session: The parse session, see algorithm.session.ParseSession.
+    :param key: The key of a snippet in the session.snippets library.
+    :return: A derivation tree, i.e. an instance of the
+    representation.tree.Tree class.
     """
-    Given a string of a snippet, return the NT of that snippet.
 
-     in: '[1, 2] <RE>'
+    NT_names = session.grammar.NT_names
+
+    root = tree.Tree(NT_names[key[2]], None)
+    stack = [(root, session.snippets.get_snippet(key))]
+
+    while stack:
+        # Expand nodes depth-first without recursion.
+        node, derivation = stack.pop()
+
+        node.codon, node.snippet = derivation.codon, derivation.snippet
+
+        for child_key in derivation.children:
+
+            if child_key[2] == -1:
+                # Terminal child, output is the matching portion of the
+                # target string.
+                node.children.append(tree.Tree(
+                    session.target[child_key[0]:child_key[1]], node))
+
+            else:
+                child = tree.Tree(NT_names[child_key[2]], node)
+                node.children.append(child)
+                stack.append((child, session.snippets.get_snippet(
+                    child_key)))
+
+    return root
+
+
+def generate_key(grammar, start, end, NT=None):
+    """
+    Given the indexes of a snippet on the target string and the root NT of
+    that snippet, generate a key for the snippets repository. Keys are tuples
+    of integers, so they can be hashed, compared and sorted without any
+    string parsing.
+
+     in: 1, 2, '<RE>'
+
+     out: (1, 2, 4)
+
+    where 4 is the interned id of '<RE>' in the grammar. Terminal children
+    which are not stored in the repository are given an NT id of -1.
+
+    :param grammar: An instance of the representation.grammar.Grammar
+    class.
+    :param start: The start index of the snippet on the target string.
+    :param end: The end index of the snippet on the target string.
+    :param NT: The root NT of the snippet. None if the snippet is a terminal.
+    :return: A key for the snippets repository.
+    """
+
+    if NT is None:
+        return start, end, -1
+
+    return start, end, grammar.NT_ids[NT]
+
+
+def get_NT_from_key(grammar, key):
+    """
+    Given a snippet key, return the NT of that snippet.
+
+     in: (1, 2, 4)
 
      out: '<RE>'
 
-    :param string: A string defining a snippet.
+    :param grammar: An instance of the representation.grammar.Grammar
+    class.
+    :param key: A snippet key.
     :return: The NT of that snippet.
     """
 
-    # Get index portion of string
-    index = re.findall("\<.+\>", string)
-    return index[0]
+    return grammar.NT_names[key[2]]
+
+
+def key_to_str(grammar, key):
+    """
+    Given a snippet key, return a human-readable string of that key.
+
+     in: (1, 2, 4)
 
+     out: '[1, 2] <RE>'
 
-def check_snippets_for_solution():
+    :param grammar: An instance of the representation.grammar.Grammar
+    class.
+    :param key: A snippet key.
+    :return: A string describing the snippet.
+    """
+
+    return " ".join([str([key[0], key[1]]), get_NT_from_key(grammar, key)])
+
+
+def check_snippets_for_solution(session):
     """
     Check the snippets repository to see if we have built up the correct
     solution yet.
 
+    :param session: The parse session, see algorithm.session.ParseSession.
     :return: An individual representing the correct solution if it exists,
     otherwise None.
     """
@@ -634,37 +1458,49 @@ def check_snippets_for_solution():
     # Initialise None biggest snippet
     biggest_snippet = [0, None]
 
-    for snippet in sorted(trackers.snippets.keys()):
+    for snippet in sorted(session.snippets.keys()):
         # Check each snippet to find the largest one.
 
         # Find length of snippet
-        index = get_num_from_str(snippet)
-        length = index[1] - index[0]
+        length = snippet[1] - snippet[0]
 
         if length > biggest_snippet[0]:
             # We have a new biggest snippet.
             biggest_snippet = [length, snippet]
 
-    largest_snippet = get_output(trackers.snippets[biggest_snippet[1]])
-    largest_indexes = get_num_from_str(biggest_snippet[1])
-    spaces = "".join([" " for _ in range(largest_indexes[0] - 1)])
+    if biggest_snippet[1] is None:
+        # No snippets match any portion of the target string.
+        return None
 
-    if not params['SILENT']:
-        print("\nTarget:         ", params['TARGET'])
+    # The output of a snippet is the portion of the target string it
+    # matches, so it doesn't need to be built from its derivation tree.
+    largest_snippet = session.target[biggest_snippet[1][0]:
+                                       biggest_snippet[1][1]]
+    spaces = "".join([" " for _ in range(biggest_snippet[1][0] - 1)])
+
+    if not session.config['SILENT']:
+        print("\nTarget:         ", session.target)
         if spaces:
             print("Largest snippet:", spaces, largest_snippet)
         else:
             print("Largest snippet:", largest_snippet)
     
-        if largest_snippet != params['TARGET']:
-            print("Snippet key:    ", biggest_snippet[1])
+        if largest_snippet != session.target:
+            print("Snippet key:    ", key_to_str(session.grammar,
+                                                 biggest_snippet[1]))
 
-    if largest_snippet == params['TARGET']:
+    if largest_snippet == session.target:
         # We have a perfect match
 
+        if session.config['LAZY_SNIPPETS']:
+            # Build the derivation tree of the solution.
+            ind_tree = build_tree_from_snippet(session, biggest_snippet[1])
+
+        else:
+            ind_tree = session.snippets[biggest_snippet[1]]
+
         # Generate individual that represents the perfect solution.
-        ind = individual.Individual(None, trackers.snippets[biggest_snippet[
-            1]])
+        ind = individual.Individual(None, ind_tree, session.grammar)
 
         # Return ind.
         return ind
@@ -0,0 +1,31 @@
+class Derivation(object):
+    """
+    A snippet stored as back-pointers rather than as a full derivation tree.
+    Holds the root NT and codon of the chosen production, and the snippet
+    keys of the children the snippet was reduced from. Terminal children are
+    referred to by key alone, since their output is the matching portion of
+    the target string. A full derivation tree is only built for the snippet
+    which is accepted as the solution (see
+    operators.subtree_parse.build_tree_from_snippet).
+    """
+
+    __slots__ = ('root', 'codon', 'children', 'snippet', 'parent')
+
+    def __init__(self, expr, codon, children, snippet):
+        """
+        Initialise an instance of the derivation class.
+
+        :param expr: A non-terminal from the params['BNF_GRAMMAR'].
+        :param codon: A codon which selects the chosen production choice.
+        :param children: A list of the snippet keys of all children.
+        :param snippet: The snippet key of this derivation.
+        """
+
+        self.root = expr
+        self.codon = codon
+        self.children = children
+        self.snippet = snippet
+
+        # The key of a snippet which has used this snippet as a child. None
+        # if this snippet has not been reduced.
+        self.parent = None
@@ -0,0 +1,275 @@
+from bisect import bisect_right
+from heapq import heappop, heappush
+import random
+
+from representation.tree import Tree
+
+COSTS = {
+    "codons": lambda child_costs: 1 + sum(child_costs),
+    "depth": lambda child_costs: 1 + max(child_costs, default=1)
+}
+# Cost functions for choosing derivations. Each gives the cost of a node from
+# the costs of its NT children. "codons" is the number of codons used by a
+# derivation, and "depth" is the depth of its derivation tree.
+
+
+class Forest(object):
+    """
+    A shared packed parse forest holding every derivation of a target string.
+    Each node is a (start, end, NT id) snippet key (see
+    operators.subtree_parse.generate_key), and is shared by every derivation
+    which uses that NT over that span. Each node holds a list of packed
+    alternatives, one for every distinct production choice and split of the
+    span which derives the node. A production choice which appears more
+    than once in its rule is a single alternative, which stands for as
+    many derivations as there are occurrences of that production choice.
+    """
+
+    def __init__(self, grammar, target, root):
+        """
+        Initialise an empty parse forest.
+
+        :param grammar: An instance of the representation.grammar.Grammar
+        class.
+        :param target: The target string.
+        :param root: The key of the root node of the forest.
+        """
+
+        self.grammar = grammar
+        self.target = target
+        self.root = root
+
+        # The packed alternatives of each node, as a list of (choice index,
+        # child keys) tuples, where the choice index is an index into the
+        # distinct production choices of the NT of the node (see
+        # Grammar.set_distinct_choices). Terminal children have an NT id of
+        # -1.
+        self.nodes = {}
+
+        # The number of derivations of each node, and the cumulative number
+        # of derivations of the packed alternatives of each node. Both are
+        # set by count_derivations.
+        self.counts, self.weights = {}, {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def count_derivations(self):
+        """
+        Count the number of derivations of every node in the forest in a
+        single bottom-up pass. Each occurrence of a duplicated production
+        choice gives a different genome, so counts as a separate derivation.
+
+        :return: The number of derivations of the target string.
+        """
+
+        if self.counts:
+            # Derivations have already been counted.
+            return self.counts[self.root]
+
+        choices = self.grammar.distinct_choices
+
+        for key in self.get_bottom_up_order():
+            # Count each node once all of its children have been counted.
+            NT_choices = choices[self.grammar.NT_names[key[2]]]
+            weights, total = [], 0
+
+            for choice_idx, children in self.nodes[key]:
+                count = len(NT_choices[choice_idx]['indices'])
+
+                for child in children:
+                    if child[2] != -1:
+                        count *= self.counts[child]
+
+                total += count
+                weights.append(total)
+
+            self.counts[key], self.weights[key] = total, weights
+
+        return self.counts[self.root]
+
+    def get_bottom_up_order(self):
+        """
+        Order the nodes of the forest so that every node comes after all of
+        its children.
+
+        :return: A list of the keys of all nodes, ending with the root.
+        """
+
+        order, done = [], set()
+
+        # Nodes on the current path from the root.
+        open_nodes = {self.root}
+        stack = [(self.root, self.get_NT_children(self.root))]
+
+        while stack:
+            # Visit nodes depth-first without recursion.
+            key, children = stack[-1]
+            child = next(children, None)
+
+            if child is None:
+                # All children have been visited.
+                stack.pop()
+                open_nodes.discard(key)
+                done.add(key)
+                order.append(key)
+
+            elif child in open_nodes:
+                # A node which derives itself.
+                raise ValueError("Error: representation.forest."
+                                 "Forest.get_bottom_up_order. Target string "
+                                 "has infinitely many derivations.")
+
+            elif child not in done:
+                open_nodes.add(child)
+                stack.append((child, self.get_NT_children(child)))
+
+        return order
+
+    def get_NT_children(self, key):
+        """
+        Find the NT children of all packed alternatives of a node.
+
+        :param key: The key of a node in the forest.
+        :return: A generator of the keys of all NT children.
+        """
+
+        return (child for _, children in self.nodes[key] for child in
+                children if child[2] != -1)
+
+    def sample_tree(self, rng=random):
+        """
+        Draw a derivation of the target string uniformly at random from all
+        derivations in the forest. Each packed alternative is chosen with
+        probability proportional to its number of derivations, so the time
+        taken is linear in the size of the derivation drawn, and each
+        occurrence of a duplicated production choice is equally likely.
+
+        :param rng: A source of random numbers, e.g. an instance of
+        random.Random.
+        :return: A derivation tree, i.e. an instance of the
+        representation.tree.Tree class.
+        """
+
+        self.count_derivations()
+
+        def choose(key):
+            # Choose a packed alternative weighted by its derivations.
+            weights = self.weights[key]
+
+            return self.nodes[key][bisect_right(weights, rng.randrange(
+                weights[-1]))]
+
+        return self.build_tree(choose, rng)
+
+    def min_cost_tree(self, cost="codons", rng=None):
+        """
+        Find the derivation of the target string with the lowest cost over
+        all nodes, i.e. over all spans and NTs. The cost of each node is the
+        lowest cost of any of its packed alternatives. Ties go to the lowest
+        production choice.
+
+        Nodes are costed cheapest first, as in Knuth's generalisation of
+        Dijkstra's algorithm: a packed alternative is costed once all of its
+        children have been, and a node takes the first of its alternatives
+        to be finished. Forests of grammars with unit cycles, which have
+        infinitely many derivations, still have a cheapest derivation, since
+        cycles only add to its cost.
+
+        :param cost: The name of a cost function in COSTS, or a function
+        which gives the cost of a node from a list of the costs of its NT
+        children. The cost of a node must be greater than the cost of each
+        of its children.
+        :param rng: A random.Random instance for picking codons of
+        duplicated production choices. The lowest choice index is used if
+        not set.
+        :return: The derivation tree with the lowest cost, and that cost.
+        """
+
+        if not callable(cost):
+            cost = COSTS[cost]
+
+        costs, best = {}, {}
+
+        # The number of NT children of each packed alternative which have
+        # yet to be costed, and the packed alternatives in which each node
+        # is a child.
+        pending, parents, heap = {}, {}, []
+
+        for key, alternatives in self.nodes.items():
+            for idx, alternative in enumerate(alternatives):
+                NT_children = [child for child in alternative[1] if
+                               child[2] != -1]
+                pending[(key, idx)] = len(NT_children)
+
+                for child in NT_children:
+                    parents.setdefault(child, []).append((key, idx))
+
+                if not NT_children:
+                    heappush(heap, (cost([]), idx, key))
+
+        while heap:
+            alt_cost, idx, key = heappop(heap)
+
+            if key in costs:
+                # The node has already been costed more cheaply.
+                continue
+
+            costs[key], best[key] = alt_cost, self.nodes[key][idx]
+
+            for parent, parent_idx in parents.get(key, []):
+                pending[(parent, parent_idx)] -= 1
+
+                if not pending[(parent, parent_idx)] and parent not in costs:
+                    # All children of the alternative have been costed.
+                    alternative = self.nodes[parent][parent_idx]
+                    heappush(heap, (cost([costs[child] for child in
+                                          alternative[1] if
+                                          child[2] != -1]),
+                                    parent_idx, parent))
+
+        return self.build_tree(best.get, rng), costs[self.root]
+
+    def build_tree(self, choose, rng=None):
+        """
+        Build a derivation tree of the target string from the forest.
+
+        :param choose: A function which gives the packed alternative to be
+        used for a node from the key of that node.
+        :param rng: A random.Random instance for picking codons of
+        duplicated production choices. The lowest choice index is used if
+        not set.
+        :return: A derivation tree, i.e. an instance of the
+        representation.tree.Tree class.
+        """
+
+        grammar = self.grammar
+        choices = grammar.distinct_choices
+
+        root = Tree(grammar.NT_names[self.root[2]], None)
+        stack = [(root, self.root)]
+
+        while stack:
+            # Expand nodes depth-first without recursion.
+            node, key = stack.pop()
+
+            choice_idx, children = choose(key)
+
+            # Generate a codon for any occurrence of this choice.
+            indices = choices[node.root][choice_idx]['indices']
+            index = indices[0] if rng is None else rng.choice(indices)
+            node.codon = grammar.rules[node.root]['no_choices'] + index
+
+            for child_key in children:
+
+                if child_key[2] == -1:
+                    # Terminal child.
+                    node.children.append(Tree(
+                        self.target[child_key[0]:child_key[1]], node))
+
+                else:
+                    child = Tree(grammar.NT_names[child_key[2]], node)
+                    node.children.append(child)
+                    stack.append((child, child_key))
+
+        return root
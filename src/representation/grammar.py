@@ -1,6 +1,38 @@
-from re import match, finditer, DOTALL, MULTILINE
+from hashlib import sha1
+from heapq import heappop, heappush
+from os import getpid, makedirs, path, remove, replace
+import pickle
+import re
+from time import perf_counter
 
 from algorithm.parameters import params
+from representation.tree import paused_gc
+from utilities.representation.aho_corasick import AhoCorasick
+
+# Version of the format of compiled grammars saved in the grammar cache.
+# Must be increased whenever the attributes of the Grammar class change, so
+# that grammars compiled by older versions are rebuilt.
+GRAMMAR_FORMAT = 8
+
+# Tokens of a BNF grammar, in order of precedence. Each token is found in a
+# single pass over the grammar file. "text", "single", "double", "newline",
+# "NT" and "lt" tokens are parts of a production choice, and all other
+# tokens end the current production choice. Unmatched quotes are dropped.
+BNF_TOKENS = re.compile(r'''
+    (?P<rule><[^>\s]+>)\s*::=           # Start of a production rule.
+  | (?P<comment>\#[^\n]*)              # Comment to the end of the line.
+  | (?P<choice>\|)                     # End of a production choice.
+  | '(?P<single>[^\n]*?)'              # Terminal in single quotes.
+  | "(?P<double>[^\n]*?)"              # Terminal in double quotes.
+  | (?P<NT><[^>|\s'"\#]+>)            # Non-terminal.
+  | \ *(?P<newline>[\r\n]+)\ *         # Line break within a production.
+  | (?P<text>[^'"<\r\n|\#]+)           # Unquoted terminal.
+  | (?P<lt><+)                         # Angle brackets which aren't a NT.
+  | (?P<quote>['"])                    # Unmatched quote.
+''', re.VERBOSE)
+
+# Special production choice which is expanded into terminals 0 to n - 1.
+GE_RANGE_REGEX = re.compile(r'GE_RANGE:(?P<range>\w*)')
 
 
 class Grammar(object):
@@ -15,7 +47,52 @@ class Grammar(object):
 
         :param file_name: A specified BNF grammar file.
         """
-        
+
+        start = perf_counter()
+
+        with open(file_name, 'r') as bnf:
+            # Fingerprint the grammar so that results derived from it can be
+            # shared safely.
+            content = bnf.read()
+            self.fingerprint = sha1(content.encode()).hexdigest()
+
+        cache_file = get_cache_file(file_name, content)
+
+        with paused_gc():
+            if cache_file is None or not self.load_cache(cache_file):
+                # Compile the grammar from the grammar file.
+                self.compile(file_name)
+
+                if cache_file is not None:
+                    self.save_cache(cache_file)
+
+        for rule in self.rules:
+            if self.rules[rule]['no_choices'] == 1:
+                # Unit productions.
+                print("Warning: Grammar contains unit production "
+                      "for production rule", rule)
+                print("       Unit productions consume GE codons.")
+
+        # Set maximum codon size as the
+        params['CODON_SIZE'] = 2 * max([self.rules[rule]["no_choices"] for rule in
+                                        sorted(self.rules.keys())])
+
+        # Integer-coded tables for mapping whole populations of genomes,
+        # built on first use (see algorithm.population_mapper).
+        self.population_tables = None
+
+        # Time taken in seconds to load the grammar.
+        self.load_time = perf_counter() - start
+
+    def compile(self, file_name):
+        """
+        Parse a BNF grammar file and build all lookup tables derived from
+        it.
+
+        :param file_name: A specified BNF grammar file.
+        :return: Nothing.
+        """
+
         if file_name.endswith("pybnf"):
             # Use python filter for parsing grammar output as grammar output
             # contains indented python code.
@@ -31,169 +108,319 @@ class Grammar(object):
         self.rules, self.climb_NTs, self.start_rule = {}, {}, None
         self.delete_NTs = {}
 
-        # Set regular expressions for parsing BNF grammar.
-        self.ruleregex = '(?P<rulename><\S+>)\s*::=\s*(?P<production>(?:(?=\#)\#[^\r\n]*|(?!<\S+>\s*::=).+?)+)'
-        self.productionregex = '(?=\#)(?:\#.*$)|(?!\#)\s*(?P<production>(?:[^\'\"\|\#]+|\'.*?\'|".*?")+)'
-        self.productionpartsregex = '\ *([\r\n]+)\ *|([^\'"<\r\n]+)|\'(.*?)\'|"(.*?)"|(?P<subrule><[^>|\s]+>)|([<]+)'
-        
+        # Initialise lookup tables for codons of production choices.
+        self.choice_codons, self.terminal_choices = {}, {}
+
+        # Initialise the distinct production choices of each NT.
+        self.distinct_choices, self.choice_indices = {}, {}
+
+        # Initialise dict of which sides of each NT can have neighbours.
+        self.NT_neighbours = {}
+
+        # Initialise dicts of the lengths and the first and last terminals
+        # of the strings which each NT can derive.
+        self.NT_nullable, self.NT_min_length, self.NT_max_length = {}, {}, {}
+        self.NT_first, self.NT_last = {}, {}
+
+        # Initialise dict of which NTs derive each other.
+        self.NT_components = {}
+
         # Read in BNF grammar, set production rules, terminals and
         # non-terminals.
         self.read_bnf_file(file_name)
 
+        # Intern non-terminals as integer ids for use in snippet keys. Ids
+        # are assigned in sorted order so that sorting keys by id matches
+        # sorting by non-terminal name.
+        self.NT_names = sorted(self.non_terminals.keys())
+        self.NT_ids = {NT: i for i, NT in enumerate(self.NT_names)}
+
+        # Compile all terminals into a single automaton for finding every
+        # occurrence of every terminal in a target string.
+        self.terminal_scanner = AhoCorasick(self.terminals.keys())
+
         # Set boolean flag for which production choices contain non-terminals.
         self.set_NT_kids()
+
+        # Collapse duplicate production choices.
+        self.set_distinct_choices()
         
         # Find production choices which can be used to reduce_trees
         # subtrees.
         self.find_concatination_NTs()
-        
-        # Set maximum codon size as the
-        params['CODON_SIZE'] = 2 * max([self.rules[rule]["no_choices"] for rule in
-                                        sorted(self.rules.keys())])
-                    
+
+        # Find the lengths and the first and last terminals of the strings
+        # which each NT can derive.
+        self.set_NT_yields()
+
+        # Find which non-terminals can be combined with neighbouring
+        # snippets.
+        self.set_NT_neighbours()
+
+        # Find where on a target string each reduction can be made.
+        self.set_reduction_bounds()
+
+        # Find every NT which can be reached from each NT through unit
+        # production choices.
+        self.set_unit_closure()
+
+        # Build lookup tables for generating codons.
+        self.set_codon_tables()
+
+    def load_cache(self, cache_file):
+        """
+        Load a compiled grammar from the grammar cache. Cached grammars which
+        were compiled from a different version of the grammar file or in an
+        older format are stale and are not used.
+
+        :param cache_file: The path of the cache file of the grammar.
+        :return: True if the compiled grammar was loaded, False if it must
+        be rebuilt.
+        """
+
+        try:
+            with open(cache_file, 'rb') as cache:
+                cached = pickle.load(cache)
+
+        except Exception:
+            # The cache file doesn't exist or is unreadable, e.g. it was
+            # written by an incompatible version.
+            return False
+
+        if not isinstance(cached, dict) or \
+                cached.get("format") != GRAMMAR_FORMAT or \
+                cached.get("fingerprint") != self.fingerprint:
+            # The grammar file has changed since it was compiled.
+            return False
+
+        self.__dict__.update(cached["grammar"])
+
+        return True
+
+    def save_cache(self, cache_file):
+        """
+        Save the compiled grammar to the grammar cache. The cache file is
+        replaced in a single step so that other processes never read a
+        partly written file. Failures to write the cache are ignored.
+
+        :param cache_file: The path of the cache file of the grammar.
+        :return: Nothing.
+        """
+
+        cached = {"format": GRAMMAR_FORMAT, "fingerprint": self.fingerprint,
+                  "grammar": self.__dict__}
+
+        temp_file = cache_file + "." + str(getpid()) + ".tmp"
+
+        try:
+            makedirs(path.dirname(cache_file), exist_ok=True)
+
+            with open(temp_file, 'wb') as cache:
+                pickle.dump(cached, cache, pickle.HIGHEST_PROTOCOL)
+
+            replace(temp_file, cache_file)
+
+        except OSError:
+            # The grammar is still usable without the cache.
+            if path.exists(temp_file):
+                remove(temp_file)
+
     def read_bnf_file(self, file_name):
         """
         Read a grammar file in BNF format. Parses the grammar and saves a
         dict of all production rules and their possible choices.
 
+        The grammar file is split into tokens in a single pass, and each
+        production choice is built as soon as it ends, so the time taken
+        grows linearly with the size of the grammar.
+
         :param file_name: A specified BNF grammar file.
         :return: Nothing.
         """
-        
+
         with open(file_name, 'r') as bnf:
             # Read the whole grammar file.
             content = bnf.read()
-            
-            for rule in finditer(self.ruleregex, content, DOTALL):
-                # Find all rules in the grammar
-                
-                if self.start_rule is None:
-                    # Set the first rule found as the start rule.
-                    self.start_rule = {"symbol": rule.group('rulename'),
-                                       "type": "NT"}
-                
-                # Create and add a new rule.
-                self.non_terminals[rule.group('rulename')] = {
-                    'id': rule.group('rulename')}
-                
-                # Initialise empty list of all production choices for this
-                # rule.
-                tmp_productions = []
-                
-                for p in finditer(self.productionregex,
-                                  rule.group('production'), MULTILINE):
-                    # Iterate over all production choices for this rule.
-                    # Split production choices of a rule.
-
-                    if p.group('production') is None or p.group(
-                            'production').isspace():
-                        # Skip to the next iteration of the loop if the
-                        # current "p" production is None or blank space.
-                        continue
-
-                    # Initialise empty data structures for production choice
-                    tmp_production, terminalparts = [], ''
-
-                    # special case: GERANGE:dataset_n_vars will be transformed
-                    # to productions 0 | 1 | ... | n_vars-1
-                    GE_RANGE_regex = r'GE_RANGE:(?P<range>\w*)'
-                    m = match(GE_RANGE_regex, p.group('production'))
-                    if m:
-                        try:
-                            if m.group('range') == "dataset_n_vars":
-                                # set n = number of columns from dataset
-                                n = params['FITNESS_FUNCTION'].n_vars
-                            else:
-                                # assume it's just an int
-                                n = int(m.group('range'))
-                        except (ValueError, AttributeError):
-                            raise ValueError("Bad use of GE_RANGE: "
-                                             + m.group())
-
-                        for i in range(n):
-                            # add a terminal symbol
-                            tmp_production, terminalparts = [], ''
-                            symbol = {
-                                "symbol": str(i),
-                                "type": "T"}
-                            tmp_production.append(symbol)
-                            if str(i) not in self.terminals:
-                                self.terminals[str(i)] = \
-                                    [rule.group('rulename')]
-                            elif rule.group('rulename') not in \
-                                self.terminals[str(i)]:
-                                self.terminals[str(i)].append(
-                                    rule.group('rulename'))
-                            tmp_productions.append({"choice": tmp_production,
-                                                    "recursive": False,
-                                                    "NT_kids": False})
-                        # don't try to process this production further
-                        # (but later productions in same rule will work)
-                        continue
-                    
-                    for sub_p in finditer(self.productionpartsregex,
-                                          p.group('production').strip()):
-                        # Split production into terminal and non terminal
-                        # symbols.
-                        
-                        if sub_p.group('subrule'):
-                            if terminalparts:
-                                # Terminal symbol is to be appended to the
-                                # terminals dictionary.
-                                symbol = {"symbol": terminalparts,
-                                          "type": "T"}
-                                tmp_production.append(symbol)
-                                if terminalparts not in self.terminals:
-                                    self.terminals[terminalparts] = \
-                                        [rule.group('rulename')]
-                                elif rule.group('rulename') not in \
-                                    self.terminals[terminalparts]:
-                                    self.terminals[terminalparts].append(
-                                        rule.group('rulename'))
-                                terminalparts = ''
-                            
-                            tmp_production.append(
-                                {"symbol": sub_p.group('subrule'),
-                                 "type": "NT"})
-                        
-                        else:
-                            # Unescape special characters (\n, \t etc.)
-                            terminalparts += ''.join(
-                                [part.encode().decode('unicode-escape') for
-                                 part in sub_p.groups() if part])
-                    
-                    if terminalparts:
-                        # Terminal symbol is to be appended to the terminals
-                        # dictionary.
-                        symbol = {"symbol": terminalparts,
-                                  "type": "T"}
-                        tmp_production.append(symbol)
-                        if terminalparts not in self.terminals:
-                            self.terminals[terminalparts] = \
-                                [rule.group('rulename')]
-                        elif rule.group('rulename') not in \
-                            self.terminals[terminalparts]:
-                            self.terminals[terminalparts].append(
-                                rule.group('rulename'))
-                    tmp_productions.append({"choice": tmp_production,
-                                            "NT_kids": False})
-                
-                if not rule.group('rulename') in self.rules:
-                    # Add new production rule to the rules dictionary if not
-                    # already there.
-                    self.rules[rule.group('rulename')] = {
-                        "choices": tmp_productions,
-                        "no_choices": len(tmp_productions)}
-                    
-                    if len(tmp_productions) == 1:
-                        # Unit productions.
-                        print("Warning: Grammar contains unit production "
-                              "for production rule", rule.group('rulename'))
-                        print("       Unit productions consume GE codons.")
-                else:
-                    # Conflicting rules with the same name.
-                    raise ValueError("lhs should be unique",
-                                     rule.group('rulename'))
+
+        # The current rule, its production choices, and the parts of the
+        # current production choice.
+        rule, tmp_productions, parts = None, [], []
+
+        # Set of (terminal, rule) pairs in self.terminals, for constant
+        # time look-ups.
+        self.terminal_rules = set()
+
+        for token in BNF_TOKENS.finditer(content):
+            kind = token.lastgroup
+
+            if kind in ("text", "single", "double", "newline", "NT", "lt"):
+                # Part of the current production choice.
+                parts.append((kind, token.group(kind)))
+                continue
+
+            if rule is None:
+                # Skip anything before the first rule.
+                if kind == "rule":
+                    rule = token.group("rule")
+                    self.add_rule_name(rule)
+                parts = []
+                continue
+
+            # Any other token ends the current production choice.
+            self.add_production(rule, parts, tmp_productions)
+            parts = []
+
+            if kind == "rule":
+                # Start a new production rule.
+                self.add_rule(rule, tmp_productions)
+                rule, tmp_productions = token.group("rule"), []
+                self.add_rule_name(rule)
+
+        if rule is not None:
+            # Finish the last production rule.
+            self.add_production(rule, parts, tmp_productions)
+            self.add_rule(rule, tmp_productions)
+
+        del self.terminal_rules
+
+    def add_rule_name(self, rule):
+        """
+        Add a new non-terminal, and set the start rule if it is the first
+        rule in the grammar.
+
+        :param rule: The name of the rule, i.e. its non-terminal.
+        :return: Nothing.
+        """
+
+        if self.start_rule is None:
+            # Set the first rule found as the start rule.
+            self.start_rule = {"symbol": rule, "type": "NT"}
+
+        # Create and add a new rule.
+        self.non_terminals[rule] = {'id': rule}
+
+    def add_rule(self, rule, tmp_productions):
+        """
+        Add a complete production rule to the rules dictionary.
+
+        :param rule: The name of the rule.
+        :param tmp_productions: A list of all production choices of the rule.
+        :return: Nothing.
+        """
+
+        if rule in self.rules:
+            # Conflicting rules with the same name.
+            raise ValueError("lhs should be unique", rule)
+
+        self.rules[rule] = {"choices": tmp_productions,
+                            "no_choices": len(tmp_productions)}
+
+    def add_production(self, rule, parts, tmp_productions):
+        """
+        Build a production choice from its parts and add it to the list of
+        production choices of a rule. Leading and trailing whitespace of the
+        production choice is ignored, and blank production choices are
+        skipped.
+
+        :param rule: The name of the rule.
+        :param parts: A list of (kind, text) tuples of the parts of the
+        production choice, see BNF_TOKENS.
+        :param tmp_productions: The list of production choices of the rule.
+        :return: Nothing.
+        """
+
+        start, end = 0, len(parts)
+
+        while start < end and parts[start][0] in ("text", "newline"):
+            # Strip leading whitespace.
+            text = parts[start][1].lstrip()
+
+            if text:
+                parts[start] = ("text", text)
+                break
+
+            start += 1
+
+        while end > start and parts[end - 1][0] in ("text", "newline"):
+            # Strip trailing whitespace.
+            text = parts[end - 1][1].rstrip()
+
+            if text:
+                parts[end - 1] = ("text", text)
+                break
+
+            end -= 1
+
+        if start == end:
+            # Skip blank production choices.
+            return
+
+        if parts[start][0] == "text":
+            # special case: GERANGE:dataset_n_vars will be transformed
+            # to productions 0 | 1 | ... | n_vars-1
+            m = GE_RANGE_REGEX.match(parts[start][1])
+
+            if m:
+                try:
+                    if m.group('range') == "dataset_n_vars":
+                        # set n = number of columns from dataset
+                        n = params['FITNESS_FUNCTION'].n_vars
+                    else:
+                        # assume it's just an int
+                        n = int(m.group('range'))
+                except (ValueError, AttributeError):
+                    raise ValueError("Bad use of GE_RANGE: " + m.group())
+
+                for i in range(n):
+                    # add a terminal symbol
+                    self.add_terminal(str(i), rule)
+                    tmp_productions.append(
+                        {"choice": [{"symbol": str(i), "type": "T"}],
+                         "recursive": False, "NT_kids": False})
+
+                # don't try to process this production further
+                # (but later productions in same rule will work)
+                return
+
+        tmp_production, terminalparts = [], ''
+
+        for kind, text in parts[start:end]:
+            # Split production into terminal and non terminal symbols.
+
+            if kind == "NT":
+                if terminalparts:
+                    # Terminal symbol is to be appended to the terminals
+                    # dictionary.
+                    tmp_production.append({"symbol": terminalparts,
+                                           "type": "T"})
+                    self.add_terminal(terminalparts, rule)
+                    terminalparts = ''
+
+                tmp_production.append({"symbol": text, "type": "NT"})
+
+            elif text:
+                # Unescape special characters (\n, \t etc.)
+                terminalparts += text.encode().decode('unicode-escape')
+
+        if terminalparts:
+            # Terminal symbol is to be appended to the terminals dictionary.
+            tmp_production.append({"symbol": terminalparts, "type": "T"})
+            self.add_terminal(terminalparts, rule)
+
+        tmp_productions.append({"choice": tmp_production, "NT_kids": False})
+
+    def add_terminal(self, T, rule):
+        """
+        Record that a terminal appears in a production choice of a rule.
+
+        :param T: The terminal.
+        :param rule: The name of the rule.
+        :return: Nothing.
+        """
+
+        if (T, rule) not in self.terminal_rules:
+            self.terminal_rules.add((T, rule))
+            self.terminals.setdefault(T, []).append(rule)
 
     def set_NT_kids(self):
         """
@@ -209,6 +436,94 @@ class Grammar(object):
                 if NT_kids:
                     choice['NT_kids'] = True
 
+    def set_distinct_choices(self):
+        """
+        Collapse duplicate production choices of each NT, e.g.
+
+            <d> ::= 0|1|0|0
+
+        has the distinct production choices 0 and 1, where 0 appears at the
+        choice indices [0, 2, 3]. self.distinct_choices maps each NT to a
+        list of its distinct production choices in order of first
+        occurrence, each of which is a dict of the production choice, the
+        list of choice indices at which it appears and whether it contains
+        non-terminals. self.choice_indices maps each (NT, production choice
+        key) pair to the same list of choice indices (see get_choice_key).
+
+        Parsers only ever need to consider the distinct production choices,
+        while any of the equivalent choice indices can be used to generate a
+        codon for a production choice (see get_codon).
+
+        :return: Nothing.
+        """
+
+        for NT in sorted(self.rules.keys()):
+            self.distinct_choices[NT] = []
+
+            for idx, choice in enumerate(self.rules[NT]['choices']):
+                key = (NT, get_choice_key(choice['choice']))
+
+                if key in self.choice_indices:
+                    # Duplicate production choice.
+                    self.choice_indices[key].append(idx)
+
+                else:
+                    self.choice_indices[key] = [idx]
+                    self.distinct_choices[NT].append(
+                        {"choice": choice['choice'],
+                         "indices": self.choice_indices[key],
+                         "NT_kids": choice['NT_kids']})
+
+    def get_codon(self, NT, key, rng=None):
+        """
+        Generate a codon which selects a given production choice of a
+        non-terminal.
+
+        :param NT: A non-terminal.
+        :param key: The key of a production choice of the NT, see
+        get_choice_key.
+        :param rng: A random.Random instance for picking one of the choice
+        indices at which the production choice appears in the grammar. The
+        lowest choice index is used if not set.
+        :return: A codon that will give that production choice.
+        """
+
+        if rng is None:
+            return self.choice_codons[(NT, key)]
+
+        indices = self.choice_indices[(NT, key)]
+
+        return self.rules[NT]['no_choices'] + rng.choice(indices)
+
+    def set_codon_tables(self):
+        """
+        Build lookup tables for generating codons. self.choice_codons maps
+        each (NT, production choice key) pair to a codon which selects that
+        production choice (see get_choice_key). self.terminal_choices maps
+        each terminal to a list of (NT, choice index, codon) tuples for all
+        production choices which consist solely of that terminal.
+
+        :return: Nothing.
+        """
+
+        for (NT, key), indices in self.choice_indices.items():
+            # Duplicate production choices are given the codon of their
+            # first occurrence.
+            self.choice_codons[(NT, key)] = \
+                self.rules[NT]['no_choices'] + indices[0]
+
+        for T in self.terminals:
+            for NT in self.terminals[T]:
+                # Check if T is the entire production choice of any of the
+                # rules in which it appears.
+
+                codon = self.choice_codons.get((NT, ((T, "T"),)))
+
+                if codon is not None:
+                    index = codon - self.rules[NT]['no_choices']
+                    self.terminal_choices.setdefault(T, []).append(
+                        (NT, index, codon))
+
     def find_concatination_NTs(self):
         """
         Scour the grammar class to find non-terminals which can be used to
@@ -224,17 +539,14 @@ class Grammar(object):
 
         :return: Nothing.
         """
-    
+
         # Iterate over all non-terminals/production rules.
         for rule in sorted(self.rules.keys()):
             
-            # Find rules which have production choices leading to NTs.
-            concat = [choice for choice in self.rules[rule]['choices'] if
+            # Find distinct production choices leading to NTs.
+            concat = [choice for choice in self.distinct_choices[rule] if
                       choice['NT_kids']]
             
-            delete_NTs = [choice for choice in self.rules[rule]['choices'] if
-                          choice['NT_kids']]
-            
             if concat:
                 # We can reduce_trees NTs.
                 for choice in concat:
@@ -242,8 +554,11 @@ class Grammar(object):
                     symbols = [[sym['symbol'], sym['type']] for sym in
                                choice['choice']]
                     
-                    NTs = [sym['symbol'] for sym in choice['choice'] if
-                           sym['type'] == "NT"]
+                    # Each NT is only added once, even if it appears more
+                    # than once in the production choice.
+                    NTs = dict.fromkeys([sym['symbol'] for sym in
+                                         choice['choice'] if
+                                         sym['type'] == "NT"])
                     
                     for NT in NTs:
                         # We add to our self.concat_NTs dictionary. The key is
@@ -251,10 +566,502 @@ class Grammar(object):
                         # node. This way when we have a node and wish to see
                         # if we can reduce_trees it with anything else, we
                         # simply look up this dictionary.
-                        conc = [choice['choice'], rule, symbols]
-                                                
-                        if NT not in self.concat_NTs:
-                            self.concat_NTs[NT] = [conc]
-                        else:
-                            if conc not in self.concat_NTs[NT]:
-                                self.concat_NTs[NT].append(conc)
+                        self.concat_NTs.setdefault(NT, []).append(
+                            [choice['choice'], rule, symbols])
+
+    def set_NT_neighbours(self):
+        """
+        Find which non-terminals can be combined with something before or
+        after them. A NT can have a neighbour before it if it appears after
+        symbols which can derive a non-empty string in any production
+        choice, and a neighbour after it if it appears before such symbols.
+        A NT also inherits the neighbours of every NT in whose production
+        choices it appears at all. For example, in
+
+            <string> ::= <letter>|<string><letter>
+
+        <string> can only have neighbours after it, while <letter> can have
+        neighbours on both sides. A snippet whose NT has no neighbours
+        before it can therefore only be part of a complete derivation if it
+        starts at the start of the target string, and likewise for the end.
+
+        self.NT_neighbours maps each NT to a [before, after] pair of flags.
+
+        :return: Nothing.
+        """
+
+        for NT in self.non_terminals:
+            self.NT_neighbours[NT] = [False, False]
+
+        changed = True
+
+        while changed:
+            # Propagate neighbours from parents to children until nothing
+            # changes.
+            changed = False
+
+            for NT in sorted(self.concat_NTs):
+                neighbours = self.NT_neighbours[NT]
+
+                for choice, parent, symbols in self.concat_NTs[NT]:
+                    locs = [i for i, sym in enumerate(symbols) if
+                            sym[0] == NT]
+
+                    before, after = self.NT_neighbours[parent]
+
+                    before = before or not self.is_empty(symbols[:locs[-1]])
+                    after = after or not self.is_empty(symbols[locs[0] + 1:])
+
+                    if (before and not neighbours[0]) or \
+                            (after and not neighbours[1]):
+                        neighbours[0] = neighbours[0] or before
+                        neighbours[1] = neighbours[1] or after
+                        changed = True
+
+    def is_empty(self, symbols):
+        """
+        Given a list of [symbol, type] pairs, check whether they can only
+        derive the empty string. NTs which can't derive any string are
+        assumed to derive non-empty strings.
+
+        :param symbols: A list of [symbol, type] pairs.
+        :return: True if the symbols can only derive the empty string.
+        """
+
+        return all([not symbol if kind == "T" else
+                    self.NT_max_length.get(symbol, 1) == 0 for symbol, kind
+                    in symbols])
+
+    def set_unit_closure(self):
+        """
+        Find the transitive closure of unit production choices, i.e.
+        production choices which consist of a single NT. For example, in
+        regex.bnf
+
+            <char> ::= <an_char>|...
+            <an_char> ::= <a_z>|...
+
+        an <a_z> snippet is also an <an_char> snippet and a <char> snippet.
+
+        self.climb_NTs maps each NT to a list of (ancestor, path,
+        reductions) tuples for every NT which can derive it through unit
+        production choices alone. The path is the shortest list of unit
+        reductions from self.concat_NTs which lead from the NT up to the
+        ancestor, and so gives the codons of the unit production choices on
+        the way. The reductions are all unit reductions which lead to the
+        ancestor from the NT or from any of its other ancestors, starting
+        with the last reduction on the path, so that the ancestor can still
+        be reached if the snippet below it on the path has been deleted.
+        Ancestors are listed nearest first, so the NT below each ancestor on
+        its path is always listed before it. NTs without unit reductions are
+        left out.
+
+        :return: Nothing.
+        """
+
+        # Unit reductions of each NT.
+        units = {NT: [reduce for reduce in self.concat_NTs[NT] if
+                      len(reduce[2]) == 1] for NT in self.concat_NTs}
+
+        for NT in sorted(units):
+            if not units[NT]:
+                continue
+
+            paths, climb, level = {NT: []}, [], [NT]
+
+            while level:
+                # Climb one unit production choice from every NT which was
+                # reached by the previous climb.
+                new_level = []
+
+                for child in sorted(level):
+                    for reduce in units.get(child, []):
+                        if reduce[1] not in paths:
+                            paths[reduce[1]] = paths[child] + [reduce]
+                            climb.append((reduce[1], paths[reduce[1]]))
+                            new_level.append(reduce[1])
+
+                level = new_level
+
+            # The NT and all of its ancestors, in the order they were found.
+            members = [NT] + [ancestor for ancestor, _ in climb]
+
+            self.climb_NTs[NT] = [
+                (ancestor, path, [path[-1]] + [
+                    reduce for child in members for reduce in
+                    units.get(child, []) if reduce[1] == ancestor and
+                    reduce is not path[-1]])
+                for ancestor, path in climb]
+
+    def set_NT_yields(self):
+        """
+        Analyse the strings of terminals which each NT can derive. For each
+        NT which can derive any string at all:
+
+            self.NT_min_length and self.NT_max_length give the lengths of
+            the shortest and longest strings the NT can derive, where the
+            maximum length is None if recursion allows strings of any
+            length,
+            self.NT_nullable gives whether the NT can derive the empty
+            string, and
+            self.NT_first and self.NT_last give the sets of non-empty
+            terminals with which the strings the NT derives can start and
+            end, and
+            self.NT_components gives the index of the strongly connected
+            component of the NT, so that two NTs derive each other if they
+            have the same index. A production choice is recursive if any of
+            its NTs is in the same component as the NT of its rule.
+
+        NTs which can't derive any string are left out of the lengths and
+        the components, are not nullable and have no first or last
+        terminals.
+
+        :return: Nothing.
+        """
+
+        min_length = self.NT_min_length
+
+        # Minimum lengths are found shortest first, as in Dijkstra's
+        # algorithm. The length of a production choice is known once the
+        # minimum lengths of all of its NTs are known.
+        lengths, pending, uses, heap = {}, {}, {}, []
+
+        for NT in sorted(self.distinct_choices):
+            for idx, choice in enumerate(self.distinct_choices[NT]):
+                NTs = [sym['symbol'] for sym in choice['choice'] if
+                       sym['type'] == "NT"]
+
+                lengths[(NT, idx)] = sum([len(sym['symbol']) for sym in
+                                          choice['choice'] if
+                                          sym['type'] == "T"])
+                pending[(NT, idx)] = len(NTs)
+
+                for child in NTs:
+                    uses.setdefault(child, []).append((NT, idx))
+
+                if not NTs:
+                    heappush(heap, (lengths[(NT, idx)], NT))
+
+        while heap:
+            length, NT = heappop(heap)
+
+            if NT in min_length:
+                # A shorter string has already been found.
+                continue
+
+            min_length[NT] = length
+
+            for parent in uses.get(NT, []):
+                lengths[parent] += length
+                pending[parent] -= 1
+
+                if not pending[parent]:
+                    # All NTs of the parent production choice are known.
+                    heappush(heap, (lengths[parent], parent[0]))
+
+        # Production choices of each NT which only contain NTs that can
+        # derive a string, and the NTs which can appear in them, first in
+        # them or last in them, i.e. after or before nullable symbols only.
+        productive, edges, first_edges, last_edges = {}, {}, {}, {}
+
+        # Non-empty terminals which can appear first or last in them.
+        first_Ts, last_Ts = {}, {}
+
+        for NT in sorted(min_length):
+            productive[NT] = [choice['choice'] for choice in
+                              self.distinct_choices[NT] if
+                              all([sym['symbol'] in min_length for sym in
+                                   choice['choice'] if sym['type'] == "NT"])]
+
+            edges[NT] = sorted(set([sym['symbol'] for choice in
+                                    productive[NT] for sym in choice if
+                                    sym['type'] == "NT"]))
+
+            first_edges[NT], first_Ts[NT] = set(), set()
+            last_edges[NT], last_Ts[NT] = set(), set()
+
+            for choice in productive[NT]:
+                self.find_end_symbols(choice, first_edges[NT], first_Ts[NT])
+                self.find_end_symbols(reversed(choice), last_edges[NT],
+                                      last_Ts[NT])
+
+        for index, SCC in enumerate(get_SCCs(edges)):
+            # NTs which derive each other are found together, after all NTs
+            # which they derive.
+
+            for NT in SCC:
+                self.NT_components[NT] = index
+
+            if len(SCC) > 1 or SCC[0] in edges[SCC[0]]:
+                # Recursive NTs can derive strings of any length.
+                for NT in SCC:
+                    self.NT_max_length[NT] = None
+                continue
+
+            NT, max_length = SCC[0], 0
+
+            for choice in productive[NT]:
+                yields = [len(sym['symbol']) if sym['type'] == "T" else
+                          self.NT_max_length[sym['symbol']] for sym in
+                          choice]
+
+                if None in yields:
+                    # Derives a recursive NT.
+                    max_length = None
+                    break
+
+                max_length = max(max_length, sum(yields))
+
+            self.NT_max_length[NT] = max_length
+
+        for sets, NT_edges, Ts in [(self.NT_first, first_edges, first_Ts),
+                                   (self.NT_last, last_edges, last_Ts)]:
+            for SCC in get_SCCs({NT: sorted(NT_edges[NT]) for NT in
+                                 NT_edges}):
+                # NTs in the same component share all of their terminals.
+                union = set()
+
+                for NT in SCC:
+                    union.update(Ts[NT])
+                    union.update(*[sets[child] for child in NT_edges[NT]
+                                   if child in sets])
+
+                for NT in SCC:
+                    sets[NT] = union
+
+        for NT in self.rules:
+            # NTs which can't derive any string.
+            self.NT_nullable[NT] = min_length.get(NT) == 0
+            self.NT_first.setdefault(NT, set())
+            self.NT_last.setdefault(NT, set())
+
+    def find_end_symbols(self, symbols, NTs, Ts):
+        """
+        Find the symbols which can appear first in a list of symbols, i.e.
+        the first non-empty terminal or non-nullable NT and all NTs before
+        it. Nullable NTs are found from self.NT_min_length.
+
+        :param symbols: A list of symbols of a production choice, in the
+        order in which to look through them.
+        :param NTs: A set to which NTs which can appear first are added.
+        :param Ts: A set to which a terminal which can appear first is
+        added.
+        :return: Nothing.
+        """
+
+        for sym in symbols:
+            if sym['type'] == "T":
+                if sym['symbol']:
+                    Ts.add(sym['symbol'])
+                    return
+
+            else:
+                NTs.add(sym['symbol'])
+
+                if self.NT_min_length[sym['symbol']]:
+                    # The NT can't be empty.
+                    return
+
+    def set_reduction_bounds(self):
+        """
+        Find where on a target string each reduction in self.concat_NTs
+        can be made. For each position of the reduced NT in the production
+        choice of a reduction, gives
+
+            the minimum length of the symbols before and after it, and
+            the sets of characters with which the target string must end
+            just before it and start just after it, or None if all symbols
+            before or after it are nullable.
+
+        These are added to each reduction as a dictionary of (min before,
+        min after, chars before, chars after) tuples keyed by position, so
+        that reductions which can't fit around a snippet on the target
+        string are rejected before searching for their other children. For
+        example, in
+
+            <e> ::= (<e><o><e>)|<v>
+
+        an <e> snippet can only be the first <e> of (<e><o><e>) if it is
+        preceded by "(" and followed by a character with which an <o> can
+        start, and there are at least 3 more characters after it.
+
+        :return: Nothing.
+        """
+
+        for NT in self.concat_NTs:
+            for reduce in self.concat_NTs[NT]:
+                symbols, bounds = reduce[2], {}
+
+                for loc, (symbol, kind) in enumerate(symbols):
+                    if (symbol, kind) == (NT, "NT"):
+                        bounds[loc] = (
+                            self.get_min_length(symbols[:loc]),
+                            self.get_min_length(symbols[loc + 1:]),
+                            self.get_end_chars(reversed(symbols[:loc]),
+                                               self.NT_last, -1),
+                            self.get_end_chars(symbols[loc + 1:],
+                                               self.NT_first, 0))
+
+                reduce.append(bounds)
+
+    def get_min_length(self, symbols):
+        """
+        Given a list of [symbol, type] pairs, return the length of the
+        shortest string they can derive.
+
+        :param symbols: A list of [symbol, type] pairs.
+        :return: The minimum length, which is infinite if any of the NTs
+        can't derive a string.
+        """
+
+        lengths = [len(symbol) if kind == "T" else
+                   self.NT_min_length.get(symbol, float("inf")) for symbol,
+                   kind in symbols]
+
+        return sum(lengths)
+
+    def get_end_chars(self, symbols, sets, side):
+        """
+        Given a list of [symbol, type] pairs, return the set of characters
+        with which the strings they derive can start or end.
+
+        :param symbols: A list of [symbol, type] pairs, in the order in
+        which to look through them.
+        :param sets: self.NT_first for characters at the start of the
+        strings, or self.NT_last for characters at the end.
+        :param side: The index of the character in each terminal, i.e. 0
+        for the start or -1 for the end.
+        :return: A set of characters, or None if all symbols are nullable.
+        """
+
+        chars = set()
+
+        for symbol, kind in symbols:
+            if kind == "T":
+                if symbol:
+                    chars.add(symbol[side])
+                    return chars
+
+            else:
+                chars.update([T[side] for T in sets[symbol]])
+
+                if not self.NT_nullable[symbol]:
+                    return chars
+
+        return None
+
+    def can_yield(self, NT, length):
+        """
+        Check whether a NT could derive a string of a given length, from
+        the lengths of the shortest and longest strings it can derive.
+
+        :param NT: A non-terminal.
+        :param length: The length of a string.
+        :return: False if the NT can't derive any string of that length.
+        """
+
+        if NT not in self.NT_min_length:
+            # The NT can't derive any string.
+            return False
+
+        max_length = self.NT_max_length[NT]
+
+        return self.NT_min_length[NT] <= length and \
+            (max_length is None or length <= max_length)
+
+
+def get_cache_file(file_name, content):
+    """
+    Given a grammar file, return the path of its file in the grammar cache
+    set by params['GRAMMAR_CACHE'].
+
+    :param file_name: A specified BNF grammar file.
+    :param content: The contents of the grammar file.
+    :return: The path of the cache file of the grammar, or None if the
+    grammar can't be cached.
+    """
+
+    if not params['GRAMMAR_CACHE'] or "dataset_n_vars" in content:
+        # No grammar cache, or the grammar depends on the dataset in use.
+        return None
+
+    # Grammar files with the same name in different folders are cached
+    # separately.
+    location = sha1(path.abspath(file_name).encode()).hexdigest()[:8]
+
+    return path.join(params['GRAMMAR_CACHE'], path.basename(file_name) +
+                     "." + location + ".pickle")
+
+
+def get_SCCs(graph):
+    """
+    Find the strongly connected components of a directed graph with
+    Tarjan's algorithm, without recursion.
+
+    :param graph: A dictionary mapping each node to a list of the nodes to
+    which it has edges. Every node must be a key of the dictionary.
+    :return: A list of strongly connected components, each of which is a
+    list of nodes. Each component comes after all components to which it
+    has edges.
+    """
+
+    index, low, stack, on_stack, SCCs = {}, {}, [], set(), []
+
+    for root in graph:
+        if root in index:
+            continue
+
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+
+        while work:
+            node, children = work[-1]
+
+            for child in children:
+                if child not in index:
+                    # Visit the child before the rest of the children.
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph[child])))
+                    break
+
+                elif child in on_stack:
+                    low[node] = min(low[node], index[child])
+
+            else:
+                # All children have been visited.
+                work.pop()
+
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+                if low[node] == index[node]:
+                    # The node is the root of a component.
+                    SCC = []
+
+                    while not SCC or SCC[-1] != node:
+                        SCC.append(stack.pop())
+                        on_stack.discard(SCC[-1])
+
+                    SCCs.append(SCC)
+
+    return SCCs
+
+
+def get_choice_key(choice):
+    """
+    Given a production choice, return a hashable key for that choice.
+
+     in: [{'symbol': '<e>', 'type': 'NT'}, {'symbol': '+', 'type': 'T'}]
+
+     out: (('<e>', 'NT'), ('+', 'T'))
+
+    :param choice: A production choice, i.e. a list of symbols.
+    :return: A tuple of (symbol, type) pairs.
+    """
+
+    return tuple([(sym['symbol'], sym['type']) for sym in choice])
@@ -6,7 +6,7 @@ class Individual(object):
     A GE individual.
     """
 
-    def __init__(self, genome, ind_tree):
+    def __init__(self, genome, ind_tree, grammar=None):
         """
         Initialise an instance of the individual class (i.e. create a new
         individual).
@@ -14,9 +14,11 @@ class Individual(object):
         :param genome: An individual's genome.
         :param ind_tree: An individual's derivation tree, i.e. an instance
         of the representation.tree.Tree class.
+        :param grammar: The grammar of the individual. The grammar in
+        params['BNF_GRAMMAR'] if not set.
         """
 
         # The individual needs to be mapped from the given input
         # parameters.
         self.phenotype, self.genome, self.tree, self.nodes, self.invalid, \
-            self.depth, self.used_codons = mapper(genome, ind_tree)
+            self.depth, self.used_codons = mapper(genome, ind_tree, grammar)
@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from sys import getsizeof
+
+from utilities.representation.aho_corasick import AhoCorasick
+
+
+class SnippetCache(object):
+    """
+    Cache of complete sub-derivations shared between target strings. Maps
+    (grammar fingerprint, substring, NT) to a derivation of that substring
+    from that NT, so that sub-derivations found while parsing one target
+    can seed the snippets repository of later targets. Entries are evicted
+    least recently used first once the estimated memory use of the cache
+    exceeds its budget.
+
+    Derivations are stored as nested tuples of the form
+
+        (NT, codon, length of output, children)
+
+    where terminal children are strings.
+    """
+
+    def __init__(self, budget):
+        """
+        Initialise an empty cache.
+
+        :param budget: The maximum estimated memory use of the cache in
+        bytes.
+        """
+
+        self.budget = budget
+
+        # Cached derivations and their estimated sizes, in order of use.
+        self.entries = OrderedDict()
+
+        # The NTs cached for each (grammar fingerprint, substring) pair.
+        self.NTs = {}
+
+        # Total estimated memory use of all entries.
+        self.memory = 0
+
+        # Automaton for finding cached substrings of each grammar in a target
+        # string. Rebuilt when the cached substrings change.
+        self.scanners = {}
+
+        # Lookup statistics. A lookup is a target string whose snippets
+        # were seeded from the cache. A hit is a lookup which reused at least
+        # one cached derivation. A fallback is a hit which couldn't be
+        # parsed from the cached derivations.
+        self.lookups, self.hits, self.fallbacks, self.reused = 0, 0, 0, 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, fingerprint, substring, NT, derivation, size=None):
+        """
+        Add a derivation to the cache, evicting the least recently used
+        entries if the cache grows beyond its budget.
+
+        :param fingerprint: The fingerprint of the grammar.
+        :param substring: The output of the derivation.
+        :param NT: The root NT of the derivation.
+        :param derivation: A derivation in nested tuple form.
+        :param size: The estimated size of the derivation in bytes, see
+        get_derivation_size. Estimated if not set.
+        :return: Nothing.
+        """
+
+        key = (fingerprint, substring, NT)
+
+        if key in self.entries:
+            # Mark the entry as used.
+            self.entries.move_to_end(key)
+            return
+
+        if size is None:
+            size = get_derivation_size(derivation)
+
+        size += getsizeof(substring)
+
+        if size > self.budget:
+            # The derivation can never fit in the cache.
+            return
+
+        self.entries[key] = (derivation, size)
+        self.memory += size
+
+        if (fingerprint, substring) not in self.NTs:
+            # A new substring, the scanner must be rebuilt.
+            self.NTs[(fingerprint, substring)] = set()
+            self.scanners.pop(fingerprint, None)
+
+        self.NTs[(fingerprint, substring)].add(NT)
+
+        while self.memory > self.budget:
+            # Evict least recently used entries.
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entry from the cache.
+
+        :return: Nothing.
+        """
+
+        (fingerprint, substring, NT), (_, size) = self.entries.popitem(
+            last=False)
+        self.memory -= size
+
+        NTs = self.NTs[(fingerprint, substring)]
+        NTs.discard(NT)
+
+        if not NTs:
+            # No derivations of this substring are left.
+            del self.NTs[(fingerprint, substring)]
+            self.scanners.pop(fingerprint, None)
+
+    def find_all(self, fingerprint, target):
+        """
+        Find every occurrence of every cached substring of a grammar in a
+        target string.
+
+        :param fingerprint: The fingerprint of the grammar.
+        :param target: A target string.
+        :return: A list of (index, substring) tuples.
+        """
+
+        if fingerprint not in self.scanners:
+            self.scanners[fingerprint] = AhoCorasick(
+                [substring for fp, substring in self.NTs if fp == fingerprint])
+
+        return self.scanners[fingerprint].find_all(target)
+
+    def get(self, fingerprint, substring):
+        """
+        Find all cached derivations of a substring, and mark them as used.
+
+        :param fingerprint: The fingerprint of the grammar.
+        :param substring: A cached substring.
+        :return: A list of derivations in nested tuple form.
+        """
+
+        derivations = []
+
+        for NT in sorted(self.NTs.get((fingerprint, substring), ())):
+            key = (fingerprint, substring, NT)
+            self.entries.move_to_end(key)
+            derivations.append(self.entries[key][0])
+
+        return derivations
+
+    def get_stats(self):
+        """
+        Summarise the use of the cache.
+
+        :return: A dictionary of cache statistics.
+        """
+
+        return {"lookups": self.lookups, "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0,
+                "fallbacks": self.fallbacks, "reused": self.reused,
+                "entries": len(self.entries), "memory": self.memory}
+
+
+def get_derivation_size(derivation):
+    """
+    Estimate the memory used by a derivation in nested tuple form. Shared
+    sub-derivations are counted once for each derivation which uses them.
+
+    :param derivation: A derivation in nested tuple form.
+    :return: The estimated size of the derivation in bytes.
+    """
+
+    size, stack = 0, [derivation]
+
+    while stack:
+        node = stack.pop()
+        size += getsizeof(node) + getsizeof(node[3])
+
+        stack.extend([child for child in node[3] if
+                      not isinstance(child, str)])
+
+    return size
@@ -0,0 +1,256 @@
+class SnippetStore(object):
+    """
+    Repository of snippets used to compile a complete solution. Behaves as a
+    dictionary mapping snippet keys (see operators.subtree_parse.generate_key)
+    to derivation trees, but also maintains secondary indexes of snippets by
+    start and end position so that neighbouring snippets can be found
+    without scanning the whole repository.
+
+    Deleted snippets are recorded by key only, since the derivation trees
+    of deleted snippets are held by the trees of the snippets they were
+    reduced into. Snippets stored as back-pointers (see
+    representation.derivation.Derivation) only hold the keys of their
+    children though, so the derivations of deleted snippets are kept too.
+    """
+
+    def __init__(self, lazy=False):
+        """
+        Initialise an empty snippet repository.
+
+        :param lazy: Whether snippets are stored as back-pointers, as set by
+        params['LAZY_SNIPPETS'].
+        """
+
+        self.lazy = lazy
+
+        # The snippets themselves, keyed by snippet key.
+        self.snippets = {}
+
+        # Secondary indexes. Keys of snippets starting or ending at a given
+        # (index, NT id) pair on the target string.
+        self.by_start, self.by_end = {}, {}
+
+        # Keys of all snippets which have been deleted from the repository.
+        self.deleted = set()
+
+        # Derivations of deleted snippets, keyed by snippet key. Only used
+        # if snippets are stored as back-pointers.
+        self.derivations = {}
+
+        # Keys of snippets added to the repository since the last call to
+        # pop_created, in order of creation.
+        self.created = []
+
+    def __len__(self):
+        return len(self.snippets)
+
+    def __iter__(self):
+        return iter(self.snippets)
+
+    def __contains__(self, key):
+        return key in self.snippets
+
+    def __getitem__(self, key):
+        return self.snippets[key]
+
+    def __setitem__(self, key, snippet):
+        """
+        Add a snippet to the repository and to all secondary indexes.
+
+        :param key: A snippet key.
+        :param snippet: The derivation tree of the snippet.
+        :return: Nothing.
+        """
+
+        if key not in self.snippets:
+            # Only new keys need to be indexed.
+            self.add_to_indexes(key)
+
+            self.created.append(key)
+
+        self.snippets[key] = snippet
+
+    def add_to_indexes(self, key):
+        """
+        Add a snippet key to all secondary indexes.
+
+        :param key: A snippet key.
+        :return: Nothing.
+        """
+
+        start, end, NT = key
+
+        self.by_start.setdefault((start, NT), set()).add(key)
+        self.by_end.setdefault((end, NT), set()).add(key)
+
+    def remove_from_indexes(self, key):
+        """
+        Remove a snippet key from all secondary indexes. Index entries which
+        are left empty are removed, since sets never shrink once grown.
+
+        :param key: A snippet key.
+        :return: Nothing.
+        """
+
+        start, end, NT = key
+
+        for index, entry in ((self.by_start, (start, NT)),
+                             (self.by_end, (end, NT))):
+            keys = index[entry]
+            keys.discard(key)
+
+            if not keys:
+                del index[entry]
+
+    def __delitem__(self, key):
+        """
+        Remove a snippet from the repository and from all secondary indexes.
+        The removed snippet is recorded as deleted.
+
+        :param key: A snippet key.
+        :return: Nothing.
+        """
+
+        snippet = self.snippets.pop(key)
+
+        self.remove_from_indexes(key)
+
+        self.deleted.add(key)
+
+        if self.lazy:
+            self.derivations[key] = snippet
+
+    def keys(self):
+        return self.snippets.keys()
+
+    def add_deleted(self, key, snippet):
+        """
+        Add a snippet to the repository as already deleted, i.e. as a
+        snippet which has been reduced into a larger snippet.
+
+        :param key: A snippet key.
+        :param snippet: The derivation tree of the snippet.
+        :return: Nothing.
+        """
+
+        if key not in self.snippets and key not in self.deleted:
+            self.deleted.add(key)
+
+            if self.lazy:
+                self.derivations[key] = snippet
+
+    def get_snippet(self, key):
+        """
+        Find a snippet by key, whether or not it has been deleted. Deleted
+        snippets can only be found if they are stored as back-pointers.
+
+        :param key: A snippet key.
+        :return: The snippet, or None if no snippet can be found.
+        """
+
+        if key in self.snippets:
+            return self.snippets[key]
+
+        return self.derivations.get(key)
+
+    def purge(self, key):
+        """
+        Remove a snippet from the repository entirely, whether or not it has
+        been deleted, without recording it as deleted.
+
+        :param key: A snippet key.
+        :return: Nothing.
+        """
+
+        if key in self.snippets:
+            del self[key]
+
+        self.deleted.discard(key)
+        self.derivations.pop(key, None)
+
+    def restore(self, key, snippet):
+        """
+        Return a deleted snippet to the repository. The restored snippet is
+        recorded as created.
+
+        :param key: The key of a deleted snippet.
+        :param snippet: The derivation tree of the snippet.
+        :return: Nothing.
+        """
+
+        self.deleted.discard(key)
+        self.derivations.pop(key, None)
+
+        self[key] = snippet
+
+    def move(self, moved):
+        """
+        Change the keys of snippets, including deleted snippets, e.g. after
+        text has been inserted into the target string before them. Only
+        moved snippets are re-keyed and re-indexed.
+
+        :param moved: A dictionary mapping the old key of every moved
+        snippet to its new key. New keys must not be in use by snippets
+        which are not moved.
+        :return: Nothing.
+        """
+
+        # Take all moved snippets out before adding any back, as a moved
+        # key may be the old key of another moved snippet.
+        live = [(key, self.snippets.pop(key)) for key in moved if key in
+                self.snippets]
+        deleted = [key for key in moved if key in self.deleted]
+        derivations = [(key, self.derivations.pop(key)) for key in deleted
+                       if key in self.derivations]
+
+        for key, _ in live:
+            self.remove_from_indexes(key)
+
+        self.deleted.difference_update(deleted)
+
+        for key, snippet in live:
+            self.snippets[moved[key]] = snippet
+            self.add_to_indexes(moved[key])
+
+        self.deleted.update([moved[key] for key in deleted])
+
+        for key, snippet in derivations:
+            self.derivations[moved[key]] = snippet
+
+        self.created = [moved.get(key, key) for key in self.created]
+
+    def pop_created(self):
+        """
+        Return the keys of all snippets added to the repository since the
+        last call, and start recording new keys afresh.
+
+        :return: A list of snippet keys in order of creation.
+        """
+
+        created, self.created = self.created, []
+
+        return created
+
+    def starting_at(self, start, NT):
+        """
+        Find all snippets with a given root NT which start at a given index
+        on the target string.
+
+        :param start: The start index on the target string.
+        :param NT: The interned id of the root NT.
+        :return: A sorted list of matching snippet keys.
+        """
+
+        return sorted(self.by_start.get((start, NT), ()))
+
+    def ending_at(self, end, NT):
+        """
+        Find all snippets with a given root NT which end at a given index
+        on the target string.
+
+        :param end: The end index on the target string.
+        :param NT: The interned id of the root NT.
+        :return: A sorted list of matching snippet keys.
+        """
+
+        return sorted(self.by_end.get((end, NT), ()))
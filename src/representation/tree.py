@@ -1,4 +1,21 @@
+from contextlib import contextmanager
+import gc
+import threading
+
+# Guards the number of threads which are in a paused_gc context, and whether
+# the garbage collector was enabled before the first of them entered.
+gc_lock = threading.Lock()
+gc_state = {"depth": 0, "enabled": False}
+
+
 class Tree:
+    """
+    A node of a derivation tree. Uses __slots__ rather than a per-instance
+    __dict__, since the parsers create very large numbers of nodes.
+    """
+
+    __slots__ = ('parent', 'codon', 'depth', 'root', 'children', 'snippet',
+                 'id')
 
     def __init__(self, expr, parent):
         """
@@ -15,6 +32,7 @@ class Tree:
         self.root = expr
         self.children = []
         self.snippet = None
+        self.id = None
 
     def __copy__(self):
         """
@@ -25,29 +43,38 @@ class Tree:
     
         # Copy current tree by initialising a new instance of the tree class.
         tree_copy = Tree(self.root, self.parent)
-    
-        # Set node parameters.
-        tree_copy.codon, tree_copy.depth = self.codon, self.depth
-        
-        tree_copy.snippet = self.snippet
-    
-        for child in self.children:
-            # Recurse through all children.
-            new_child = child.__copy__()
-        
-            # Set the parent of the copied child as the copied parent.
-            new_child.parent = tree_copy
-        
-            # Append the copied child to the copied parent.
-            tree_copy.children.append(new_child)
-    
+
+        # Pairs of nodes whose children are still to be copied, and their
+        # copies. Trees are copied with an explicit stack rather than by
+        # recursion, so trees of any depth can be copied.
+        stack = [(self, tree_copy)]
+
+        while stack:
+            node, node_copy = stack.pop()
+
+            # Set node parameters.
+            node_copy.codon, node_copy.depth = node.codon, node.depth
+
+            node_copy.snippet = node.snippet
+
+            for child in node.children:
+                # Set the parent of the copied child as the copied parent.
+                new_child = Tree(child.root, node_copy)
+
+                # Append the copied child to the copied parent.
+                node_copy.children.append(new_child)
+
+                stack.append((child, new_child))
+
         return tree_copy
 
     def get_tree_info(self, nt_keys, genome, output, invalid=False,
                       max_depth=0, nodes=0):
         """
-        Recurses through a tree and returns all necessary information on a
-        tree required to generate an individual.
+        Walks through a tree and returns all necessary information on a
+        tree required to generate an individual. The tree is walked with an
+        explicit stack rather than by recursion, so trees of any depth can
+        be used.
         
         :param genome: The list of all codons in a subtree.
         :param output: The list of all terminal nodes in a subtree. This is
@@ -60,51 +87,84 @@ class Tree:
         :return: genome, output, invalid, max_depth, nodes.
         """
 
-        # Increment number of nodes in tree and set current node id.
-        nodes += 1
-        
-        if self.parent:
-            # If current node has a parent, increment current depth from
-            # parent depth.
-            self.depth = self.parent.depth + 1
-        
-        else:
-            # Current node is tree root, set depth to 1.
-            self.depth = 1
-        
-        if self.depth > max_depth:
-            # Set new max tree depth.
-            max_depth = self.depth
-
-        if self.codon:
-            # If the current node has a codon, append it to the genome.
-            genome.append(self.codon)
+        # Nodes still to be visited, in reverse order. Nodes are visited in
+        # the same order as a depth-first recursion would visit them.
+        stack = [self]
 
-        # Find all non-terminal children of current node.
-        NT_children = [child for child in self.children if child.root in
-                       nt_keys]
-        
-        if not NT_children:
-            # The current node has only terminal children, increment number
-            # of tree nodes.
-            nodes += 1
-
-        for child in self.children:
-            # Recurse on all children.
+        while stack:
+            node = stack.pop()
 
-            if not child.children:
-                # If the current child has no children it is a terminal.
+            if node is not self and not node.children:
+                # If the current node has no children it is a terminal.
                 # Append it to the phenotype output.
-                output.append(child.root)
-                
-                if child.root in nt_keys:
+                output.append(node.root)
+
+                if node.root in nt_keys:
                     # Current non-terminal node has no children; invalid tree.
                     invalid = True
-            
+
+                continue
+
+            # Increment number of nodes in tree.
+            nodes += 1
+
+            if node.parent:
+                # If current node has a parent, increment current depth from
+                # parent depth.
+                node.depth = node.parent.depth + 1
+
             else:
-                # The current child has children, recurse.
-                genome, output, invalid, max_depth, nodes = \
-                    child.get_tree_info(nt_keys, genome, output, invalid,
-                                        max_depth, nodes)
+                # Current node is tree root, set depth to 1.
+                node.depth = 1
+
+            if node.depth > max_depth:
+                # Set new max tree depth.
+                max_depth = node.depth
+
+            if node.codon:
+                # If the current node has a codon, append it to the genome.
+                genome.append(node.codon)
+
+            if not any([child.root in nt_keys for child in node.children]):
+                # The current node has only terminal children, increment
+                # number of tree nodes.
+                nodes += 1
+
+            # Visit all children next.
+            stack.extend(reversed(node.children))
 
         return genome, output, invalid, max_depth, nodes
+
+
+@contextmanager
+def paused_gc():
+    """
+    Context manager which pauses the cyclic garbage collector while it is
+    active. Every node of a derivation tree is part of a reference cycle
+    through its parent, so building many trees otherwise triggers repeated
+    collections which scan every node allocated so far. No collection is
+    made when the context exits, the collector is only re-enabled, so
+    unreachable nodes are freed by its next scheduled collection.
+
+    The collector is shared by all threads, so it is only re-enabled once
+    every thread which paused it has left its context.
+
+    :return: Nothing.
+    """
+
+    with gc_lock:
+        if not gc_state["depth"]:
+            gc_state["enabled"] = gc.isenabled()
+            gc.disable()
+
+        gc_state["depth"] += 1
+
+    try:
+        yield
+
+    finally:
+        with gc_lock:
+            gc_state["depth"] -= 1
+
+            if not gc_state["depth"] and gc_state["enabled"]:
+                gc.enable()
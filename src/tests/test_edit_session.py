@@ -0,0 +1,129 @@
+from random import Random
+
+import pytest
+
+from algorithm.edit_session import EditSession
+from algorithm.library import get_grammar
+from utilities.representation.check_methods import find_ind_error
+
+# Pieces of text to insert into the target strings of each grammar.
+PIECES = {"letter.bnf": list("abcXY ,.!") + ["ab", "Q "],
+          "regex.bnf": list("ab()*[]+-|c") + ["(a)", "[a-z]"],
+          "Keijzer6.bnf": ["x[0]", "+", "*", "12.34", "np.sin(", ")", "-",
+                           "sin", "exp", "np.", "1", "."]}
+
+TARGETS = {"letter.bnf": "Hello world! The quick brown fox.",
+           "regex.bnf": "a(b)*c[a-z]+",
+           "Keijzer6.bnf": "np.exp(x[0])+x[0]*12.34"}
+
+
+def check_edits(target, edits, grammar, config=None):
+    """
+    Apply a sequence of edits to a target string in an edit session, and
+    check after every edit that the incremental parse agrees with a parse
+    of the edited target string from scratch.
+
+    :param target: The initial target string.
+    :param edits: A list of (index, length, text) edits, as taken by
+    EditSession.edit.
+    :param grammar: An instance of the representation.grammar.Grammar
+    class.
+    :param config: A dictionary of options which override those in
+    algorithm.parameters.params.
+    :return: A list of (edit number, edited target string, problem) for
+    every edit after which the incremental parse is wrong.
+    """
+
+    config = dict(config or {}, SILENT=True)
+
+    session = EditSession(target, grammar, config)
+    session.parse()
+
+    problems = []
+
+    for i, (index, length, text) in enumerate(edits):
+        solution = session.edit(index, length, text)
+
+        # Parse the edited target string from scratch.
+        fresh = EditSession(session.target, grammar, config).parse()
+
+        if (solution is None) != (fresh is None):
+            problems.append((i, session.target, "Parsed differently."))
+
+        elif solution is not None:
+            error = find_ind_error(solution, session.target, grammar)
+
+            if error:
+                problems.append((i, session.target, error))
+
+    return problems
+
+
+def generate_edits(target, pieces, number, rng):
+    """
+    Generate random insertions, deletions and replacements, including cuts
+    of the start and end of the target string. Target strings are never
+    cut below two characters.
+
+    :param target: The initial target string.
+    :param pieces: A list of pieces of text to insert.
+    :param number: The number of edits.
+    :param rng: An instance of random.Random.
+    :return: A list of (index, length, text) edits.
+    """
+
+    edits = []
+
+    for _ in range(number):
+        op, text = rng.random(), rng.choice(pieces)
+        length = rng.randint(1, max(1, min(3, len(target) - 2)))
+
+        if op < 0.1 and len(target) > 3:
+            # Cut the start of the target string.
+            index, text = 0, ""
+
+        elif op < 0.2 and len(target) > 3:
+            # Cut the end of the target string.
+            index, text = len(target) - length, ""
+
+        elif op < 0.6 or len(target) < 4:
+            # Insert text.
+            index, length = rng.randint(0, len(target)), 0
+
+        else:
+            # Delete or replace text.
+            index = rng.randint(0, len(target) - length)
+            text = "" if op < 0.8 else text
+
+        edits.append((index, length, text))
+        target = target[:index] + text + target[index + length:]
+
+    return edits
+
+
+def test_edit_inside_terminal():
+    grammar = get_grammar("Keijzer6.bnf")
+
+    assert check_edits("np.exp(x[0])", [(3, 3, "sin")], grammar) == []
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("grammar_file", sorted(TARGETS))
+def test_random_edits(grammar_file, lazy):
+    grammar = get_grammar(grammar_file)
+    target = TARGETS[grammar_file]
+
+    edits = generate_edits(target, PIECES[grammar_file], 100, Random(11))
+
+    assert check_edits(target, edits, grammar,
+                       {'LAZY_SNIPPETS': lazy}) == []
+
+
+def test_long_target():
+    grammar = get_grammar("letter.bnf")
+    target = "Hello world! The quick brown fox jumps over the lazy dog. " * 35
+
+    edits = [(len(target), 0, "!"), (len(target) - 5, 1, "x"),
+             (len(target) // 2, 0, "abc"), (0, 6, "")]
+
+    assert check_edits(target, edits, grammar) == []
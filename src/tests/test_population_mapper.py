@@ -0,0 +1,45 @@
+from random import Random
+
+import numpy as np
+import pytest
+
+from algorithm.library import get_grammar
+from algorithm.mapper import map_tree_from_genome
+from algorithm.population_mapper import map_population
+
+GRAMMARS = ["Dow.bnf", "Keijzer6.bnf", "Vladislavleva4.bnf", "letter.bnf",
+            "regex.bnf"]
+
+
+@pytest.mark.parametrize("size", [5, 500])
+@pytest.mark.parametrize("grammar_file", GRAMMARS)
+def test_matches_tree_mapper(grammar_file, size):
+    grammar = get_grammar(grammar_file)
+    rng = Random(7)
+
+    genomes = [[rng.randrange(10000) for _ in range(rng.randrange(60))]
+               for _ in range(size)]
+
+    padded = np.zeros((size, 60), dtype=np.int64)
+
+    for row, genome in enumerate(genomes):
+        padded[row, :len(genome)] = genome
+
+    for phenotypes, used_codons, invalid, max_depths in [
+            map_population(genomes, grammar=grammar),
+            map_population(padded, [len(genome) for genome in genomes],
+                           grammar)]:
+        for i, genome in enumerate(genomes):
+            phenotype, _, _, _, is_invalid, max_depth, used = \
+                map_tree_from_genome(genome, grammar)
+
+            assert (phenotypes[i], used_codons[i], invalid[i],
+                    max_depths[i]) == (phenotype, used, is_invalid,
+                                       max_depth)
+
+
+def test_empty_population():
+    phenotypes, used_codons, _, _ = map_population(
+        [], grammar=get_grammar("letter.bnf"))
+
+    assert phenotypes == [] and len(used_codons) == 0
@@ -43,11 +43,176 @@ def parse_cmd_args(arguments):
     # GRAMMAR FILE
     parser.add_argument('--grammar_file', dest='GRAMMAR_FILE', type=str,
                         help='Sets the grammar to be used, requires string.')
+
+    # GRAMMAR CACHE
+    parser.add_argument('--grammar_cache', dest='GRAMMAR_CACHE', type=str,
+                        help='Folder in which compiled grammars are saved, '
+                             'requires string.')
+    parser.add_argument('--no_grammar_cache', dest='GRAMMAR_CACHE',
+                        action='store_const', const=False,
+                        help='Always compile grammars from the grammar '
+                             'file.')
     
     # TARGET
     parser.add_argument('--target', dest='TARGET', type=str,
                         help='Target string to reverse-engineer.')
 
+    # PARSER
+    parser.add_argument('--parser', dest='PARSER', type=str,
+                        choices=["LR", "subtree", "earley"],
+                        help='Sets the parser to be used for batch runs.')
+
+    # TARGETS FILE
+    parser.add_argument('--targets_file', dest='TARGETS_FILE', type=str,
+                        help='File of targets to reverse-engineer in a batch '
+                             'run. Reads from stdin if not set.')
+
+    # TARGETS FORMAT
+    parser.add_argument('--targets_format', dest='TARGETS_FORMAT', type=str,
+                        choices=["lines", "jsonl"],
+                        help='Format of the targets file: one target per '
+                             'line, or one JSON object per line.')
+
+    # RESULTS FILE
+    parser.add_argument('--results_file', dest='RESULTS_FILE', type=str,
+                        help='File to write batch results to. Writes to '
+                             'stdout if not set.')
+
+    # PROCESSES
+    parser.add_argument('--processes', dest='PROCESSES', type=int,
+                        help='Number of worker processes for batch runs, '
+                             'requires int.')
+
+    # CHUNK SIZE
+    parser.add_argument('--chunk_size', dest='CHUNK_SIZE', type=int,
+                        help='Number of targets sent to a worker process at '
+                             'a time in batch runs, requires int.')
+
+    # TIMEOUT
+    parser.add_argument('--timeout', dest='TIMEOUT', type=float,
+                        help='Maximum time in seconds allowed to parse each '
+                             'target in batch runs, requires float.')
+
+    # INCREMENTAL REDUCTION
+    parser.add_argument('--full_reduction', dest='INCREMENTAL', default=None,
+                        action='store_false',
+                        help='Re-reduces all snippets on every pass when '
+                             'combining snippets, rather than only the '
+                             'snippets created on the previous pass.')
+
+    # LAZY SNIPPETS
+    parser.add_argument('--lazy_snippets', dest='LAZY_SNIPPETS',
+                        default=None, action='store_true',
+                        help='Stores snippets as back-pointers to the '
+                             'snippets they were reduced from, and only '
+                             'builds a full derivation tree for the '
+                             'solution. Reduces memory use.')
+
+    # MIN COST
+    parser.add_argument('--min_cost', dest='MIN_COST', type=str,
+                        choices=["codons", "depth"],
+                        help='Chooses the derivation of the target string '
+                             'with the fewest codons or the smallest depth. '
+                             'Earley parser only.')
+
+    # CACHE SIZE
+    parser.add_argument('--cache_size', dest='CACHE_SIZE', type=float,
+                        help='Memory budget in MB of a cache of '
+                             'sub-derivations shared between target strings '
+                             'in batch runs. Subtree parser only.')
+
+    # CACHE MIN LENGTH
+    parser.add_argument('--cache_min_length', dest='CACHE_MIN_LENGTH',
+                        type=int,
+                        help='Minimum length of the output of cached '
+                             'sub-derivations, requires int.')
+
+    # SAMPLES
+    parser.add_argument('--samples', dest='SAMPLES', type=int,
+                        help='Number of genomes to draw uniformly at random '
+                             'from all derivations of the target string. '
+                             'Earley parser only.')
+
+    # RANDOM SEED
+    parser.add_argument('--random_seed', dest='RANDOM_SEED', type=int,
+                        help='Seed for drawing random genomes, requires '
+                             'int.')
+
+    # CODON CHOICE
+    parser.add_argument('--codon_choice', dest='CODON_CHOICE', type=str,
+                        choices=["lowest", "random"],
+                        help='Generates the codon of the first occurrence of '
+                             'duplicated production choices, or of any of '
+                             'their occurrences at random.')
+
+    # STATS
+    parser.add_argument('--stats', dest='STATS', type=str,
+                        choices=["text", "json"],
+                        help='Collects the time spent in each parsing phase '
+                             'and reduction pass, along with counters of '
+                             'snippets and reductions, and prints them in '
+                             'the given format. Included in each record of '
+                             'batch runs.')
+
+    # BENCHMARK GRAMMARS
+    parser.add_argument('--benchmark_grammars', dest='BENCHMARK_GRAMMARS',
+                        type=str, nargs='+',
+                        help='Grammar files to be used for benchmark runs. '
+                             'Uses all grammars if not set.')
+
+    # BENCHMARK PARSERS
+    parser.add_argument('--benchmark_parsers', dest='BENCHMARK_PARSERS',
+                        type=str, nargs='+',
+                        choices=["LR", "subtree", "earley"],
+                        help='Parsers to be used for benchmark runs. Uses '
+                             'all parsers if not set.')
+
+    # BENCHMARK LENGTHS
+    parser.add_argument('--benchmark_lengths', dest='BENCHMARK_LENGTHS',
+                        type=int, nargs='+',
+                        help='Lengths of generated target strings for '
+                             'benchmark runs, requires ints.')
+
+    # BENCHMARK TARGETS
+    parser.add_argument('--benchmark_targets', dest='BENCHMARK_TARGETS',
+                        type=int,
+                        help='Number of generated target strings of each '
+                             'length for benchmark runs, requires int.')
+
+    # SERVER SOCKET
+    parser.add_argument('--server_socket', dest='SERVER_SOCKET', type=str,
+                        help='Path of the Unix domain socket of the parse '
+                             'server. Listens on --server_host and '
+                             '--server_port if not set.')
+
+    # SERVER HOST
+    parser.add_argument('--server_host', dest='SERVER_HOST', type=str,
+                        help='Host of the parse server.')
+
+    # SERVER PORT
+    parser.add_argument('--server_port', dest='SERVER_PORT', type=int,
+                        help='Port of the parse server, requires int.')
+
+    # SERVER GRAMMARS
+    parser.add_argument('--server_grammars', dest='SERVER_GRAMMARS',
+                        type=str, nargs='+',
+                        help='Grammar files loaded by the parse server when '
+                             'it starts. Only --grammar_file is loaded if '
+                             'not set.')
+
+    # SERVER WORKERS
+    parser.add_argument('--server_workers', dest='SERVER_WORKERS', type=int,
+                        help='Number of worker processes of the parse server '
+                             'for long targets, requires int. All targets '
+                             'are parsed by the server process if 0.')
+
+    # SERVER INLINE LENGTH
+    parser.add_argument('--server_inline_length',
+                        dest='SERVER_INLINE_LENGTH', type=int,
+                        help='Maximum length of targets parsed by the parse '
+                             'server process itself rather than by a worker '
+                             'process, requires int.')
+
     # PRINTING
     parser.add_argument('--silent', dest='SILENT', default=None,
                         action='store_true',
@@ -0,0 +1,90 @@
+from collections import deque
+
+
+class AhoCorasick(object):
+    """
+    Aho-Corasick automaton for finding all occurrences of a fixed set of
+    strings in a text in a single pass. Used to find all occurrences of all
+    grammar terminals in a target string.
+    """
+
+    def __init__(self, patterns):
+        """
+        Compile a set of patterns into an automaton.
+
+        :param patterns: An iterable of strings to search for.
+        """
+
+        # Transitions, failure links and matched patterns for each state.
+        # State 0 is the root.
+        self.goto, self.fail, self.output = [{}], [0], [[]]
+
+        for pattern in sorted(set(patterns)):
+            # Build a trie of all patterns.
+
+            if not pattern:
+                # Empty patterns can't be located in a text.
+                continue
+
+            state = 0
+
+            for char in pattern:
+                if char not in self.goto[state]:
+                    # Add a new state to the trie.
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+
+                state = self.goto[state][char]
+
+            self.output[state].append(pattern)
+
+        # Set failure links with a breadth-first traversal of the trie.
+        queue = deque(self.goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+
+                # Follow failure links until a state with a transition on
+                # this character is found.
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+
+                # A state matches every pattern its failure state matches.
+                self.output[next_state] = self.output[next_state] + \
+                    self.output[self.fail[next_state]]
+
+    def find_all(self, text):
+        """
+        Find every occurrence of every pattern in a text, including
+        overlapping occurrences.
+
+        :param text: A string to be searched.
+        :return: A list of (index, pattern) tuples, where index is the start
+        index of the occurrence of the pattern in the text.
+        """
+
+        goto, fail, output = self.goto, self.fail, self.output
+
+        state, matches = 0, []
+
+        for idx, char in enumerate(text):
+
+            while state and char not in goto[state]:
+                # No transition on this character, follow failure links.
+                state = fail[state]
+
+            state = goto[state].get(char, 0)
+
+            for pattern in output[state]:
+                # Record all patterns which end at this index.
+                matches.append((idx + 1 - len(pattern), pattern))
+
+        return matches
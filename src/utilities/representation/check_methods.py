@@ -1,25 +1,29 @@
+from algorithm.mapper import map_phenotype_from_genome
 from algorithm.parameters import params
-from representation import individual
+from representation.grammar import get_choice_key
 
 
-def check_ind(ind, target):
+def check_ind(ind, target, grammar=None):
     """
     Checks the mapping of an individual to ensure everything is correct.
     
     :param ind: An instance of the representation.individaul.Individual class.
     :param target: A target string against which to match the phenotype of
     the individual.
+    :param grammar: The grammar of the individual. The grammar in
+    params['BNF_GRAMMAR'] if not set.
     :return: Nothing.
     """
         
-    # Re-map individual using genome mapper to check everything is ok.
-    new_ind = individual.Individual(ind.genome, None)
+    # Re-map the genome to check everything is ok. Only the phenotype is
+    # needed, so no tree is built.
+    phenotype, _ = map_phenotype_from_genome(ind.genome, grammar)
 
     # Check phenotypes are the same.
-    if new_ind.phenotype != ind.phenotype:
+    if phenotype != ind.phenotype:
         print("\nError: Solution doesn't match genome mapping.\n")
         print("Solution:\t", ind.phenotype)
-        print("Mapped:  \t", new_ind.phenotype)
+        print("Mapped:  \t", phenotype)
         print("Genome:  \t", ind.genome)
         quit()
     
@@ -35,6 +39,33 @@ def check_ind(ind, target):
         check_output(ind)
 
 
+def find_ind_error(ind, target, grammar=None):
+    """
+    Checks the mapping of an individual in the same way as check_ind, but
+    returns a description of the first problem found rather than exiting.
+
+    :param ind: An instance of the representation.individaul.Individual class.
+    :param target: A target string against which to match the phenotype of
+    the individual.
+    :param grammar: The grammar of the individual. The grammar in
+    params['BNF_GRAMMAR'] if not set.
+    :return: A description of the problem, or None if the individual is
+    correct.
+    """
+
+    # Re-map the genome to check everything is ok.
+    phenotype, _ = map_phenotype_from_genome(ind.genome, grammar)
+
+    if phenotype != ind.phenotype:
+        return "Solution doesn't match genome mapping."
+
+    elif ind.phenotype != target:
+        return "Solution doesn't match target."
+
+    elif ind.phenotype != get_output(ind.tree):
+        return "Phenotype doesn't match tree output."
+
+
 def check_output(ind):
     """
     Check the phenotype of an individual to ensure it matches the output of
@@ -49,15 +80,21 @@ def check_output(ind):
         print("Phenotype:\n\t", ind.phenotype, "\nTree output:\n\t", get_output(ind.tree))
 
 
-def check_genome_from_tree(ind_tree, space=""):
+def check_genome_from_tree(ind_tree, space="", grammar=None):
     """
     Goes through a tree and checks each codon to ensure production choice is
     correct.
     
     :param ind_tree: The representation.tree.Tree class derivation tree of
     an individual.
+    :param grammar: The grammar of the individual. The grammar in
+    params['BNF_GRAMMAR'] if not set.
     :return: Nothing.
     """
+
+    if grammar is None:
+        # Use the grammar loaded for the run.
+        grammar = params['BNF_GRAMMAR']
     
     if ind_tree.children:
         # print(space, ind_tree.root)
@@ -72,7 +109,7 @@ def check_genome_from_tree(ind_tree, space=""):
             quit()
         
         # Check production choices for node root.
-        productions = params['BNF_GRAMMAR'].rules[ind_tree.root]
+        productions = grammar.rules[ind_tree.root]
         
         # Select choice based on node codon.
         selection = ind_tree.codon % productions['no_choices']
@@ -99,13 +136,13 @@ def check_genome_from_tree(ind_tree, space=""):
     
     for kid in ind_tree.children:
         # Recurse over all children.
-        check_genome_from_tree(kid, space)
+        check_genome_from_tree(kid, space, grammar)
 
 
 def get_output(ind_tree):
     """
-    Calls the recursive build_output(self) which returns a list of all
-    node roots. Joins this list to create the full phenotype of an
+    Calls build_output(self) which returns a list of all terminal node
+    roots. Joins this list to create the full phenotype of an
     individual. This two-step process speeds things up as it only joins
     the phenotype together once rather than at every node.
 
@@ -118,23 +155,30 @@ def get_output(ind_tree):
 
 def build_output(tree):
     """
-    Recursively adds all node roots to a list which can be joined to
-    create the phenotype.
+    Adds all terminal node roots to a list which can be joined to create
+    the phenotype. The tree is walked with an explicit stack rather than by
+    recursion, so trees of any depth can be output.
 
-    :return: The list of all node roots.
+    :param tree: A derivation tree.
+    :return: The list of all terminal node roots, in order.
     """
     
     output = []
-    for child in tree.children:
-        if not child.children:
-            # If the current child has no children it is a terminal.
+
+    # Nodes still to be visited, in reverse order.
+    stack = list(reversed(tree.children))
+
+    while stack:
+        node = stack.pop()
+
+        if not node.children:
+            # If the current node has no children it is a terminal.
             # Append it to the output.
-            output.append(child.root)
+            output.append(node.root)
         
         else:
-            # Otherwise it is a non-terminal. Recurse on all
-            # non-terminals.
-            output += build_output(child)
+            # Otherwise it is a non-terminal. Visit its children next.
+            stack.extend(reversed(node.children))
     
     return output
 
@@ -154,7 +198,7 @@ def ret_true(obj):
         return False
 
 
-def generate_codon(NT, choice):
+def generate_codon(NT, choice, grammar=None, rng=None):
     """
     Given a list of choices and a choice from that list, generate and return a
     codon which will result in that production choice being made.
@@ -162,19 +206,20 @@ def generate_codon(NT, choice):
     :param NT: A root non-terminal node from which production choices are made.
     :param choice: A production choice from the available choices of the
     given NT.
+    :param grammar: The grammar containing the NT. The grammar in
+    params['BNF_GRAMMAR'] if not set.
+    :param rng: A random.Random instance for picking one of the choice
+    indices at which a duplicated production choice appears. The lowest
+    choice index is used if not set.
     :return: A codon that will give that production choice.
     """
 
-    productions = params['BNF_GRAMMAR'].rules[NT]
+    if grammar is None:
+        # Use the grammar loaded for the run.
+        grammar = params['BNF_GRAMMAR']
 
-    # Find the production choices from the given NT.
-    choices = [choice['choice'] for choice in productions['choices']]
+    # Look up a codon matching the index of the chosen production.
+    codon = grammar.get_codon(NT, get_choice_key(choice), rng)
 
-    # Find the index of the chosen production and set a matching codon based
-    # on that index.
-    prod_index = choices.index(choice)
-    
-    codon = productions['no_choices'] + prod_index
-        
     # Generate a valid codon.
     return codon
@@ -0,0 +1,193 @@
+import json
+from time import perf_counter
+
+from algorithm.parameters import params
+
+
+class ParseStats(object):
+    """
+    Wall time spent in each phase of parsing a target string, the wall time
+    and snippet counts of each reduction pass, and counters of events such
+    as reductions attempted. Only collected if STATS is set in the config
+    of a parse session (see algorithm.session.ParseSession).
+    """
+
+    def __init__(self):
+        """
+        Initialise empty statistics.
+        """
+
+        # Total wall time in seconds spent in each phase, in order of first
+        # use.
+        self.phases = {}
+
+        # Wall time, time spent in each phase and snippet counts of each
+        # reduction pass.
+        self.passes = []
+
+        # Number of times each event has occurred.
+        self.counters = {}
+
+        # Start time and phase times at the start of the current pass.
+        self.pass_start = None
+
+    def add_time(self, phase, seconds):
+        """
+        Add time spent in a phase.
+
+        :param phase: The name of the phase.
+        :param seconds: The time spent in seconds.
+        :return: Nothing.
+        """
+
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def count(self, counter, number=1):
+        """
+        Increment a counter.
+
+        :param counter: The name of the counter.
+        :param number: The number by which to increment the counter.
+        :return: Nothing.
+        """
+
+        self.counters[counter] = self.counters.get(counter, 0) + number
+
+    def start_pass(self):
+        """
+        Mark the start of a reduction pass.
+
+        :return: Nothing.
+        """
+
+        self.pass_start = (perf_counter(), dict(self.phases))
+
+    def end_pass(self, **counts):
+        """
+        Mark the end of a reduction pass, recording its wall time, the time
+        spent in each phase during the pass and the given snippet counts.
+
+        :param counts: Snippet counts at the end of the pass.
+        :return: Nothing.
+        """
+
+        start, phases = self.pass_start
+
+        record = {"time": perf_counter() - start,
+                  "phases": {phase: seconds - phases.get(phase, 0) for
+                             phase, seconds in self.phases.items() if
+                             seconds != phases.get(phase, 0)}}
+        record.update(counts)
+
+        self.passes.append(record)
+
+    def as_dict(self):
+        """
+        Give the statistics as a dictionary which can be written as JSON.
+
+        :return: A dictionary of the time spent in each phase, each pass and
+        all counters.
+        """
+
+        return {"phases": dict(self.phases), "passes": list(self.passes),
+                "counters": dict(self.counters)}
+
+
+class PhaseTimer(object):
+    """
+    Context manager which adds the time spent in its block to a phase of the
+    current statistics.
+    """
+
+    __slots__ = ("stats", "phase", "start")
+
+    def __init__(self, stats, phase):
+        self.stats, self.phase, self.start = stats, phase, None
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.add_time(self.phase, perf_counter() - self.start)
+
+
+class NoTimer(object):
+    """
+    Context manager which does nothing, used when statistics are disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NO_TIMER = NoTimer()
+
+
+def timed(stats, phase):
+    """
+    Time a block of code as part of a phase, e.g.
+
+        with timed(session.stats, "reduce"):
+            reduce_trees(session)
+
+    Costs a single check when statistics are disabled.
+
+    :param stats: A ParseStats instance, or None if statistics are disabled.
+    :param phase: The name of the phase.
+    :return: A context manager.
+    """
+
+    if stats is None:
+        return NO_TIMER
+
+    return PhaseTimer(stats, phase)
+
+
+def format_stats(stats):
+    """
+    Format statistics as human-readable text.
+
+    :param stats: A ParseStats instance.
+    :return: The statistics as a string.
+    """
+
+    lines = ["Phases:"]
+    lines.extend(["  %-12s %10.6fs" % (phase, seconds) for phase, seconds in
+                  stats.phases.items()])
+
+    if stats.passes:
+        lines.append("Passes:")
+
+        for no_pass, record in enumerate(stats.passes, 1):
+            lines.append("  %-4d %10.6fs  " % (no_pass, record["time"]) +
+                         "  ".join([key + ": " + str(value) for key, value in
+                                    record.items() if key not in
+                                    ("time", "phases")]))
+
+    if stats.counters:
+        lines.append("Counters:")
+        lines.extend(["  %-22s %d" % (counter, number) for counter, number
+                      in sorted(stats.counters.items())])
+
+    return "\n".join(lines)
+
+
+def print_stats(stats):
+    """
+    Print statistics in the format given by params['STATS'].
+
+    :param stats: A ParseStats instance.
+    :return: Nothing.
+    """
+
+    if params['STATS'] == "json":
+        print(json.dumps(stats.as_dict()))
+
+    else:
+        print("\nStats:")
+        print(format_stats(stats))